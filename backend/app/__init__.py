@@ -62,10 +62,28 @@ def create_app(config_name='default'):
     # 配置日志
     setup_logging(app)
     
-    # 初始化定时任务调度器
-    from app.utils.scheduler import init_scheduler
-    init_scheduler()
-    
+    # 初始化 adb 客户端、设备任务执行器和后台任务管理器
+    from app.utils.adb_client import init_adb_client
+    from app.utils.shell_session import init_shell_sessions
+    from app.utils.device_executor import init_device_executor
+    from app.utils.output_stream import init_output_streams
+    from app.utils.device_lease import init_device_leases
+    from app.utils.apk_cache import init_apk_cache
+    from app.utils.python_worker import init_python_workers
+    from app.utils.task_manager import init_task_manager
+    from app.utils.ai_client import init_ai_client
+    from app.utils.ai_cache import init_ai_cache
+    init_adb_client(app)
+    init_shell_sessions(app)
+    init_device_executor(app)
+    init_output_streams(app)
+    init_device_leases(app)
+    init_apk_cache(app)
+    init_python_workers(app)
+    init_task_manager(app)
+    init_ai_client(app)
+    init_ai_cache(app)
+
     # 注册蓝图
     register_blueprints(app)
     
@@ -75,6 +93,18 @@ def create_app(config_name='default'):
     # 创建数据库表
     with app.app_context():
         db.create_all()
+
+    # 启动设备状态监听（需在建表之后，写回状态时依赖 devices 表）
+    from app.utils.device_registry import init_device_registry
+    init_device_registry(app)
+
+    # 初始化定时任务调度器（任务保存在数据库中，需在建表之后）
+    from app.utils.scheduler import init_scheduler
+    init_scheduler(app)
+
+    # 成为调度器主进程后恢复待执行的定时设备脚本任务
+    from app.utils.device_dispatcher import init_device_dispatcher
+    init_device_dispatcher(app)
     
     return app
 
@@ -47,9 +47,84 @@ class Config:
     # 文件存储配置
     STORAGE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '../../storage')
     SCRIPT_STORAGE_PATH = os.path.join(STORAGE_PATH, 'device_scripts')
+    DEVICE_LOG_PATH = os.path.join(STORAGE_PATH, 'device_logs')  # 流式执行的完整输出日志
+    APK_CACHE_PATH = os.path.join(STORAGE_PATH, 'apk_cache')  # 按内容 MD5 缓存的安装包
+    APK_CACHE_MAX_FILES = int(os.environ.get('APK_CACHE_MAX_FILES') or 20)  # 本地最多缓存的安装包数量
     MAX_SCRIPT_SIZE = 10 * 1024 * 1024  # 10MB
     ALLOWED_SCRIPT_EXTENSIONS = ['.sh', '.py']
-    
+
+    # 设备任务执行配置
+    DEVICE_TASK_MAX_WORKERS = int(os.environ.get('DEVICE_TASK_MAX_WORKERS') or 8)  # 本机同时操作的最大设备数
+    DEVICE_TASK_TIMEOUT = int(os.environ.get('DEVICE_TASK_TIMEOUT') or 600)  # 单设备任务超时时间（秒）
+    DEVICE_BATCH_DEADLINE = int(os.environ.get('DEVICE_BATCH_DEADLINE') or 0)  # 整批任务最长等待时间（秒），0 表示不限制
+    DEVICE_SCHEDULE_ENABLED = (os.environ.get('DEVICE_SCHEDULE_ENABLED') or 'true').lower() == 'true'  # 设备脚本任务到达计划时间后自动执行
+    DEVICE_SCHEDULE_MISFIRE_GRACE = int(os.environ.get('DEVICE_SCHEDULE_MISFIRE_GRACE') or 3600)  # 启动时错过计划时间不超过该值（秒）的任务立即补执行
+
+    # 后台异步任务配置（AI 生成用例等）
+    TASK_MANAGER_MAX_WORKERS = int(os.environ.get('TASK_MANAGER_MAX_WORKERS') or 8)  # 执行后台任务的工作线程数
+    TASK_QUEUE_MAX_SIZE = int(os.environ.get('TASK_QUEUE_MAX_SIZE') or 100)  # 最多排队等待的任务数，超出时拒绝新任务，0 表示不限制
+    TASK_TYPE_LIMITS = os.environ.get('TASK_TYPE_LIMITS') or 'ai_generate:3'  # 各类型任务的最大并发数，格式：类型:数量,类型:数量
+    TASK_STATE_BACKEND = os.environ.get('TASK_STATE_BACKEND') or 'sql'  # 任务状态存储：sql（多进程共享、重启后可查询）或 memory
+    TASK_STATE_FLUSH_INTERVAL = float(os.environ.get('TASK_STATE_FLUSH_INTERVAL') or 1)  # 进度更新合并写入数据库的间隔（秒）
+    TASK_STATE_STALE_TIMEOUT = int(os.environ.get('TASK_STATE_STALE_TIMEOUT') or 300)  # 未结束的任务超过该时间（秒）未刷新视为执行进程已停止
+    TASK_RESULT_TTL_HOURS = float(os.environ.get('TASK_RESULT_TTL_HOURS') or 24)  # 已结束任务的保留时间（小时）
+    TASK_RESULT_TRIM_AFTER = int(os.environ.get('TASK_RESULT_TRIM_AFTER') or 600)  # 任务结束多久后（秒）精简结果，只保留明细条数
+    TASK_MAX_ENTRIES = int(os.environ.get('TASK_MAX_ENTRIES') or 500)  # 每个进程最多保存的任务数，超出时淘汰最久未访问的已结束任务
+    TASK_SWEEP_INTERVAL = int(os.environ.get('TASK_SWEEP_INTERVAL') or 600)  # 定期清理已结束任务的间隔（秒）
+    TASK_PROGRESS_INTERVAL = float(os.environ.get('TASK_PROGRESS_INTERVAL') or 0.5)  # 同一任务进度更新的最小发布间隔（秒），间隔内的更新合并后发布
+    TASK_EVENT_COALESCE_WINDOW = float(os.environ.get('TASK_EVENT_COALESCE_WINDOW') or 0.5)  # 任务进度推送的合并窗口（秒），窗口内的多次更新只推送最后一次
+
+    # AI 接口调用配置（接口地址、密钥和模型见 .env 中的 AI_* 变量）
+    AI_HTTP_POOL_SIZE = int(os.environ.get('AI_HTTP_POOL_SIZE') or 10)  # 与 AI 接口保持的最大长连接数
+    AI_MAX_CONCURRENT_REQUESTS = int(os.environ.get('AI_MAX_CONCURRENT_REQUESTS') or 4)  # 同时调用 AI 接口的最大请求数，超出时排队
+    AI_MAX_RETRIES = int(os.environ.get('AI_MAX_RETRIES') or 3)  # 429、5xx、连接失败或超时时的最大重试次数
+    AI_RETRY_BACKOFF = float(os.environ.get('AI_RETRY_BACKOFF') or 1.0)  # 重试退避的基准时间（秒），第 n 次重试最多等待 基准×2^n 秒
+    AI_REQUEST_TIMEOUT = int(os.environ.get('AI_REQUEST_TIMEOUT') or 120)  # 单次请求超时时间（秒）
+    AI_STREAM_ENABLED = (os.environ.get('AI_STREAM_ENABLED') or 'true').lower() == 'true'  # 流式调用 AI 接口，每条用例生成后立即保存，输出被截断时保留已生成的用例
+    AI_CHUNK_MAX_TOKENS = int(os.environ.get('AI_CHUNK_MAX_TOKENS') or 3000)  # 需求文档超过该长度（估算 token 数）时按标题/段落拆分，各段分别生成用例
+    AI_CHUNK_CONCURRENCY = int(os.environ.get('AI_CHUNK_CONCURRENCY') or 4)  # 同时生成用例的分段数（所有任务共用）
+    AI_CACHE_BACKEND = os.environ.get('AI_CACHE_BACKEND') or 'disk'  # 生成结果缓存：disk（本地文件）、sql（数据库，多进程共享）或 none（不缓存）
+    AI_CACHE_PATH = os.path.join(STORAGE_PATH, 'ai_cache')  # disk 缓存的保存目录
+    AI_CACHE_TTL_HOURS = float(os.environ.get('AI_CACHE_TTL_HOURS') or 72)  # 生成结果缓存的保留时间（小时）
+    AI_CACHE_MAX_ENTRIES = int(os.environ.get('AI_CACHE_MAX_ENTRIES') or 500)  # 最多缓存的生成结果数，超出时淘汰最久未使用的
+    AI_DEDUP_MODE = os.environ.get('AI_DEDUP_MODE') or 'flag'  # 与用例集已有用例近似重复的生成用例：flag（保存并在任务结果中标记）、drop（不保存）或 off（不检查）
+    AI_DEDUP_THRESHOLD = float(os.environ.get('AI_DEDUP_THRESHOLD') or 0.7)  # 判定为近似重复的相似度（用例名称、步骤、预期结果的 3 字片段 Jaccard 相似度估计值）
+
+    # 定时任务调度器配置
+    SCHEDULER_JOBSTORE = os.environ.get('SCHEDULER_JOBSTORE') or 'sqlalchemy'  # 任务存储：sqlalchemy（数据库，重启不丢失）或 memory
+    SCHEDULER_MISFIRE_GRACE_TIME = int(os.environ.get('SCHEDULER_MISFIRE_GRACE_TIME') or 3600)  # 错过执行时间不超过该值（秒）的任务仍补执行
+    SCHEDULER_LEADER_CHECK_INTERVAL = int(os.environ.get('SCHEDULER_LEADER_CHECK_INTERVAL') or 15)  # 多进程部署时检查主进程锁、接管调度的间隔（秒）
+
+    # 设备租约配置（同一设备同一时间只执行一个任务）
+    DEVICE_LEASE_ENABLED = (os.environ.get('DEVICE_LEASE_ENABLED') or 'true').lower() == 'true'  # 执行前租用设备，避免多个任务同时操作同一设备
+    DEVICE_LEASE_TTL = int(os.environ.get('DEVICE_LEASE_TTL') or 120)  # 租约有效期（秒），持有期间通过心跳续期
+    DEVICE_LEASE_HEARTBEAT_INTERVAL = int(os.environ.get('DEVICE_LEASE_HEARTBEAT_INTERVAL') or 30)  # 租约心跳间隔（秒）
+    DEVICE_LEASE_WAIT_TIMEOUT = int(os.environ.get('DEVICE_LEASE_WAIT_TIMEOUT') or 1800)  # 等待设备空闲的最长时间（秒），0 表示不限制
+    DEVICE_LEASE_SYNC_WAIT_TIMEOUT = int(os.environ.get('DEVICE_LEASE_SYNC_WAIT_TIMEOUT') or 30)  # 单设备同步执行时等待设备空闲的最长时间（秒），超时返回设备忙碌
+
+    # Python 脚本工作进程配置
+    PYTHON_WORKER_ENABLED = (os.environ.get('PYTHON_WORKER_ENABLED') or 'true').lower() == 'true'  # Python 任务使用预热的工作进程执行
+    PYTHON_WORKER_POOL_SIZE = int(os.environ.get('PYTHON_WORKER_POOL_SIZE') or 4)  # 预热的空闲工作进程数量
+    PYTHON_WORKER_PRELOAD = os.environ.get('PYTHON_WORKER_PRELOAD') or 'subprocess,json,re,time'  # 工作进程预先导入的模块，逗号分隔
+    PYTHON_WORKER_MEMORY_LIMIT_MB = int(os.environ.get('PYTHON_WORKER_MEMORY_LIMIT_MB') or 0)  # 单次执行的内存上限（MB），0 表示不限制，仅 POSIX 生效
+
+    # 设备任务实时输出配置
+    DEVICE_STREAM_BUFFER_SIZE = int(os.environ.get('DEVICE_STREAM_BUFFER_SIZE') or 256 * 1024)  # 流式输出在内存中保留的字节数
+    DEVICE_STREAM_RETENTION = int(os.environ.get('DEVICE_STREAM_RETENTION') or 3600)  # 已结束的输出流在内存中保留的时间（秒）
+    DEVICE_LOG_RETENTION_DAYS = float(os.environ.get('DEVICE_LOG_RETENTION_DAYS') or 7)  # 输出流日志文件的保留天数，0 表示不删除
+
+    # adb server 配置（通过协议直接通信，不再每条命令启动 adb 进程）
+    ADB_SERVER_HOST = os.environ.get('ADB_SERVER_HOST') or '127.0.0.1'
+    ADB_SERVER_PORT = int(os.environ.get('ADB_SERVER_PORT') or 5037)
+    ADB_USE_NATIVE_CLIENT = (os.environ.get('ADB_USE_NATIVE_CLIENT') or 'true').lower() == 'true'
+    SHELL_SESSION_ENABLED = (os.environ.get('SHELL_SESSION_ENABLED') or 'true').lower() == 'true'  # 每台设备复用一个长连接 shell
+    SHELL_SESSION_IDLE_TIMEOUT = int(os.environ.get('SHELL_SESSION_IDLE_TIMEOUT') or 300)  # 空闲会话回收时间（秒）
+
+    # 设备状态注册表配置（后台监听设备状态，状态接口读取缓存）
+    DEVICE_REGISTRY_ENABLED = (os.environ.get('DEVICE_REGISTRY_ENABLED') or 'true').lower() == 'true'
+    DEVICE_POLL_INTERVAL = int(os.environ.get('DEVICE_POLL_INTERVAL') or 3)  # 未启用协议客户端时的轮询间隔（秒）
+    DEVICE_STATUS_FLUSH_INTERVAL = int(os.environ.get('DEVICE_STATUS_FLUSH_INTERVAL') or 5)  # 设备状态写回数据库的间隔（秒）
+
     @staticmethod
     def init_app(app):
         """初始化应用配置"""
@@ -75,6 +150,9 @@ class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     WTF_CSRF_ENABLED = False
+    DEVICE_REGISTRY_ENABLED = False
+    SCHEDULER_JOBSTORE = 'memory'
+    TASK_STATE_BACKEND = 'memory'
 
 
 # 配置字典
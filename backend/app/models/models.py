@@ -1,9 +1,11 @@
+import re
 from datetime import datetime, timezone, timedelta
 
 # 设置本地时区为UTC+8
 LOCAL_TIMEZONE = timezone(timedelta(hours=8))
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
+from sqlalchemy.orm import validates
 from werkzeug.security import generate_password_hash, check_password_hash
 
 db = SQLAlchemy()
@@ -26,6 +28,41 @@ VERSION_REQUIREMENT_STATUS = ('new', 'in_progress', 'completed', 'cancelled')
 REVIEW_TASK_STATUS = ('pending', 'in_review', 'completed', 'rejected')  # 评审任务状态：待处理、评审中、已完成、已拒绝
 CASE_REVIEW_STATUS = ('pending', 'approved', 'rejected')  # 用例评审状态：待审核、已通过、已拒绝
 
+# 用例编号的尾号：不足 1000 时补零为 3 位（xxx-xxx-xxx001），1000 起不补零（xxx-xxx-xxx1000）
+CASE_SEQ_SUFFIX_PATTERN = re.compile(r'^(?:\d{3}|[1-9]\d{3,})$')
+# 未知编号前缀时，取最后一个非数字字符之后的全部数字作为尾号
+CASE_SEQ_PATTERN = re.compile(r'(?:^|\D)(\d{3}|[1-9]\d{3,})$')
+
+
+def case_number_seq(case_number, prefix=None):
+    """
+    取用例编号的尾号，编号不符合格式时返回 None
+
+    Args:
+        case_number: 用例编号
+        prefix: 已知的编号前缀（如用例集已有用例的前缀）；编号以它开头时取前缀之后的部分，
+            前缀以数字结尾（如需求缩写 REQ2）时只有这样才能与尾号区分
+
+    Returns:
+        尾号，无法解析时返回 None
+    """
+    case_number = case_number or ''
+    if prefix and case_number.startswith(prefix):
+        suffix = case_number[len(prefix):]
+        return int(suffix) if CASE_SEQ_SUFFIX_PATTERN.match(suffix) else None
+    match = CASE_SEQ_PATTERN.search(case_number)
+    return int(match.group(1)) if match else None
+
+
+def case_number_prefix(case_number, case_seq):
+    """由用例编号和尾号得到编号前缀，编号不以该尾号结尾时返回 None"""
+    if not case_number or case_seq is None:
+        return None
+    suffix = f'{case_seq:03d}'
+    if len(case_number) > len(suffix) and case_number.endswith(suffix):
+        return case_number[:-len(suffix)]
+    return None
+
 
 class User(UserMixin, db.Model):
     """用户模型"""
@@ -146,56 +183,19 @@ class Project(db.Model):
     test_suites = db.relationship('TestSuite', backref='project', cascade='all, delete-orphan')
     test_cases = db.relationship('TestCase', backref='project', cascade='all, delete-orphan')
     
-    def to_dict(self):
-        """转换为字典"""
+    def to_dict(self, stats=None):
+        """
+        转换为字典
+
+        Args:
+            stats: app.utils.project_stats.get_project_stats 批量计算的本项目统计；列表接口应为整页项目一次算好后传入，
+                未传入时单独查询本项目的统计
+        """
         import json
+        from app.utils.project_stats import get_project_stats, build_stats_fields
         
-        # 计算用例统计
-        total_cases = len(self.test_cases)
-        executed_cases = sum(1 for case in self.test_cases if hasattr(case, 'executions') and case.executions)
-        passed_cases = sum(1 for case in self.test_cases if hasattr(case, 'executions') and any(exec.status == 'pass' for exec in case.executions))
-        
-        # 计算通过率和执行进度
-        pass_rate = (passed_cases / executed_cases * 100) if executed_cases > 0 else 0
-        execution_progress = (executed_cases / total_cases * 100) if total_cases > 0 else 0
-        
-        # 计算用例按状态划分
-        case_stats = {
-            'total': total_cases,
-            'pass': sum(1 for case in self.test_cases if case.status == 'pass'),
-            'fail': sum(1 for case in self.test_cases if case.status == 'fail'),
-            'blocked': sum(1 for case in self.test_cases if case.status == 'blocked'),
-            'not_applicable': sum(1 for case in self.test_cases if case.status == 'not_applicable'),
-            'pass_rate': round(pass_rate, 2),
-            'execution_progress': round(execution_progress, 2)
-        }
-        
-        # 计算迭代统计
-        total_iterations = len(self.iterations)
-        iteration_stats = {
-            'total': total_iterations,
-            'planning': sum(1 for iter in self.iterations if iter.status == 'planning'),
-            'active': sum(1 for iter in self.iterations if iter.status == 'active'),
-            'completed': sum(1 for iter in self.iterations if iter.status == 'completed'),
-            'cancelled': sum(1 for iter in self.iterations if iter.status == 'cancelled')
-        }
-        
-        # 计算版本需求统计
-        total_requirements = len(self.version_requirements)
-        requirement_stats = {
-            'total': total_requirements,
-            'new': sum(1 for req in self.version_requirements if req.status == 'new'),
-            'in_progress': sum(1 for req in self.version_requirements if req.status == 'in_progress'),
-            'completed': sum(1 for req in self.version_requirements if req.status == 'completed'),
-            'cancelled': sum(1 for req in self.version_requirements if req.status == 'cancelled')
-        }
-        
-        # 处理项目成员，将user_id为NULL的成员显示为"未知用户"
-        members = [{
-            'user_id': member.user_id,
-            'user_name': member.user.real_name if member.user else "未知用户",
-            'role': member.role
-        } for member in self.project_members]
+        if stats is None:
+            stats = get_project_stats([self.id])[self.id]
         
         return {
             'id': self.id,
@@ -215,14 +215,7 @@ class Project(db.Model):
             'is_deleted': self.is_deleted,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
-            'member_count': len(self.project_members),
-            'iteration_count': len(self.iterations),
-            'requirement_count': total_requirements,
-            'case_stats': case_stats,
-            'iteration_stats': iteration_stats,
-            'requirement_stats': requirement_stats,
-            'iterations': [iteration.iteration_name for iteration in self.iterations],
-            'members': members
+            **build_stats_fields(stats)
         }
 
 
@@ -413,6 +406,7 @@ class Device(db.Model):
     updated_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(LOCAL_TIMEZONE), onupdate=lambda: datetime.now(LOCAL_TIMEZONE), comment='更新时间')
     
     # 关系
+    hardware_spec = db.relationship('DeviceHardwareSpec', backref='device', uselist=False, cascade='all, delete-orphan')
     
     def to_dict(self):
         """转换为字典"""
@@ -431,6 +425,74 @@ class Device(db.Model):
         }
 
 
+class DeviceHardwareSpec(db.Model):
+    """设备硬件规格模型，由设备信息采集自动写入"""
+    __tablename__ = 'device_hardware_specs'
+
+    id = db.Column(db.Integer, primary_key=True, comment='记录ID')
+    device_id = db.Column(db.Integer, db.ForeignKey('devices.id', ondelete='CASCADE'), unique=True, nullable=False, comment='设备ID')
+    manufacturer = db.Column(db.String(100), comment='设备制造商')
+    sdk_version = db.Column(db.String(20), comment='SDK版本')
+    cpu_abi = db.Column(db.String(50), comment='CPU架构')
+    screen_resolution = db.Column(db.String(50), comment='屏幕分辨率')
+    screen_density = db.Column(db.String(20), comment='屏幕密度')
+    serial_no = db.Column(db.String(100), comment='设备序列号（ro.serialno）')
+    total_memory_kb = db.Column(db.BigInteger, comment='总内存（KB）')
+    available_memory_kb = db.Column(db.BigInteger, comment='可用内存（KB）')
+    storage_total = db.Column(db.String(20), comment='/data 分区总容量')
+    storage_available = db.Column(db.String(20), comment='/data 分区可用容量')
+    battery_level = db.Column(db.Integer, comment='电池电量')
+    collected_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(LOCAL_TIMEZONE), comment='采集时间')
+
+    def to_dict(self):
+        """转换为字典"""
+        return {
+            'id': self.id,
+            'device_id': self.device_id,
+            'manufacturer': self.manufacturer,
+            'sdk_version': self.sdk_version,
+            'cpu_abi': self.cpu_abi,
+            'screen_resolution': self.screen_resolution,
+            'screen_density': self.screen_density,
+            'serial_no': self.serial_no,
+            'total_memory_kb': self.total_memory_kb,
+            'available_memory_kb': self.available_memory_kb,
+            'storage_total': self.storage_total,
+            'storage_available': self.storage_available,
+            'battery_level': self.battery_level,
+            'collected_at': self.collected_at.isoformat() if self.collected_at else None
+        }
+
+
+class DeviceLease(db.Model):
+    """设备租约模型，每台设备同一时间最多一条租约，持有租约才能在设备上执行任务"""
+    __tablename__ = 'device_leases'
+
+    id = db.Column(db.Integer, primary_key=True, comment='租约ID')
+    device_serial = db.Column(db.String(100), unique=True, nullable=False, comment='设备序列号（对应devices.device_id）')
+    holder = db.Column(db.String(100), unique=True, nullable=False, comment='租约持有者标识')
+    task_id = db.Column(db.Integer, db.ForeignKey('test_tasks.id', ondelete='SET NULL'), nullable=True, comment='关联的测试任务ID')
+    priority = db.Column(db.Enum('high', 'medium', 'low'), default='medium', comment='任务优先级')
+    previous_status = db.Column(db.String(20), nullable=True, comment='租用前的设备状态，释放时恢复')
+    acquired_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(LOCAL_TIMEZONE), comment='租用时间')
+    heartbeat_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(LOCAL_TIMEZONE), comment='最近心跳时间')
+    expires_at = db.Column(db.DateTime(timezone=True), nullable=False, index=True, comment='过期时间')
+
+    def to_dict(self):
+        """转换为字典"""
+        return {
+            'id': self.id,
+            'device_serial': self.device_serial,
+            'holder': self.holder,
+            'task_id': self.task_id,
+            'priority': self.priority,
+            'previous_status': self.previous_status,
+            'acquired_at': self.acquired_at.isoformat() if self.acquired_at else None,
+            'heartbeat_at': self.heartbeat_at.isoformat() if self.heartbeat_at else None,
+            'expires_at': self.expires_at.isoformat() if self.expires_at else None
+        }
+
+
 class TestSuite(db.Model):
     """测试套件/用例集模型"""
     __tablename__ = 'test_suites'
@@ -670,9 +732,12 @@ class TestCaseReviewHistory(db.Model):
 class TestCase(db.Model):
     """测试用例模型"""
     __tablename__ = 'test_cases'
+    # 按用例集取最大尾号时只需扫描索引
+    __table_args__ = (db.Index('idx_suite_case_seq', 'suite_id', 'case_seq'),)
     
     id = db.Column(db.Integer, primary_key=True, comment='数据库自增ID')
     case_number = db.Column(db.String(50), nullable=True, comment='测试用例编号')
+    case_seq = db.Column(db.Integer, nullable=True, comment='用例编号尾号（编号末尾的序号）')
     case_name = db.Column(db.String(200), nullable=False, comment='用例名称')
     case_description = db.Column(db.Text, comment='用例描述')
     priority = db.Column(db.Enum(*TEST_CASE_PRIORITY), default='P1', comment='优先级')
@@ -708,11 +773,19 @@ class TestCase(db.Model):
     assignee = db.relationship('User', backref='assigned_cases', foreign_keys=[assignee_id])
     reviewer = db.relationship('User', foreign_keys=[reviewer_id])
     
+    @validates('case_number')
+    def _sync_case_seq(self, key, case_number):
+        """用例编号变化时同步尾号（未知前缀时的解析结果，已知前缀的调用方随后直接设置 case_seq）"""
+        if case_number != self.case_number:
+            self.case_seq = case_number_seq(case_number)
+        return case_number
+    
     def to_dict(self):
         """转换为字典"""
         return {
             'id': self.id,
             'case_number': self.case_number,
+            'case_seq': self.case_seq,
             'case_name': self.case_name,
             'case_description': self.case_description,
             'priority': self.priority,
@@ -1001,6 +1074,41 @@ class Report(db.Model):
         }
 
 
+class BackgroundTask(db.Model):
+    """后台异步任务状态模型（AI 生成用例等），多个应用进程共享任务状态"""
+    __tablename__ = 'background_tasks'
+
+    task_id = db.Column(db.String(36), primary_key=True, comment='任务ID')
+    task_name = db.Column(db.String(200), comment='任务名称')
+    task_type = db.Column(db.String(50), default='default', index=True, comment='任务类型')
+    status = db.Column(db.String(20), default='pending', index=True, comment='任务状态')
+    owner = db.Column(db.String(100), comment='执行任务的进程标识')
+    state = db.Column(db.Text, nullable=False, comment='完整的任务状态，JSON格式存储')
+    created_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(LOCAL_TIMEZONE), comment='创建时间')
+    updated_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(LOCAL_TIMEZONE), index=True, comment='最近更新时间（执行中的任务定期刷新）')
+
+
+class AIResponseCache(db.Model):
+    """AI 生成结果缓存模型，按提示词、模型和温度的哈希缓存解析后的测试用例"""
+    __tablename__ = 'ai_response_cache'
+
+    cache_key = db.Column(db.String(64), primary_key=True, comment='缓存键（SHA-256）')
+    model = db.Column(db.String(100), comment='AI模型')
+    response = db.Column(db.Text(length=2 ** 24), nullable=False, comment='生成的测试用例，JSON格式存储')
+    hit_count = db.Column(db.Integer, default=0, comment='命中次数')
+    created_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(LOCAL_TIMEZONE), index=True, comment='创建时间')
+    last_used_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(LOCAL_TIMEZONE), index=True, comment='最近使用时间')
+
+
+class CaseNumberSequence(db.Model):
+    """用例编号序号模型，每个用例集一行，记录已分配的最大尾号"""
+    __tablename__ = 'case_number_sequences'
+
+    suite_id = db.Column(db.Integer, db.ForeignKey('test_suites.id', ondelete='CASCADE'), primary_key=True, comment='用例集ID')
+    last_value = db.Column(db.Integer, nullable=False, default=0, comment='已分配的最大尾号')
+    updated_at = db.Column(db.DateTime(timezone=True), default=lambda: datetime.now(LOCAL_TIMEZONE), onupdate=lambda: datetime.now(LOCAL_TIMEZONE), comment='更新时间')
+
+
 class Tool(db.Model):
     """工具模型"""
     __tablename__ = 'tools'
@@ -2,18 +2,36 @@
 AI异步任务接口
 用于处理AI自动生成测试用例的异步任务
 """
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
 from flask_login import login_required, current_user
 from app.models.models import db, TestSuite, TestCase, User
 from app.utils.helpers import success_response, error_response
-from app.utils.task_manager import task_manager, TaskStatus
-import requests
+from app.utils.task_manager import task_manager, TaskStatus, TaskQueueFullError, FINISHED_STATUSES
+from app.utils.ai_client import ai_client
+from app.utils.doc_chunker import split_document
+from app.utils.json_stream import JsonArrayStreamParser
+from app.utils.ai_cache import ai_cache
+from app.utils.case_sequence import reserve_case_numbers, suite_case_prefix
+from app.utils.case_dedup import build_suite_index, DEFAULT_THRESHOLD
 import json
 import os
+import re
+import time
+import threading
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from sqlalchemy import insert
 
 # 创建Blueprint
 bp = Blueprint('ai_tasks', __name__, url_prefix='/api/ai-tasks')
 
+# AI 生成用例任务的类型，用于限制同时调用 AI 接口的任务数
+AI_GENERATE_TASK_TYPE = 'ai_generate'
+
+# 长文档分段生成用例的线程池
+_chunk_executor = None
+_chunk_executor_lock = threading.Lock()
+
 
 def generate_test_cases_task(suite_id: int, params: dict, task_manager, task_id: str):
     """
@@ -44,52 +62,7 @@ def generate_test_cases_task(suite_id: int, params: dict, task_manager, task_id:
             # 1. 解析需求文档内容（从前端传来的documentContent）
             document_content = params.get('documentContent', '')
             
-            # 更新进度：构建提示词
-            task_manager.update_task_status(
-                task_id,
-                message='正在构建AI提示词...',
-                progress=20
-            )
-            
-            # 2. 构建AI提示词
-            prompt = build_test_case_prompt(params, document_content)
-            
-            # 更新进度：调用AI接口
-            task_manager.update_task_status(
-                task_id,
-                message='正在调用AI生成用例...',
-                progress=30
-            )
-            
-            # 3. 调用AI接口生成测试用例（长文档时提高 max_tokens 避免结果被截断）
-            ai_config = get_ai_config()
-            doc_len = len(document_content or '')
-            base_max = ai_config.get('maxTokens', 4096)
-            extra_tokens = min(12288, (doc_len // 1000) * 500)
-            dynamic_max_tokens = min(16384, base_max + extra_tokens)
-            ai_response = call_ai_api(prompt, ai_config, max_tokens_override=dynamic_max_tokens)
-            
-            # 更新进度：解析AI返回结果
-            task_manager.update_task_status(
-                task_id,
-                message='正在解析AI返回结果...',
-                progress=50
-            )
-            
-            # 4. 解析AI返回的用例数据
-            test_cases = parse_ai_response(ai_response)
-            
-            if not test_cases:
-                raise Exception("AI未生成任何测试用例")
-            
-            # 更新进度：准备保存用例
-            task_manager.update_task_status(
-                task_id,
-                message=f'正在保存测试用例，共{len(test_cases)}条...',
-                progress=60
-            )
-            
-            # 5. 加载用例集并取 project_id/iteration_id/version_requirement_id
+            # 2. 加载用例集并取 project_id/iteration_id/version_requirement_id（流式生成时用例边生成边保存，需先确定）
             suite = TestSuite.query.get(suite_id)
             if not suite:
                 raise Exception("用例集不存在")
@@ -99,33 +72,17 @@ def generate_test_cases_task(suite_id: int, params: dict, task_manager, task_id:
             if project_id is None:
                 raise ValueError("用例集未关联项目，无法保存测试用例。请为用例集选择所属项目。")
             
-            # 6. 生成用例编号前缀（格式与前端一致：xxx-xxx-xxx，从 params 或 suite 关联取项目/迭代/需求名）
-            case_number_prefix = generate_case_number_prefix(suite, params)
-            
-            # 7. 获取当前用例集中最大编号的尾号（格式 xxx-xxx-xxx001，取最后 3 位数字 001～999）
-            max_index = get_max_case_index(suite_id)
+            # 3. 用例编号前缀：用例集已有用例时沿用其前缀，同一用例集的编号保持一致；
+            #    否则按格式 xxx-xxx-xxx 生成（与前端一致，从 params 或 suite 关联取项目/迭代/需求名）
+            case_number_prefix = suite_case_prefix(suite_id) or generate_case_number_prefix(suite, params)
             
-            # 8. 批量保存测试用例
+            # 4. 用例编号尾号从用例集的编号序号中预留（批量保存按区间，流式生成逐条），并发任务不会拿到重复编号
             saved_cases = []
-            total_cases = len(test_cases)
             
-            for i, case_item in enumerate(test_cases):
-                # 更新进度
-                current_progress = 60 + int((i / total_cases) * 35)
-                task_manager.update_task_status(
-                    task_id,
-                    message=f'正在保存第{i+1}/{total_cases}条用例...',
-                    progress=current_progress,
-                    current=i+1,
-                    total=total_cases
-                )
-                
-                # 生成用例编号（原格式：xxx-xxx-xxx001，三段前缀 + 3 位数字 001～999）
-                current_index = max_index + i + 1
-                suffix = str(current_index).zfill(3)
-                if current_index > 999:
-                    suffix = "999"  # API 仅允许 001-999
-                case_number = f"{case_number_prefix}{suffix}"
+            def save_case(case_item, current_index):
+                """生成用例编号和入库数据，返回待插入的行（由调用方批量插入并提交）"""
+                # 生成用例编号（格式：xxx-xxx-xxx001，三段前缀 + 至少 3 位数字）
+                case_number = f"{case_number_prefix}{current_index:03d}"
                 
                 # 构建用例数据（project_id 必填，从 params 或 suite 取）
                 case_data = {
@@ -144,26 +101,162 @@ def generate_test_cases_task(suite_id: int, params: dict, task_manager, task_id:
                     'version_requirement_id': version_requirement_id,
                     'creator_id': params.get('creatorId'),
                 }
-                
-                # 保存用例到数据库
-                test_case = TestCase(**case_data)
-                db.session.add(test_case)
                 saved_cases.append(case_data)
+                return dict(case_data, case_seq=current_index)
             
-            # 提交事务
-            db.session.commit()
+            # 近似去重：与用例集已有用例或本次先生成的用例相似的用例，drop 模式下不保存，flag 模式下保存并在结果中标记
+            dedup_mode = current_app.config.get('AI_DEDUP_MODE') or 'flag'
+            dedup_index = None
+            if dedup_mode in ('drop', 'flag'):
+                dedup_index = build_suite_index(suite_id, current_app.config.get('AI_DEDUP_THRESHOLD') or DEFAULT_THRESHOLD)
+            duplicates = []
             
-            # 更新进度：完成
-            task_manager.update_task_status(
-                task_id,
-                message=f'成功生成并保存{len(saved_cases)}条测试用例',
-                progress=100
-            )
+            def is_duplicate(case_item):
+                """检查近似重复并记录，需要丢弃时返回 True"""
+                if dedup_index is None:
+                    return False
+                match = dedup_index.check(case_item, ref=case_item.get('case_name') or '')
+                if match is None:
+                    return False
+                duplicates.append({
+                    'case_name': case_item.get('case_name'),
+                    'similar_to': match[0],
+                    'similarity': round(match[1], 2)
+                })
+                return dedup_mode == 'drop'
+            
+            def save_all(test_cases):
+                """批量保存已生成的用例"""
+                if not test_cases:
+                    raise Exception("AI未生成任何测试用例")
+                test_cases = [case_item for case_item in test_cases if not is_duplicate(case_item)]
+                if not test_cases:
+                    return
+                
+                # 更新进度：准备保存用例
+                task_manager.update_task_status(
+                    task_id,
+                    message=f'正在保存测试用例，共{len(test_cases)}条...',
+                    progress=60,
+                    total=len(test_cases)
+                )
+                
+                start = reserve_case_numbers(suite_id, len(test_cases))
+                insert_test_cases([save_case(case_item, start + offset) for offset, case_item in enumerate(test_cases)])
+                
+                # 提交事务
+                db.session.commit()
+                task_manager.update_task_status(
+                    task_id,
+                    progress=95,
+                    current=len(test_cases)
+                )
+            
+            # 5. 调用AI接口生成并保存测试用例
+            ai_config = get_ai_config()
+            stream = current_app.config.get('AI_STREAM_ENABLED', True)
+            chunks = split_document(document_content, current_app.config.get('AI_CHUNK_MAX_TOKENS') or 3000)
+            bypass_cache = bool(params.get('bypassCache'))
+            chunk_errors = []
+            truncated = False
+            cache_hits = 0
+            if len(chunks) > 1:
+                # 长文档按标题/段落拆分为多段，各段并发生成用例后合并去重
+                test_cases, chunk_errors, cache_hits = generate_cases_by_chunks(params, chunks, ai_config, task_manager, task_id, stream)
+                save_all(test_cases)
+            else:
+                # 更新进度：构建提示词
+                task_manager.update_task_status(
+                    task_id,
+                    message='正在构建AI提示词...',
+                    progress=20
+                )
+                
+                # 构建AI提示词
+                prompt = build_test_case_prompt(params, document_content)
+                
+                # 相同提示词、模型和温度已生成过时直接使用缓存的用例
+                cached_cases = ai_cache.get(prompt, ai_config, SYSTEM_ROLE_CONTENT, bypass=bypass_cache)
+                if cached_cases is None:
+                    # 更新进度：调用AI接口
+                    task_manager.update_task_status(
+                        task_id,
+                        message='正在调用AI生成用例...',
+                        progress=30
+                    )
+                
+                # 长文档时提高 max_tokens 避免结果被截断
+                max_tokens = _dynamic_max_tokens(ai_config, document_content)
+                if cached_cases is not None:
+                    cache_hits = 1
+                    task_manager.update_task_status(
+                        task_id,
+                        message='相同需求已生成过，使用缓存的生成结果...',
+                        progress=50
+                    )
+                    save_all(cached_cases)
+                elif stream:
+                    # 流式生成：每条用例一生成完就保存并更新进度；输出被截断或中断时保留已保存的用例
+                    parser = JsonArrayStreamParser('test_cases')
+                    committed = 0
+                    generated = []
+                    try:
+                        for case_item in stream_test_cases(prompt, ai_config, max_tokens, parser):
+                            generated.append(case_item)
+                            if is_duplicate(case_item):
+                                continue
+                            insert_test_cases([save_case(case_item, reserve_case_numbers(suite_id, 1))])
+                            db.session.commit()
+                            committed = len(saved_cases)
+                            task_manager.update_task_status(
+                                task_id,
+                                message=f'已生成并保存{len(saved_cases)}条用例...',
+                                progress=min(95, 30 + len(saved_cases)),
+                                current=len(saved_cases)
+                            )
+                    except Exception:
+                        if not saved_cases:
+                            raise
+                        db.session.rollback()
+                        del saved_cases[committed:]
+                        parser.finished = False
+                    truncated = not parser.finished
+                    if not saved_cases and not duplicates:
+                        raise Exception("AI未生成任何测试用例")
+                    if not truncated:
+                        ai_cache.set(prompt, ai_config, generated, SYSTEM_ROLE_CONTENT)
+                else:
+                    ai_response = call_ai_api(prompt, ai_config, max_tokens_override=max_tokens)
+                    
+                    # 更新进度：解析AI返回结果
+                    task_manager.update_task_status(
+                        task_id,
+                        message='正在解析AI返回结果...',
+                        progress=50
+                    )
+                    test_cases = parse_ai_response(ai_response)
+                    ai_cache.set(prompt, ai_config, test_cases, SYSTEM_ROLE_CONTENT)
+                    save_all(test_cases)
+            
+            # 完成消息随结果返回，任务管理器以它作为完成状态的消息
+            message = f'成功生成并保存{len(saved_cases)}条测试用例'
+            if duplicates:
+                message += (f'，跳过{len(duplicates)}条与已有用例近似重复的用例' if dedup_mode == 'drop'
+                            else f'，其中{len(duplicates)}条与已有用例近似重复')
+            if truncated:
+                message += '（AI输出不完整，已保留生成的部分）'
             
             return {
+                'message': message,
                 'suite_id': suite_id,
                 'total_cases': len(saved_cases),
-                'saved_cases': saved_cases[:5]  # 只返回前5条用例的预览
+                'saved_cases': saved_cases[:5],  # 只返回前5条用例的预览
+                'chunks': len(chunks),  # 需求文档拆分的段数
+                'failed_chunks': chunk_errors,  # 生成失败的分段及原因
+                'truncated': truncated,  # AI 输出是否被截断或中断
+                'cache_hits': cache_hits,  # 使用缓存结果的提示词数（不分段时为 0 或 1）
+                'duplicate_count': len(duplicates),  # 近似重复的用例数
+                'duplicates': duplicates[:20]  # 近似重复的用例及与之相似的用例（已有用例为编号，本次生成的为名称）
             }
             
         except Exception as e:
@@ -171,6 +264,113 @@ def generate_test_cases_task(suite_id: int, params: dict, task_manager, task_id:
             raise e
 
 
+def _dynamic_max_tokens(ai_config: dict, document_content: str) -> int:
+    """按文档长度提高 max_tokens，避免用例较多时结果被截断"""
+    doc_len = len(document_content or '')
+    base_max = ai_config.get('maxTokens', 4096)
+    extra_tokens = min(12288, (doc_len // 1000) * 500)
+    return min(16384, base_max + extra_tokens)
+
+
+def _get_chunk_executor() -> ThreadPoolExecutor:
+    """分段生成用例的共享线程池（首次使用时按配置创建）"""
+    global _chunk_executor
+    with _chunk_executor_lock:
+        if _chunk_executor is None:
+            _chunk_executor = ThreadPoolExecutor(
+                max_workers=current_app.config.get('AI_CHUNK_CONCURRENCY') or 4,
+                thread_name_prefix='ai-chunk'
+            )
+        return _chunk_executor
+
+
+def _case_key(case: dict) -> tuple:
+    """用例去重键：忽略空白和大小写后的用例名称与测试步骤"""
+    def normalize(value):
+        return re.sub(r'\s+', '', str(value or '')).lower()
+    return normalize(case.get('case_name')), normalize(case.get('steps'))
+
+
+def merge_test_cases(case_lists: list) -> list:
+    """按分段顺序合并各段生成的用例，名称和步骤相同的用例只保留第一条"""
+    merged = []
+    seen = set()
+    for cases in case_lists:
+        for case in cases or []:
+            key = _case_key(case)
+            if key in seen:
+                continue
+            seen.add(key)
+            merged.append(case)
+    return merged
+
+
+def generate_cases_by_chunks(params: dict, chunks: list, ai_config: dict, task_manager, task_id: str,
+                             stream: bool = False) -> tuple:
+    """
+    各分段并发调用 AI 生成用例，每完成一段更新一次任务进度，最后合并去重
+
+    Args:
+        stream: 是否流式调用，分段输出被截断时保留已闭合的用例
+
+    各分段分别缓存，文档修改后重新生成时未修改的分段直接使用缓存的结果
+
+    Returns:
+        (合并后的用例列表, 失败分段的说明列表, 使用缓存的分段数)；所有分段都失败时抛出异常
+    """
+    total = len(chunks)
+    task_manager.update_task_status(
+        task_id,
+        message=f'需求文档较长，已拆分为{total}段，正在并发生成用例...',
+        progress=30,
+        current=0,
+        total=total
+    )
+
+    bypass_cache = bool(params.get('bypassCache'))
+
+    def generate_chunk(index):
+        prompt = build_test_case_prompt(params, chunks[index], part=(index + 1, total))
+        cached_cases = ai_cache.get(prompt, ai_config, SYSTEM_ROLE_CONTENT, bypass=bypass_cache)
+        if cached_cases is not None:
+            return cached_cases, True
+        max_tokens = _dynamic_max_tokens(ai_config, chunks[index])
+        if stream:
+            parser = JsonArrayStreamParser('test_cases')
+            test_cases = list(stream_test_cases(prompt, ai_config, max_tokens, parser))
+            if parser.finished:
+                ai_cache.set(prompt, ai_config, test_cases, SYSTEM_ROLE_CONTENT)
+            return test_cases, False
+        test_cases = parse_ai_response(call_ai_api(prompt, ai_config, max_tokens_override=max_tokens))
+        ai_cache.set(prompt, ai_config, test_cases, SYSTEM_ROLE_CONTENT)
+        return test_cases, False
+
+    executor = _get_chunk_executor()
+    futures = {executor.submit(generate_chunk, index): index for index in range(total)}
+    results = [None] * total
+    errors = []
+    cache_hits = 0
+    for done, future in enumerate(as_completed(futures), start=1):
+        index = futures[future]
+        try:
+            results[index], cached = future.result()
+            cache_hits += cached
+        except Exception as e:
+            # 单段失败不影响其他分段的结果
+            errors.append(f'第{index + 1}段: {str(e)}')
+        task_manager.update_task_status(
+            task_id,
+            message=f'已完成{done}/{total}段需求的用例生成' + (f'（{len(errors)}段失败）' if errors else ''),
+            progress=30 + int(done / total * 20),
+            current=done,
+            total=total
+        )
+
+    if len(errors) == total:
+        raise Exception('所有分段生成用例均失败：' + '；'.join(errors[:3]))
+    return merge_test_cases(results), errors, cache_hits
+
+
 def _suggest_case_count(document_content: str) -> int:
     """
     根据需求文档长度，估算建议生成的用例条数（用于提示词，不硬性限制）。
@@ -184,16 +384,25 @@ def _suggest_case_count(document_content: str) -> int:
     return suggested
 
 
-def build_test_case_prompt(params: dict, document_content: str) -> str:
-    """构建AI提示词：仅依据传入的需求文档内容生成用例，与用例集的所属项目/迭代/需求等元数据无关"""
+def build_test_case_prompt(params: dict, document_content: str, part: tuple = None) -> str:
+    """
+    构建AI提示词：仅依据传入的需求文档内容生成用例，与用例集的所属项目/迭代/需求等元数据无关
+
+    Args:
+        part: 长文档拆分后的 (第几段, 总段数)，只针对该段内容生成用例
+    """
     suggested_count = _suggest_case_count(document_content)
     doc_content = (document_content or '').strip()
     if not doc_content:
         doc_content = "（未提供需求文档内容）"
+    part_note = ''
+    if part:
+        part_note = (f"\n注意：需求文档较长，已拆分为{part[1]}段，下方是第{part[0]}段。"
+                     f"只针对本段描述的功能点生成用例，其他段落会单独生成。\n")
 
     prompt = f"""你是一名专业测试工程师。请**严格依据**下方「需求文档内容」生成功能测试用例。
 每条用例的步骤、预期结果必须能在需求文档中找到对应依据，不要编造需求中未提及的行为。
-（与用例集所属的项目、迭代、需求等无关，仅以需求文档内容为准。）
+（与用例集所属的项目、迭代、需求等无关，仅以需求文档内容为准。）{part_note}
 
 【需求文档内容】
 {doc_content}
@@ -232,8 +441,8 @@ SYSTEM_ROLE_CONTENT = """你是专业测试工程师。根据用户提供的需
 - 只输出用户要求的 JSON，不要输出任何解释、代码块标记或多余文字。"""
 
 
-def call_ai_api(prompt: str, ai_config: dict, max_tokens_override: int = None) -> dict:
-    """调用AI接口（OpenAI 兼容），支持动态 max_tokens 与 system 角色"""
+def _ai_request_args(prompt: str, ai_config: dict, max_tokens_override: int = None, stream: bool = False) -> tuple:
+    """构造 AI 接口（OpenAI 兼容）的请求地址、请求头和请求体，支持动态 max_tokens 与 system 角色"""
     api_key = (ai_config.get('apiKey') or '').strip()
     if not api_key or api_key == 'sk-your-api-key' or api_key == 'sk-your-api-key-here':
         raise ValueError(
@@ -256,21 +465,67 @@ def call_ai_api(prompt: str, ai_config: dict, max_tokens_override: int = None) -
         'temperature': ai_config.get('temperature', 0.3),
         'max_tokens': max_tokens
     }
-    try:
-        response = requests.post(url, headers=headers, json=data, timeout=120)
-        if response.status_code == 401:
-            raise ValueError(
-                'AI 服务认证失败(401)。请检查 backend/.env 中的 AI_API_KEY 是否有效、未过期，'
-                '并到 SiliconFlow 控制台确认密钥状态：https://cloud.siliconflow.cn/'
-            )
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.HTTPError as e:
-        if e.response is not None and e.response.status_code == 401:
-            raise ValueError(
-                'AI 服务认证失败(401)。请检查 backend/.env 中的 AI_API_KEY 是否有效、未过期。'
-            ) from e
-        raise
+    if stream:
+        data['stream'] = True
+    return url, headers, data
+
+
+def _check_ai_response(response):
+    """检查 AI 接口的响应状态，认证失败时给出配置提示"""
+    if response.status_code == 401:
+        raise ValueError(
+            'AI 服务认证失败(401)。请检查 backend/.env 中的 AI_API_KEY 是否有效、未过期，'
+            '并到 SiliconFlow 控制台确认密钥状态：https://cloud.siliconflow.cn/'
+        )
+    response.raise_for_status()
+
+
+def call_ai_api(prompt: str, ai_config: dict, max_tokens_override: int = None) -> dict:
+    """调用AI接口（OpenAI 兼容），支持动态 max_tokens 与 system 角色，经 ai_client 连接池发送并自动重试"""
+    url, headers, data = _ai_request_args(prompt, ai_config, max_tokens_override)
+    # 共享连接池，429/5xx/连接失败时由客户端退避重试
+    response = ai_client.post(url, data, headers=headers)
+    _check_ai_response(response)
+    return response.json()
+
+
+def stream_ai_content(prompt: str, ai_config: dict, max_tokens_override: int = None):
+    """
+    以流式模式（stream: true）调用AI接口，逐段返回模型输出的文本
+
+    服务端不支持流式、直接返回完整结果时，整段返回 message.content
+    """
+    url, headers, data = _ai_request_args(prompt, ai_config, max_tokens_override, stream=True)
+    with ai_client.stream(url, data, headers=headers) as response:
+        _check_ai_response(response)
+        if 'text/event-stream' not in response.headers.get('Content-Type', ''):
+            yield response.json()['choices'][0]['message']['content']
+            return
+        for line in response.iter_lines():
+            # SSE：每个 data 行是一个增量，data: [DONE] 表示结束
+            if not line.startswith(b'data:'):
+                continue
+            payload = line[5:].strip()
+            if payload == b'[DONE]':
+                # 继续读到响应结束，连接才能放回连接池
+                continue
+            choices = json.loads(payload).get('choices') or []
+            content = (choices[0].get('delta') or {}).get('content') if choices else None
+            if content:
+                yield content
+
+
+def stream_test_cases(prompt: str, ai_config: dict, max_tokens_override: int = None, parser: JsonArrayStreamParser = None):
+    """
+    流式生成测试用例：test_cases 数组中的每条用例一闭合就返回，不等待整个响应结束
+
+    Args:
+        parser: 增量解析器，调用方可在结束后通过 parser.finished 判断输出是否完整（被截断时为 False）
+    """
+    parser = parser or JsonArrayStreamParser('test_cases')
+    for content in stream_ai_content(prompt, ai_config, max_tokens_override):
+        for case_item in parser.feed(content):
+            yield case_item
 
 
 def parse_ai_response(ai_response: dict) -> list:
@@ -348,13 +603,25 @@ def _english_word_initials(english_phrase: str) -> str:
     return "".join(w[0].upper() for w in english_phrase.strip().split() if w and w[0].isalpha())
 
 
+# 拼音首字母转换函数，首次需要时加载 pypinyin（None 表示尚未加载，False 表示不可用）
+_pinyin_first_letter = None
+
+
 def _chinese_char_to_pinyin_initial(char: str) -> str:
     """单个汉字转拼音首字母，无法转换时返回空字符串"""
+    global _pinyin_first_letter
     if not char or not ("\u4e00" <= char <= "\u9fff"):
         return ""
+    if _pinyin_first_letter is None:
+        try:
+            from pypinyin import pinyin, Style
+            _pinyin_first_letter = lambda c: pinyin(c, style=Style.FIRST_LETTER)
+        except Exception:
+            _pinyin_first_letter = False
+    if not _pinyin_first_letter:
+        return ""
     try:
-        from pypinyin import pinyin, Style
-        py = pinyin(char, style=Style.FIRST_LETTER)
+        py = _pinyin_first_letter(char)
         if py and py[0] and py[0][0]:
             return py[0][0].upper()
     except Exception:
@@ -362,50 +629,79 @@ def _chinese_char_to_pinyin_initial(char: str) -> str:
     return ""
 
 
+class _AbbrevTranslator:
+    """中文名称缩写翻译器：词典预先构建为前缀树（值为英文单词首字母），按最长匹配翻译"""
+
+    _END = ''  # 前缀树中标记词语结束的键
+
+    def __init__(self, dictionary: dict):
+        self._trie = {}
+        for word, english in dictionary.items():
+            node = self._trie
+            for char in word:
+                node = node.setdefault(char, {})
+            node[self._END] = _english_word_initials(english)
+
+    def longest_match(self, name: str, start: int):
+        """从 start 开始匹配词典中最长的词，返回 (词长, 英文首字母)，未匹配时返回 (0, None)"""
+        node = self._trie
+        length, initials = 0, None
+        for offset in range(start, len(name)):
+            node = node.get(name[offset])
+            if node is None:
+                break
+            if self._END in node:
+                length, initials = offset - start + 1, node[self._END]
+        return length, initials
+
+    def translate(self, name: str, max_len: int) -> str:
+        result = []
+        i = 0
+        while i < len(name):
+            char = name[i]
+            # 英文、数字等 ASCII 字符保留（转大写）；汉字按下面的词典和拼音翻译
+            if ord(char) < 128:
+                result.append(char.upper())
+                i += 1
+                continue
+            if "\u4e00" <= char <= "\u9fff":
+                # 优先匹配词典中最长的词；无法翻译时用拼音首字母（连同下一个字）
+                length, initials = self.longest_match(name, i)
+                if length:
+                    result.append(initials)
+                    i += length
+                    continue
+                # 词典无该词，采用拼音缩写
+                result.append(_chinese_char_to_pinyin_initial(char))
+                if i + 1 < len(name):
+                    result.append(_chinese_char_to_pinyin_initial(name[i + 1]))
+                    i += 2
+                else:
+                    i += 1
+                continue
+            if char.isalnum():
+                # 其他非 ASCII 的字母数字（如全角数字）保留
+                result.append(char.upper())
+            i += 1
+        return "".join(result)[:max_len]
+
+
+_abbrev_translator = _AbbrevTranslator(_ZH2EN)
+
+
+@lru_cache(maxsize=1024)
+def _translate_abbrev(name: str, max_len: int) -> str:
+    return _abbrev_translator.translate(name, max_len)
+
+
 def _name_to_english_abbrev(name: str, max_len: int = 3) -> str:
     """
     将名称转为缩写：中文按词典翻译成英文，再取英文各单词首字母；英文/数字保留。
-    用于用例编号前缀，避免编号中出现中文。
+    用于用例编号前缀，避免编号中出现中文。同一名称的结果会被缓存
     """
     if not name or not str(name).strip():
         return ""
-    name = str(name).strip()
-    result = []
-    i = 0
-    while i < len(name):
-        char = name[i]
-        if char.isalnum() or ord(char) < 128:
-            result.append(char.upper())
-            i += 1
-            continue
-        if "\u4e00" <= char <= "\u9fff":
-            # 优先匹配 2 字词，再 1 字；无法翻译时用拼音首字母
-            two = name[i : i + 2] if i + 2 <= len(name) else ""
-            one = char
-            if two and two in _ZH2EN:
-                initials = _english_word_initials(_ZH2EN[two])
-                result.append(initials)
-                i += 2
-            elif one in _ZH2EN:
-                initials = _english_word_initials(_ZH2EN[one])
-                result.append(initials)
-                i += 1
-            else:
-                # 词典无该词，采用拼音缩写
-                py = _chinese_char_to_pinyin_initial(one)
-                if py:
-                    result.append(py)
-                if two:
-                    py2 = _chinese_char_to_pinyin_initial(two[1])
-                    if py2:
-                        result.append(py2)
-                    i += 2
-                else:
-                    i += 1
-            continue
-        i += 1
-    abbrev = "".join(result)[:max_len]
-    return abbrev if abbrev else ""
+    return _translate_abbrev(str(name).strip(), max_len)
 
 
 def generate_case_number_prefix(suite, params: dict) -> str:
@@ -429,25 +725,13 @@ def generate_case_number_prefix(suite, params: dict) -> str:
     return f"{project_short}-{version}-{requirement_short}"
 
 
-def get_max_case_index(suite_id: int) -> int:
+def insert_test_cases(rows: list):
     """
-    获取用例集中已有用例编号的最大尾号（数字部分）。
-    编号格式为 xxx-xxx-xxx001，只取末尾 3 位数字，用于生成下一个 001～999 的序号。
+    批量插入用例：不经过 ORM 工作单元，同一批行合并为多行 INSERT ... VALUES 语句执行，由调用方提交。
+    rows 中需带 case_seq（用例编号尾号）
     """
-    import re
-    try:
-        cases = TestCase.query.filter_by(suite_id=suite_id).all()
-        if not cases:
-            return 0
-        max_index = 0
-        for case in cases:
-            match = re.search(r'(\d{3})$', case.case_number or '')
-            if match:
-                index = int(match.group(1))
-                max_index = max(max_index, index)
-        return max_index
-    except Exception:
-        return 0
+    if rows:
+        db.session.execute(insert(TestCase), rows)
 
 
 @bp.route('/generate-cases', methods=['POST'])
@@ -466,7 +750,8 @@ def generate_cases():
         "iterationName": 迭代名称,
         "requirementName": 需求名称,
         "description": 需求描述,
-        "documentContent": 需求文档内容
+        "documentContent": 需求文档内容,
+        "bypassCache": 是否跳过生成结果缓存、强制重新调用AI（可选，默认 false）
     }
     
     返回：
@@ -501,20 +786,26 @@ def generate_cases():
             'requirementName': data.get('requirementName', ''),
             'description': data.get('description', ''),
             'documentContent': data.get('documentContent', ''),
+            'bypassCache': bool(data.get('bypassCache')),
             'creatorId': current_user.id,
         }
         
-        # 创建异步任务
-        task_id = task_manager.create_task(
-            task_name=f'AI生成测试用例 - {suite.suite_name}',
-            task_func=generate_test_cases_task,
-            suite_id=suite_id,
-            params=params
-        )
+        # 创建异步任务（AI 生成任务共享并发上限，超出时排队）
+        try:
+            task_id = task_manager.create_task(
+                task_name=f'AI生成测试用例 - {suite.suite_name}',
+                task_func=generate_test_cases_task,
+                task_type=AI_GENERATE_TASK_TYPE,
+                suite_id=suite_id,
+                params=params
+            )
+        except TaskQueueFullError as e:
+            return error_response(429, str(e))
         
         return success_response({
             'task_id': task_id,
             'suite_id': suite_id,
+            'queue_position': task_manager.get_task_status(task_id).get('queue_position'),
             'message': '任务已创建，正在后台生成测试用例'
         })
         
@@ -537,7 +828,8 @@ def get_task_status(task_id):
             "progress": 进度百分比,
             "message": "状态消息",
             "result": 任务结果（仅completed状态）,
-            "error": 错误信息（仅failed状态）
+            "error": 错误信息（仅failed状态）,
+            "queue_position": 排队位置（仅pending状态）
         }
     }
     """
@@ -553,6 +845,56 @@ def get_task_status(task_id):
         return error_response(f'查询任务状态失败: {str(e)}', 500)
 
 
+@bp.route('/task-events/<task_id>', methods=['GET'])
+@login_required
+def stream_task_events(task_id):
+    """
+    以 SSE 推送任务进度，替代轮询 task-status
+
+    事件：
+    - progress：任务状态（与 task-status 的 data 相同），事件 ID 为任务状态的版本号
+    - end：任务已结束，data 为最终状态（含 result / error），随后关闭连接
+
+    合并窗口内的多次进度更新只推送最后一次；断线重连时浏览器通过 Last-Event-ID 带上最后收到的版本号，
+    只推送之后的更新（也可通过查询参数 last_event_id 指定）
+    """
+    if not task_manager.get_task_status(task_id):
+        return error_response(404, '任务不存在')
+
+    last_version = request.headers.get('Last-Event-ID', type=int)
+    if last_version is None:
+        last_version = request.args.get('last_event_id', -1, type=int)
+    coalesce_window = current_app.config.get('TASK_EVENT_COALESCE_WINDOW', 0.5)
+
+    def generate(last_version):
+        while True:
+            task = task_manager.wait_for_update(task_id, last_version, timeout=15)
+            if task is None:
+                if not task_manager.get_task_status(task_id):
+                    # 任务已被清理
+                    yield 'event: end\ndata: null\n\n'
+                    return
+                # 保持连接
+                yield ': keepalive\n\n'
+                continue
+            if task['status'] not in FINISHED_STATUSES and coalesce_window:
+                # 等待合并窗口结束，推送窗口内的最新状态
+                time.sleep(coalesce_window)
+                task = task_manager.get_task_status(task_id) or task
+            last_version = task.get('version', 0)
+            event = 'end' if task['status'] in FINISHED_STATUSES else 'progress'
+            payload = json.dumps(task, ensure_ascii=False, default=str)
+            yield f"id: {last_version}\nevent: {event}\ndata: {payload}\n\n"
+            if event == 'end':
+                return
+
+    return Response(
+        stream_with_context(generate(last_version)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
 @bp.route('/tasks', methods=['GET'])
 @login_required
 def get_all_tasks():
@@ -567,7 +909,7 @@ def get_all_tasks():
     """
     try:
         # 获取所有任务
-        all_tasks = list(task_manager.tasks.values())
+        all_tasks = task_manager.list_tasks()
         
         # 按创建时间倒序排序
         all_tasks.sort(key=lambda x: x.get('created_at', ''), reverse=True)
@@ -576,3 +918,42 @@ def get_all_tasks():
         
     except Exception as e:
         return error_response(f'获取任务列表失败: {str(e)}', 500)
+
+
+@bp.route('/stats', methods=['GET'])
+@login_required
+def get_task_stats():
+    """
+    获取任务管理器的排队、执行和清理统计以及 AI 接口调用统计（用于监控）
+    
+    返回：
+    {
+        "code": 200,
+        "data": {
+            "queued": 排队任务数,
+            "running": 各类型执行中的任务数,
+            "tasks": 本进程保存的任务数,
+            "evicted_ttl": 过期清理的任务数,
+            "evicted_lru": 超出上限淘汰的任务数,
+            "trimmed": 精简结果的任务数,
+            "ai_client": AI 接口请求数、重试次数、并发和耗时统计,
+            "ai_cache": AI 生成结果缓存的命中、未命中、写入、淘汰次数和条数
+        }
+    }
+    """
+    return success_response(dict(
+        task_manager.get_stats(),
+        ai_client=ai_client.get_metrics(),
+        ai_cache=ai_cache.get_stats()
+    ))
+
+
+@bp.route('/cache', methods=['DELETE'])
+@login_required
+def clear_ai_cache():
+    """清空 AI 生成结果缓存"""
+    try:
+        removed = ai_cache.clear()
+        return success_response({'removed': removed}, f'已清空{removed}条生成结果缓存')
+    except Exception as e:
+        return error_response(500, f'清空生成结果缓存失败: {str(e)}')
@@ -1,18 +1,29 @@
 import subprocess
 import os
 import re
+import json
 import shlex
 import uuid
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from datetime import datetime
-from flask import Blueprint, request
+from flask import Blueprint, request, current_app, Response, stream_with_context
 from flask_login import login_required, current_user
 
-from app.models.models import Device, db, TestTask
+from app.models.models import Device, db, TestTask, LOCAL_TIMEZONE
 from app.utils.helpers import (
     success_response, error_response, get_pagination_params, log_user_action,
     validate_json_data
 )
 from app.utils.scheduler import add_scheduled_task, remove_scheduled_task, get_scheduled_tasks
+from app.utils.device_executor import (
+    device_executor, submit_leased_device_task, run_batch_device_task, get_adb_path, DEVICE_TASK_TYPES
+)
+from app.utils.device_lease import device_leases, DeviceLeaseError
+from app.utils.device_inventory import collect_inventory, save_inventory
+from app.utils.adb_client import adb_client, parse_devices_l, AdbError, AdbConnectionError
+from app.utils.device_registry import device_registry
+from app.utils.device_dispatcher import device_dispatcher
+from app.utils.output_stream import output_streams
 
 bp = Blueprint('devices', __name__)
 
@@ -184,27 +195,7 @@ def get_device_status(device_id):
         return error_response(404, "设备不存在")
     
     try:
-        # 计算项目根目录路径
-        project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
-        
-        # 使用escrcpy中的adb
-        adb_path = os.path.join(
-            project_root,
-            'escrcpy', 'electron', 'resources', 'extra', 'win', 'scrcpy', 'adb.exe'
-        )
-        
-        # 执行adb命令检查设备状态
-        result = subprocess.run(
-            [adb_path, '-s', device.device_id, 'get-state'],
-            capture_output=True,
-            text=True,
-            shell=False,
-            encoding='utf-8',
-            errors='ignore'
-        )
-        
-        # 解析设备状态
-        adb_status = result.stdout.strip()
+        adb_status = _query_adb_state(device.device_id)
         
         if adb_status == 'device':
             # 设备已连接
@@ -227,6 +218,48 @@ def get_device_status(device_id):
         })
 
 
+def _query_adb_state(serial):
+    """查询单台设备的 adb 状态（device / offline / unauthorized，设备不存在时为空字符串）"""
+    # 优先读取设备状态注册表的缓存
+    cached = device_registry.get(serial)
+    if cached is not None:
+        return cached['state']
+
+    if adb_client.enabled:
+        try:
+            return adb_client.get_state(serial)
+        except AdbConnectionError:
+            raise
+        except AdbError:
+            # 设备不存在，与 adb get-state 的 stdout 一致返回空
+            return ''
+
+    # 执行adb命令检查设备状态
+    result = subprocess.run(
+        [get_adb_path(), '-s', serial, 'get-state'],
+        capture_output=True,
+        text=True,
+        shell=False,
+        encoding='utf-8',
+        errors='ignore'
+    )
+    return result.stdout.strip()
+
+
+def _list_adb_devices():
+    """获取 adb devices -l 的设备列表，返回 [{'serial', 'state', 'info'}]"""
+    cached = device_registry.list_devices()
+    if cached is not None:
+        return cached
+
+    if adb_client.enabled:
+        return adb_client.list_devices()
+
+    # 执行adb命令获取设备列表
+    result = subprocess.run([get_adb_path(), 'devices', '-l'], capture_output=True, text=True, check=True, encoding='utf-8', errors='ignore')
+    return parse_devices_l(result.stdout)
+
+
 @bp.route('/os-types', methods=['GET'])
 @login_required
 def get_os_types():
@@ -262,58 +295,43 @@ def get_status_options():
 def get_adb_devices():
     """获取当前连接的设备列表"""
     try:
-        # 计算项目根目录路径
-        project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
-        
-        # 使用escrcpy中的adb
-        adb_path = os.path.join(
-            project_root,
-            'escrcpy', 'electron', 'resources', 'extra', 'win', 'scrcpy', 'adb.exe'
-        )
-        
-        # 执行adb命令获取设备列表
-        result = subprocess.run([adb_path, 'devices', '-l'], capture_output=True, text=True, check=True, encoding='utf-8', errors='ignore')
-        
         # 解析adb输出
         devices = []
-        lines = result.stdout.strip().split('\n')[1:]  # 跳过第一行 "List of devices attached"
         
-        for line in lines:
-            if not line.strip():
+        for entry in _list_adb_devices():
+            serial = entry['serial']
+            status = entry['state']
+            info = entry['info']
+            if status not in ('device', 'unauthorized', 'offline'):
                 continue
-                
-            # 使用正则表达式解析设备信息
-            match = re.match(r'(\S+)\s+(device|unauthorized|offline)(.*)', line)
-            if match:
-                serial = match.group(1)
-                status = match.group(2)
-                info = match.group(3).strip()
-                
-                # 解析设备详情
-                device_info = {
-                    'id': serial,
-                    'status': status,
-                    'name': '',
-                    'wifi': False,
-                    'remark': ''
-                }
-                
-                # 检查是否为WiFi设备
-                if ':' in serial and not serial.startswith('emulator-'):
-                    device_info['wifi'] = True
-                
-                # 提取设备名称
-                model_match = re.search(r'model:(\S+)', info)
-                if model_match:
-                    device_info['name'] = model_match.group(1)
-                
-                devices.append(device_info)
+            
+            # 解析设备详情
+            device_info = {
+                'id': serial,
+                'status': status,
+                'name': '',
+                'wifi': False,
+                'remark': ''
+            }
+            
+            # 检查是否为WiFi设备
+            if ':' in serial and not serial.startswith('emulator-'):
+                device_info['wifi'] = True
+            
+            # 提取设备名称
+            model_match = re.search(r'model:(\S+)', info)
+            if model_match:
+                device_info['name'] = model_match.group(1)
+            
+            devices.append(device_info)
         
         return success_response({
             'devices': devices
         })
     except subprocess.CalledProcessError as e:
         return error_response(500, f"执行adb命令失败: {e.stderr}")
+    except AdbError as e:
+        return error_response(500, f"执行adb命令失败: {str(e)}")
     except Exception as e:
         return error_response(500, f"获取设备列表失败: {str(e)}")
 
@@ -430,6 +448,35 @@ def execute_adb_command():
             return error_response(500, "执行命令失败")
 
 
+def _get_device_by_id_or_serial(device_id):
+    """根据数据库主键或设备序列号查询设备"""
+    # 尝试根据设备ID查询（数据库主键）
+    try:
+        device = Device.query.get(int(device_id))
+    except ValueError:
+        device = None
+
+    # 如果根据数据库主键查询不到，尝试根据设备序列号查询
+    if not device:
+        device = Device.query.filter_by(device_id=device_id).first()
+    return device
+
+
+def _complete_test_task(task_id):
+    """设备任务执行完成后，将运行中的测试任务标记为已完成"""
+    if not task_id:
+        return
+    try:
+        test_task = TestTask.query.get(task_id)
+        if test_task and test_task.status == 'running':
+            test_task.status = 'completed'
+            test_task.completed_time = datetime.now(LOCAL_TIMEZONE)
+            db.session.commit()
+    except Exception as e:
+        # 更新任务状态失败，不影响脚本执行结果
+        db.session.rollback()
+
+
 @bp.route('/<device_id>/tasks', methods=['POST'])
 @login_required
 def execute_task(device_id):
@@ -440,260 +487,73 @@ def execute_task(device_id):
     command = data.get('command', '')
     file_path = data.get('file_path', '')
     file_content = data.get('file_content', '')
+    file_hash = data.get('file_hash', '')  # 可选的已缓存安装包MD5，未提供 file_path/file_content 时按它取本地缓存的安装包
     task_id = data.get('task_id')  # 可选的测试任务ID，用于执行完成后更新任务状态
+    stream = bool(data.get('stream', False))  # 流式执行：立即返回输出流ID，输出通过 /streams/<stream_id> 获取
 
     try:
-        # 计算项目根目录路径
-        project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
-        
         # 获取设备对象，以便使用device.device_id构建adb命令
-        from app.models.models import Device
-        # 尝试根据设备ID查询（数据库主键）
-        try:
-            device = Device.query.get(int(device_id))
-        except ValueError:
-            device = None
-        
-        # 如果根据数据库主键查询不到，尝试根据设备序列号查询
-        if not device:
-            device = Device.query.filter_by(device_id=device_id).first()
-        
-        # 如果仍然查询不到设备，返回404
+        device = _get_device_by_id_or_serial(device_id)
         if not device:
             return error_response(404, "设备不存在")
 
-        if task_type == 'install' and (file_path or file_content):
-            # 安装 APK
-            adb_path = os.path.join(
-                project_root,
-                'escrcpy', 'electron', 'resources', 'extra', 'win', 'scrcpy', 'adb.exe'
-            )
-
-            # 构建环境变量
-            env = os.environ.copy()
-            env['ADB'] = adb_path
-
-            # 如果有文件内容，先保存到临时文件
-            if file_content:
-                import tempfile
-                with tempfile.NamedTemporaryFile(mode='w', suffix='.apk', delete=False, encoding='utf-8') as f:
-                    f.write(file_content)
-                    file_path = f.name
+        if task_type not in DEVICE_TASK_TYPES or (task_type == 'install' and not (file_path or file_content or file_hash)):
+            return error_response(400, "不支持的任务类型")
+        if task_type == 'shell' and not (file_content or file_path or command):
+            return error_response(400, "请提供脚本文件或命令")
 
-            # 构建完整的命令
-            command_parts = [adb_path, '-s', device.device_id, 'install', '-r', file_path]
-
-            # 执行安装命令
-            result = subprocess.run(
-                command_parts,
-                capture_output=True,
-                text=True,
-                check=False,
-                env=env,
-                encoding='utf-8',
-                errors='ignore'
-            )
+        # 脚本文件为服务器上的相对存储路径，转换为完整路径
+        if task_type in ('shell', 'python') and file_path and not file_content:
+            file_path = os.path.join(current_app.config['SCRIPT_STORAGE_PATH'], file_path)
 
-            # 清理临时文件
-            if file_content and os.path.exists(file_path):
-                os.unlink(file_path)
+        # Python 任务的 command 作为脚本参数
+        script_args = command.split() if task_type == 'python' and command else None
 
-            # 检查安装是否成功
-            if result.returncode == 0:
-                # 如果提供了任务ID，更新测试任务状态
-                if task_id:
-                    try:
-                        from app.models.models import TestTask
-                        test_task = TestTask.query.get(task_id)
-                        if test_task and test_task.status == 'running':
-                            test_task.status = 'completed'
-                            test_task.completed_time = datetime.now(timezone(timedelta(hours=8)))
-                            db.session.commit()
-                    except Exception as e:
-                        # 更新任务状态失败，不影响脚本执行结果
-                        pass
-                
-                return success_response({
-                    'stdout': result.stdout,
-                    'stderr': result.stderr,
-                    'exit_code': result.returncode,
-                    'message': '应用安装成功'
-                })
-            else:
-                error_message = result.stderr or result.stdout or "应用安装失败"
-                return error_response(500, f"应用安装失败: {error_message}")
+        # 按测试任务优先级排队租用设备
+        priority = device_leases.task_priority(task_id)
 
-        elif task_type == 'shell':
-            # 执行 Shell 脚本
-            adb_path = os.path.join(
-                project_root,
-                'escrcpy', 'electron', 'resources', 'extra', 'win', 'scrcpy', 'adb.exe'
+        if stream:
+            output_stream = _start_streaming_task(
+                device.device_id, task_type, command, file_path, file_content, script_args, task_id, priority,
+                file_hash=file_hash
             )
-
-            # 构建环境变量
-            env = os.environ.copy()
-            env['ADB'] = adb_path
-
-            if file_content:
-                # 执行脚本内容
-                command_parts = [adb_path, '-s', device.device_id, 'shell', file_content]
-            elif file_path:
-                # 执行脚本文件
-                # 将相对路径转换为完整路径
-                from flask import current_app
-                full_file_path = os.path.join(current_app.config['SCRIPT_STORAGE_PATH'], file_path)
-                with open(full_file_path, 'r', encoding='utf-8') as f:
-                    script_content = f.read()
-                command_parts = [adb_path, '-s', device.device_id, 'shell', script_content]
-            elif command:
-                # 执行命令
-                command_parts = [adb_path, '-s', device.device_id, 'shell'] + command.split()
-            else:
-                return error_response(400, "请提供脚本文件或命令")
-
-            # 执行 Shell 命令
-            result = subprocess.run(
-                command_parts,
-                capture_output=True,
-                text=True,
-                check=False,
-                env=env,
-                encoding='utf-8',
-                errors='ignore'
+            return success_response({
+                'stream_id': output_stream.stream_id,
+                'offset': 0
+            }, "任务已开始执行")
+
+        # 单设备任务同样经过执行器，与批量任务共享本机并发上限（取得设备租约后才占用执行器名额）；
+        # 同步请求只短暂等待设备空闲，设备忙碌时直接返回，不长时间占用请求线程
+        lease_timeout = current_app.config['DEVICE_LEASE_SYNC_WAIT_TIMEOUT']
+        future = submit_leased_device_task(
+            device.device_id, task_type, task_id=task_id, priority=priority, lease_timeout=lease_timeout,
+            command=command, file_path=file_path, file_content=file_content, file_hash=file_hash,
+            script_args=script_args, timeout=device_executor.device_timeout
+        )
+        try:
+            result = future.result(
+                timeout=lease_timeout + device_executor.device_timeout if device_executor.device_timeout else None
             )
+        except FutureTimeoutError:
+            future.cancel()
+            return error_response(503, "设备任务执行超时，请稍后重试")
+        except DeviceLeaseError as e:
+            # 设备忙碌（等待超时）或维护中
+            return error_response(409, str(e))
+
+        if result['success']:
+            # 如果提供了任务ID，更新测试任务状态
+            _complete_test_task(task_id)
+            return success_response({
+                'stdout': result['stdout'],
+                'stderr': result['stderr'],
+                'exit_code': result['exit_code'],
+                'message': result['message']
+            })
 
-            # 检查命令是否成功
-            if result.returncode == 0:
-                # 如果提供了任务ID，更新测试任务状态
-                if task_id:
-                    try:
-                        from app.models.models import TestTask
-                        test_task = TestTask.query.get(task_id)
-                        if test_task and test_task.status == 'running':
-                            test_task.status = 'completed'
-                            test_task.completed_time = datetime.now(timezone(timedelta(hours=8)))
-                            db.session.commit()
-                    except Exception as e:
-                        # 更新任务状态失败，不影响脚本执行结果
-                        pass
-                
-                return success_response({
-                    'stdout': result.stdout,
-                    'stderr': result.stderr,
-                    'exit_code': result.returncode,
-                    'message': '命令执行成功'
-                })
-            else:
-                error_message = result.stderr or result.stdout or "命令执行失败"
-                return error_response(500, f"命令执行失败: {error_message}")
-
-        elif task_type == 'python':
-            # 执行 Python 脚本（使用本地Python解释器）
-            import tempfile
-            import sys
-            
-            if file_content:
-                # 执行 Python 脚本内容
-                script_content = file_content
-            elif file_path:
-                # 执行 Python 脚本文件
-                # 将相对路径转换为完整路径
-                from flask import current_app
-                full_file_path = os.path.join(current_app.config['SCRIPT_STORAGE_PATH'], file_path)
-                with open(full_file_path, 'r', encoding='utf-8') as f:
-                    script_content = f.read()
-            else:
-                # 直接执行 Python 命令
-                script_content = command
-
-            # 保存到临时文件
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False, encoding='utf-8') as f:
-                f.write(script_content)
-                temp_script_path = f.name
-
-            try:
-                # 设置环境变量，传递设备ID
-                env = os.environ.copy()
-                env['DEVICE_ID'] = device.device_id
-                env['ADB_PATH'] = os.path.join(
-                    os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))),
-                    'escrcpy', 'electron', 'resources', 'extra', 'win', 'scrcpy', 'adb.exe'
-                )
-
-                # 添加参数
-                python_args = [temp_script_path]
-                if command:
-                    python_args.extend(command.split())
-
-                # 使用字节流捕获输出，避免编码问题
-                result = subprocess.run(
-                    [sys.executable] + python_args,
-                    capture_output=True,
-                    check=False,
-                    env=env
-                )
-
-                # 尝试多种编码方式解码输出
-                def decode_output(data):
-                    for encoding in ['utf-8', 'gbk', 'gb2312', 'latin-1']:
-                        try:
-                            return data.decode(encoding)
-                        except (UnicodeDecodeError, LookupError):
-                            continue
-                    # 如果所有编码都失败，使用 replace 模式
-                    return data.decode('utf-8', errors='replace')
-
-                stdout = decode_output(result.stdout)
-                stderr = decode_output(result.stderr)
-
-                # 检查命令是否成功
-                if result.returncode == 0:
-                    # 如果提供了任务ID，更新测试任务状态
-                    if task_id:
-                        try:
-                            from app.models.models import TestTask
-                            test_task = TestTask.query.get(task_id)
-                            if test_task and test_task.status == 'running':
-                                test_task.status = 'completed'
-                                test_task.completed_time = datetime.now(timezone(timedelta(hours=8)))
-                                db.session.commit()
-                        except Exception as e:
-                            # 更新任务状态失败，不影响脚本执行结果
-                            pass
-                    
-                    return success_response({
-                        'stdout': stdout,
-                        'stderr': stderr,
-                        'exit_code': result.returncode,
-                        'message': 'Python 脚本执行成功'
-                    })
-                else:
-                    error_message = stderr or stdout or "Python 脚本执行失败"
-                    return error_response(500, f"Python 脚本执行失败: {error_message}")
-            except Exception as e:
-                # 清理临时文件
-                if os.path.exists(temp_script_path):
-                    os.unlink(temp_script_path)
-                raise e
-            finally:
-                # 清理临时文件
-                if os.path.exists(temp_script_path):
-                    os.unlink(temp_script_path)
-
-        else:
-            return error_response(400, "不支持的任务类型")
+        error_message = result['stderr'] or result['stdout'] or result['message']
+        return error_response(500, f"{result['message']}: {error_message}")
 
-    except subprocess.CalledProcessError as e:
-        stderr = e.stderr or ""
-        # 检查是否是设备断开连接导致的错误
-        if "disconnected" in stderr.lower() or "offline" in stderr.lower():
-            return error_response(500, "设备已断开连接")
-        # 检查是否是找不到设备导致的错误
-        elif "device not found" in stderr.lower() or "no devices/emulators found" in stderr.lower():
-            return error_response(500, "找不到设备")
-        # 其他错误返回简化的错误信息
-        else:
-            return error_response(500, "任务执行失败")
     except FileNotFoundError as e:
         # 检查是找不到adb.exe还是找不到脚本文件
         if "adb.exe" in str(e) or "adb" in str(e):
@@ -711,6 +571,157 @@ def execute_task(device_id):
             return error_response(500, "任务执行失败")
 
 
+def _start_streaming_task(serial, task_type, command, file_path, file_content, script_args, task_id, priority,
+                          file_hash=''):
+    """在执行器中后台执行设备任务，输出实时写入输出流"""
+    output_stream = output_streams.create(serial)
+    app = current_app._get_current_object()
+
+    def finish(future):
+        try:
+            result = future.result()
+        except Exception as e:
+            message = str(e) if isinstance(e, DeviceLeaseError) else f'任务执行失败: {str(e)}'
+            result = {'success': False, 'message': message, 'stdout': '', 'stderr': '',
+                      'exit_code': None, 'finished_at': datetime.now().isoformat()}
+        # 未流式输出的内容（APK 安装输出、adb 错误信息等）在结束时补充写入
+        output_stream.write((result.get('stdout') or '').encode('utf-8'))
+        output_stream.write((result.get('stderr') or '').encode('utf-8'))
+        if result['success']:
+            with app.app_context():
+                _complete_test_task(task_id)
+        output_stream.close({
+            'success': result['success'],
+            'message': result['message'],
+            'exit_code': result['exit_code'],
+            'finished_at': result['finished_at']
+        })
+
+    # 取得设备租约后才在执行器中执行，结束时由回调补充输出并关闭输出流
+    submit_leased_device_task(
+        serial, task_type, task_id=task_id, priority=priority,
+        command=command, file_path=file_path, file_content=file_content, file_hash=file_hash,
+        script_args=script_args, timeout=device_executor.device_timeout,
+        on_output=lambda _, data: output_stream.write(data)
+    ).add_done_callback(finish)
+    return output_stream
+
+
+@bp.route('/inventory', methods=['POST'])
+@login_required
+def collect_device_inventory():
+    """采集设备信息（型号、系统版本、硬件规格），未指定设备时采集所有已连接设备"""
+    data = request.get_json(silent=True) or {}
+    serials = data.get('device_ids') or []
+    register_new = bool(data.get('register_new', True))  # 未登记的设备是否自动创建
+
+    try:
+        if not serials:
+            serials = [entry['serial'] for entry in _list_adb_devices() if entry['state'] == 'device']
+        if not serials:
+            return error_response(400, "没有已连接的设备")
+
+        results = collect_inventory(serials)
+        summary = save_inventory(results, register_new=register_new)
+
+        log_user_action("采集设备信息", f"设备数量: {len(serials)}")
+
+        return success_response({
+            'results': results,
+            'total': len(results),
+            'success_count': sum(1 for r in results if r['success']),
+            'failed_count': sum(1 for r in results if not r['success']),
+            'updated': summary['updated'],
+            'created': summary['created']
+        }, "设备信息采集完成")
+    except AdbError as e:
+        db.session.rollback()
+        return error_response(500, f"执行adb命令失败: {str(e)}")
+    except Exception as e:
+        db.session.rollback()
+        return error_response(500, f"采集设备信息失败: {str(e)}")
+
+
+@bp.route('/<int:device_id>/hardware', methods=['GET'])
+@login_required
+def get_device_hardware(device_id):
+    """获取设备硬件规格"""
+    device = Device.query.get_or_404(device_id)
+    return success_response({
+        'hardware': device.hardware_spec.to_dict() if device.hardware_spec else None
+    })
+
+
+@bp.route('/leases', methods=['GET'])
+@login_required
+def get_device_leases():
+    """获取当前设备租约（哪些设备正被哪些任务占用）"""
+    try:
+        return success_response({
+            'leases': device_leases.list_leases()
+        })
+    except Exception as e:
+        return error_response(500, f"获取设备租约失败: {str(e)}")
+
+
+@bp.route('/streams/<stream_id>', methods=['GET'])
+@login_required
+def get_task_output(stream_id):
+    """按偏移量增量获取流式任务的输出，wait 参数可用于长轮询"""
+    output_stream = output_streams.get(stream_id)
+    if not output_stream:
+        return error_response(404, "输出流不存在或已过期")
+
+    offset = request.args.get('offset', 0, type=int)
+    limit = min(request.args.get('limit', 64 * 1024, type=int), 1024 * 1024)
+    wait = min(request.args.get('wait', 0, type=float), 30)
+    return success_response(output_stream.read(offset, limit, wait))
+
+
+@bp.route('/streams/<stream_id>/events', methods=['GET'])
+@login_required
+def stream_task_output(stream_id):
+    """以 SSE 推送流式任务的输出，事件 ID 为偏移量，断线重连时通过 Last-Event-ID 继续"""
+    output_stream = output_streams.get(stream_id)
+    if not output_stream:
+        return error_response(404, "输出流不存在或已过期")
+
+    offset = request.headers.get('Last-Event-ID', type=int)
+    if offset is None:
+        offset = request.args.get('offset', 0, type=int)
+
+    def generate(offset):
+        while True:
+            chunk = output_stream.read(offset, 64 * 1024, wait=15)
+            if chunk['data']:
+                payload = json.dumps({'data': chunk['data'], 'offset': chunk['offset']}, ensure_ascii=False)
+                yield f"id: {chunk['next_offset']}\nevent: output\ndata: {payload}\n\n"
+            elif not chunk['finished']:
+                # 保持连接
+                yield ': keepalive\n\n'
+            offset = chunk['next_offset']
+            if chunk['finished']:
+                yield f"event: end\ndata: {json.dumps(chunk['result'], ensure_ascii=False)}\n\n"
+                return
+
+    return Response(
+        stream_with_context(generate(offset)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+def _run_batch(device_ids, task_type, command, file_path, file_content=None, task_id=None, file_hash=''):
+    """
+    在多台设备上并发执行同一任务，单设备失败或超时不影响其他设备的结果；
+    每台设备租用后才执行，被其他任务占用的设备排队等待空闲
+    """
+    return run_batch_device_task(
+        device_ids, task_type, command=command, file_path=file_path, file_content=file_content or '',
+        task_id=task_id, file_hash=file_hash
+    )
+
+
 @bp.route('/batch-tasks', methods=['POST'])
 @login_required
 def execute_batch_tasks():
@@ -722,211 +733,17 @@ def execute_batch_tasks():
     command = data.get('command', '')
     file_path = data.get('file_path', '')
     file_content = data.get('file_content', '')
+    file_hash = data.get('file_hash', '')  # 可选的已缓存安装包MD5，未提供 file_path/file_content 时按它取本地缓存的安装包
     task_id = data.get('task_id')  # 可选的测试任务ID，用于执行完成后更新任务状态
 
     if not device_ids:
         return error_response(400, "请选择设备")
 
-    results = []
-
-    for device_id in device_ids:
-        try:
-            # 计算项目根目录路径
-            project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
-
-            if task_type == 'install' and (file_path or file_content):
-                # 安装 APK
-                adb_path = os.path.join(
-                    project_root,
-                    'escrcpy', 'electron', 'resources', 'extra', 'win', 'scrcpy', 'adb.exe'
-                )
-
-                # 构建环境变量
-                env = os.environ.copy()
-                env['ADB'] = adb_path
-
-                # 如果有文件内容，先保存到临时文件
-                if file_content:
-                    import tempfile
-                    import base64
-                    # 解码base64数据
-                    if file_content.startswith('data:application/vnd.android.package-archive;base64,'):
-                        file_data = base64.b64decode(file_content.split(',')[1])
-                        with tempfile.NamedTemporaryFile(mode='wb', suffix='.apk', delete=False) as f:
-                            f.write(file_data)
-                            file_path = f.name
-
-                # 构建完整的命令
-                command_parts = [adb_path, '-s', str(device_id), 'install', '-r', file_path]
-
-                # 执行安装命令
-                result = subprocess.run(
-                    command_parts,
-                    capture_output=True,
-                    text=True,
-                    check=False,
-                    env=env,
-                    encoding='utf-8',
-                    errors='ignore'
-                )
-
-                # 清理临时文件
-                if file_content and os.path.exists(file_path):
-                    os.unlink(file_path)
-
-                results.append({
-                    'device_id': device_id,
-                    'success': result.returncode == 0,
-                    'message': '应用安装成功' if result.returncode == 0 else '应用安装失败',
-                    'output': result.stdout or result.stderr
-                })
-
-            elif task_type == 'shell':
-                # 执行 Shell 脚本
-                adb_path = os.path.join(
-                    project_root,
-                    'escrcpy', 'electron', 'resources', 'extra', 'win', 'scrcpy', 'adb.exe'
-                )
-
-                # 构建环境变量
-                env = os.environ.copy()
-                env['ADB'] = adb_path
-
-                if file_content:
-                    # 执行脚本内容
-                    command_parts = [adb_path, '-s', str(device_id), 'shell', file_content]
-                elif file_path:
-                    # 执行脚本文件
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        script_content = f.read()
-                    command_parts = [adb_path, '-s', str(device_id), 'shell', script_content]
-                elif command:
-                    # 执行命令
-                    command_parts = [adb_path, '-s', str(device_id), 'shell'] + command.split()
-                else:
-                    results.append({
-                        'device_id': device_id,
-                        'success': False,
-                        'message': '请提供脚本文件或命令',
-                        'output': ''
-                    })
-                    continue
-
-                # 执行 Shell 命令
-                result = subprocess.run(
-                    command_parts,
-                    capture_output=True,
-                    text=True,
-                    check=False,
-                    env=env,
-                    encoding='utf-8',
-                    errors='ignore'
-                )
-
-                results.append({
-                    'device_id': device_id,
-                    'success': result.returncode == 0,
-                    'message': '命令执行成功' if result.returncode == 0 else '命令执行失败',
-                    'output': result.stdout or result.stderr
-                })
-
-            elif task_type == 'python':
-                # 执行 Python 脚本（使用本地Python解释器）
-                import tempfile
-                import sys
-                
-                if file_content:
-                    # 执行 Python 脚本内容
-                    script_content = file_content
-                elif file_path:
-                    # 执行 Python 脚本文件
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        script_content = f.read()
-                else:
-                    # 直接执行 Python 命令
-                    script_content = command
-
-                # 保存到临时文件
-                with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False, encoding='utf-8') as f:
-                    f.write(script_content)
-                    temp_script_path = f.name
-
-                try:
-                    # 设置环境变量，传递设备ID
-                    env = os.environ.copy()
-                    env['DEVICE_ID'] = str(device_id)
-                    env['ADB_PATH'] = os.path.join(
-                        os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
-                        'escrcpy', 'electron', 'resources', 'extra', 'win', 'scrcpy', 'adb.exe'
-                    )
-
-                    # 添加参数
-                    python_args = [temp_script_path]
-                    if command and not file_content and not file_path:
-                        python_args.extend(command.split())
-
-                    # 使用字节流捕获输出，避免编码问题
-                    result = subprocess.run(
-                        [sys.executable] + python_args,
-                        capture_output=True,
-                        check=False,
-                        env=env
-                    )
-
-                    # 尝试多种编码方式解码输出
-                    def decode_output(data):
-                        for encoding in ['utf-8', 'gbk', 'gb2312', 'latin-1']:
-                            try:
-                                return data.decode(encoding)
-                            except (UnicodeDecodeError, LookupError):
-                                continue
-                        return data.decode('utf-8', errors='replace')
-
-                    stdout = decode_output(result.stdout)
-                    stderr = decode_output(result.stderr)
-
-                    results.append({
-                        'device_id': device_id,
-                        'success': result.returncode == 0,
-                        'message': 'Python 脚本执行成功' if result.returncode == 0 else 'Python 脚本执行失败',
-                        'output': stdout or stderr
-                    })
-                except Exception as e:
-                    # 清理临时文件
-                    if os.path.exists(temp_script_path):
-                        os.unlink(temp_script_path)
-                    results.append({
-                        'device_id': device_id,
-                        'success': False,
-                        'message': f'任务执行失败: {str(e)}',
-                        'output': ''
-                    })
-                finally:
-                    # 清理临时文件
-                    if os.path.exists(temp_script_path):
-                        os.unlink(temp_script_path)
-
-        except Exception as e:
-            results.append({
-                'device_id': device_id,
-                'success': False,
-                'message': f'任务执行失败: {str(e)}',
-                'output': ''
-            })
+    results = _run_batch(device_ids, task_type, command, file_path, file_content, task_id, file_hash)
 
     # 如果提供了任务ID，更新测试任务状态
-    if task_id:
-        try:
-            from app.models.models import TestTask
-            test_task = TestTask.query.get(task_id)
-            if test_task and test_task.status == 'running':
-                test_task.status = 'completed'
-                test_task.completed_time = datetime.now(timezone(timedelta(hours=8)))
-                db.session.commit()
-        except Exception as e:
-            # 更新任务状态失败，不影响脚本执行结果
-            pass
-    
+    _complete_test_task(task_id)
+
     return success_response({
         'results': results,
         'total': len(results),
@@ -935,193 +752,13 @@ def execute_batch_tasks():
     })
 
 
-def execute_batch_task_wrapper(device_ids, task_type, command, file_path, file_content=None, task_id=None):
+def execute_batch_task_wrapper(device_ids, task_type, command, file_path, file_content=None, task_id=None, file_hash=''):
     """批量执行任务的包装函数，用于定时任务调用"""
-    results = []
-
-    for device_id in device_ids:
-        try:
-            # 计算项目根目录路径
-            project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
-
-            if task_type == 'install' and (file_path or file_content):
-                # 安装 APK
-                adb_path = os.path.join(
-                    project_root,
-                    'escrcpy', 'electron', 'resources', 'extra', 'win', 'scrcpy', 'adb.exe'
-                )
-
-                env = os.environ.copy()
-                env['ADB'] = adb_path
-
-                # 如果有文件内容，先保存到临时文件
-                if file_content:
-                    import tempfile
-                    import base64
-                    # 解码base64数据
-                    if file_content.startswith('data:application/vnd.android.package-archive;base64,'):
-                        file_data = base64.b64decode(file_content.split(',')[1])
-                        with tempfile.NamedTemporaryFile(mode='wb', suffix='.apk', delete=False) as f:
-                            f.write(file_data)
-                            file_path = f.name
-
-                command_parts = [adb_path, '-s', str(device_id), 'install', '-r', file_path]
-
-                result = subprocess.run(
-                    command_parts,
-                    capture_output=True,
-                    text=True,
-                    check=False,
-                    env=env,
-                    encoding='utf-8',
-                    errors='ignore'
-                )
-
-                # 清理临时文件
-                if file_content and os.path.exists(file_path):
-                    os.unlink(file_path)
-
-                results.append({
-                    'device_id': device_id,
-                    'success': result.returncode == 0,
-                    'message': '应用安装成功' if result.returncode == 0 else '应用安装失败',
-                    'output': result.stdout or result.stderr
-                })
-
-            elif task_type == 'shell':
-                # 执行 Shell 脚本
-                adb_path = os.path.join(
-                    project_root,
-                    'escrcpy', 'electron', 'resources', 'extra', 'win', 'scrcpy', 'adb.exe'
-                )
-
-                env = os.environ.copy()
-                env['ADB'] = adb_path
-
-                if file_content:
-                    # 执行脚本内容
-                    command_parts = [adb_path, '-s', str(device_id), 'shell', file_content]
-                elif file_path:
-                    # 执行脚本文件
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        script_content = f.read()
-                    command_parts = [adb_path, '-s', str(device_id), 'shell', script_content]
-                elif command:
-                    # 执行命令
-                    command_parts = [adb_path, '-s', str(device_id), 'shell'] + command.split()
-                else:
-                    results.append({
-                        'device_id': device_id,
-                        'success': False,
-                        'message': '请提供脚本文件或命令',
-                        'output': ''
-                    })
-                    continue
-
-                result = subprocess.run(
-                    command_parts,
-                    capture_output=True,
-                    text=True,
-                    check=False,
-                    env=env,
-                    encoding='utf-8',
-                    errors='ignore'
-                )
-
-                results.append({
-                    'device_id': device_id,
-                    'success': result.returncode == 0,
-                    'message': '命令执行成功' if result.returncode == 0 else '命令执行失败',
-                    'output': result.stdout or result.stderr
-                })
-
-            elif task_type == 'python':
-                # 执行 Python 脚本（使用本地Python解释器）
-                import tempfile
-                import sys
-                
-                if file_content:
-                    # 执行 Python 脚本内容
-                    script_content = file_content
-                elif file_path:
-                    # 执行 Python 脚本文件
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        script_content = f.read()
-                else:
-                    # 直接执行 Python 命令
-                    script_content = command
-
-                # 保存到临时文件
-                with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False, encoding='utf-8') as f:
-                    f.write(script_content)
-                    temp_script_path = f.name
-
-                try:
-                    # 设置环境变量，传递设备ID
-                    env = os.environ.copy()
-                    env['DEVICE_ID'] = str(device_id)
-                    env['ADB_PATH'] = os.path.join(
-                        os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
-                        'escrcpy', 'electron', 'resources', 'extra', 'win', 'scrcpy', 'adb.exe'
-                    )
-
-                    # 添加参数
-                    python_args = [temp_script_path]
-                    if command and not file_content and not file_path:
-                        python_args.extend(command.split())
-
-                    # 使用字节流捕获输出，避免编码问题
-                    result = subprocess.run(
-                        [sys.executable] + python_args,
-                        capture_output=True,
-                        check=False,
-                        env=env
-                    )
-
-                    # 尝试多种编码方式解码输出
-                    def decode_output(data):
-                        for encoding in ['utf-8', 'gbk', 'gb2312', 'latin-1']:
-                            try:
-                                return data.decode(encoding)
-                            except (UnicodeDecodeError, LookupError):
-                                continue
-                        return data.decode('utf-8', errors='replace')
-
-                    stdout = decode_output(result.stdout)
-                    stderr = decode_output(result.stderr)
-
-                    results.append({
-                        'device_id': device_id,
-                        'success': result.returncode == 0,
-                        'message': 'Python 脚本执行成功' if result.returncode == 0 else 'Python 脚本执行失败',
-                        'output': stdout or stderr
-                    })
-                finally:
-                    # 清理临时文件
-                    if os.path.exists(temp_script_path):
-                        os.unlink(temp_script_path)
-
-        except Exception as e:
-            results.append({
-                'device_id': device_id,
-                'success': False,
-                'message': f'任务执行失败: {str(e)}',
-                'output': ''
-            })
+    results = _run_batch(device_ids, task_type, command, file_path, file_content, task_id, file_hash)
 
     # 如果提供了任务ID，更新测试任务状态
-    if task_id:
-        try:
-            from app.models.models import TestTask
-            test_task = TestTask.query.get(task_id)
-            if test_task and test_task.status == 'running':
-                test_task.status = 'completed'
-                test_task.completed_time = datetime.now(timezone(timedelta(hours=8)))
-                db.session.commit()
-        except Exception as e:
-            # 更新任务状态失败，不影响脚本执行结果
-            pass
-    
+    _complete_test_task(task_id)
+
     return results
 
 
@@ -1200,6 +837,9 @@ def schedule_batch_tasks():
         db.session.add(test_task)
         db.session.commit()
 
+        # 注册到调度器，到达计划时间后自动在各设备上执行
+        device_dispatcher.schedule(test_task)
+
         log_user_action("创建定时任务", f"测试任务ID: {test_task.id}, 执行时间: {scheduled_time_str}, 设备数量: {len(device_ids)}")
 
         return success_response({
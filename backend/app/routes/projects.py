@@ -1,6 +1,8 @@
 from flask import Blueprint, request, jsonify
 from app.models.models import db, Project, ProjectMember, User, VersionRequirement, Iteration
 from flask_login import login_required, current_user
+from sqlalchemy.orm import joinedload
+from app.utils.project_stats import get_project_stats
 from datetime import datetime
 import json
 
@@ -111,8 +113,8 @@ def get_projects():
         status = request.args.get('status', '', type=str)
         priority = request.args.get('priority', '', type=str)
         
-        # 构建基础查询，返回所有项目
-        query = Project.query
+        # 构建基础查询，返回所有项目（负责人、创建者随项目一起查出）
+        query = Project.query.options(joinedload(Project.owner), joinedload(Project.creator))
         
         # 应用搜索条件，使用二进制比较实现严格区分大小写
         if search:
@@ -130,8 +132,9 @@ def get_projects():
         # 执行分页查询
         pagination = query.paginate(page=page, per_page=size, error_out=False)
         
-        # 转换为字典列表
-        project_list = [project.to_dict() for project in pagination.items]
+        # 转换为字典列表（整页项目的统计一次算好）
+        stats = get_project_stats(project.id for project in pagination.items)
+        project_list = [project.to_dict(stats=stats[project.id]) for project in pagination.items]
         
         # 返回包含分页信息的结果
         return jsonify({
@@ -1,7 +1,8 @@
 from flask import Blueprint, request
 from flask_login import login_required, current_user
 
-from app.models.models import TestCase, db, TestSuite
+from app.models.models import TestCase, db, TestSuite, case_number_seq
+from app.utils.case_sequence import advance_case_sequence, suite_case_prefix
 from app.utils.helpers import (
     success_response, error_response, get_pagination_params, log_user_action,
     validate_json_data
@@ -137,18 +138,18 @@ def create_test_case():
         if not suite:
             return error_response(400, "指定的测试套件不存在")
     
-    # 验证用例编号格式：xxx-xxx-xxx001～xxx-xxx-xxx999，主要识别后三位数字（001-999）
+    # 验证用例编号格式：xxx-xxx-xxx001 起，末尾序号至少 3 位（超过 999 后为 xxx-xxx-xxx1000）
     case_number = data.get('case_number', '')
+    case_seq = None
     if case_number:
         import re
-        # 格式：三段前缀 + 后三位数字，或纯三位数字（导入用）
-        if not re.match(r'^.+-.+-.+\d{3}$', case_number) and not re.match(r'^\d{3}$', case_number):
-            return error_response(400, "用例编号格式不正确，应为：xxx-xxx-xxx001～xxx-xxx-xxx999")
-        num_match = re.search(r'\d{3}$', case_number)
-        if num_match:
-            num = int(num_match.group(0))
-            if num < 1 or num > 999:
-                return error_response(400, "用例编号后三位数字必须在001-999之间")
+        # 格式：三段前缀 + 末尾序号，或纯数字序号（导入用）
+        if not re.match(r'^.+-.+-.+\d{3}$', case_number) and not re.match(r'^\d{3,}$', case_number):
+            return error_response(400, "用例编号格式不正确，应为：xxx-xxx-xxx001")
+        # 按用例集已有用例的编号前缀解析尾号，前缀以数字结尾时不会与尾号混在一起
+        case_seq = case_number_seq(case_number, suite_case_prefix(data.get('suite_id')))
+        if (case_seq or 0) < 1:
+            return error_response(400, "用例编号末尾序号必须从001开始")
     
     # 使用前端传递的项目相关信息，优先使用前端传递的值，否则从套件获取
     # 支持前端传递ID或名称，名称需要额外处理（当前版本暂不支持名称匹配，优先使用套件信息）
@@ -174,9 +175,12 @@ def create_test_case():
         version_requirement_id=version_requirement_id,
         iteration_id=iteration_id
     )
+    test_case.case_seq = case_seq
     
     try:
         db.session.add(test_case)
+        # 手动填写的编号超过已分配的尾号时推进编号序号
+        advance_case_sequence(test_case.suite_id, test_case.case_seq)
         db.session.commit()
         
         log_user_action("创建测试用例", f"用例名称: {test_case.case_name}")
@@ -200,17 +204,20 @@ def update_test_case(case_id):
     # 更新字段
     if 'case_number' in data:
         case_number = data['case_number']
-        if case_number:
+        # 编号未修改时不再校验
+        if case_number and case_number != test_case.case_number:
             import re
-            # 格式：xxx-xxx-xxx001～xxx-xxx-xxx999，只识别后三位数字
+            # 格式：xxx-xxx-xxx001 起，末尾序号至少 3 位
             if not re.match(r'^.+-.+-.+\d{3}$', case_number):
-                return error_response(400, "用例编号格式不正确，应为：xxx-xxx-xxx001～xxx-xxx-xxx999")
-            num_match = re.search(r'\d{3}$', case_number)
-            if num_match:
-                num = int(num_match.group(0))
-                if num < 1 or num > 999:
-                    return error_response(400, "用例编号后三位数字必须在001-999之间")
-        test_case.case_number = case_number
+                return error_response(400, "用例编号格式不正确，应为：xxx-xxx-xxx001")
+            suite_id = data['suite_id'] if 'suite_id' in data else test_case.suite_id
+            case_seq = case_number_seq(case_number, suite_case_prefix(suite_id))
+            if (case_seq or 0) < 1:
+                return error_response(400, "用例编号末尾序号必须从001开始")
+            test_case.case_number = case_number
+            test_case.case_seq = case_seq
+        else:
+            test_case.case_number = case_number
     
     if 'case_name' in data:
         test_case.case_name = data['case_name']
@@ -279,6 +286,8 @@ def update_test_case(case_id):
         test_case.review_comments = data['review_comments']
     
     try:
+        # 修改编号或移动到其他用例集后，尾号超过已分配的尾号时推进编号序号
+        advance_case_sequence(test_case.suite_id, test_case.case_seq)
         db.session.commit()
         
         log_user_action("更新测试用例", f"用例ID: {case_id}")
@@ -3,6 +3,7 @@ from flask_login import login_required, current_user
 from datetime import datetime, timezone, timedelta
 
 from app.models.models import TestTask, db, TestSuite, TestCase, Device, TestCaseExecution, UserSetting, TEST_TASK_STATUS, TEST_EXECUTION_STATUS
+from app.utils.device_dispatcher import device_dispatcher
 from app.utils.helpers import (
     success_response, error_response, get_pagination_params, log_user_action,
     validate_json_data
@@ -178,6 +179,8 @@ def create_test_task():
         db.session.add(test_task)
         db.session.commit()
 
+        # 设置了计划时间的设备脚本任务到点自动执行
+        device_dispatcher.schedule(test_task)
         
         log_user_action("创建测试任务", f"任务名称: {test_task.task_name}")
         
@@ -328,6 +331,9 @@ def update_test_task(task_id):
     
     try:
         db.session.commit()
+
+        # 计划时间、状态或任务类型可能已变化，重新注册定时执行
+        device_dispatcher.schedule(test_task)
         
         log_user_action("更新测试任务", f"任务ID: {task_id}")
         
@@ -349,6 +355,8 @@ def delete_test_task(task_id):
     try:
         db.session.delete(test_task)
         db.session.commit()
+
+        device_dispatcher.unschedule(task_id)
         
         log_user_action("删除测试任务", f"任务名称: {test_task.task_name}")
         
@@ -635,6 +643,9 @@ def cancel_test_task(task_id):
         test_task.started_time = None
         test_task.completed_time = None
         db.session.commit()
+
+        # 取消后不再按计划时间自动执行
+        device_dispatcher.unschedule(task_id)
         
         log_user_action("取消测试任务", f"任务ID: {task_id}, 原状态: {original_status}")
         
@@ -0,0 +1,440 @@
+"""
+ADB 协议客户端
+直接通过 TCP 与本机 adb server（默认 5037 端口）通信，替代每条命令都启动一次 adb 进程，
+覆盖设备列表、设备状态、shell 命令、sync 推送文件以及 APK 安装
+"""
+import os
+import socket
+import struct
+import logging
+import subprocess
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ADB_HOST = '127.0.0.1'
+DEFAULT_ADB_PORT = 5037
+
+# shell v2 协议的数据包类型
+SHELL_ID_STDIN = 0
+SHELL_ID_STDOUT = 1
+SHELL_ID_STDERR = 2
+SHELL_ID_EXIT = 3
+SHELL_ID_CLOSE_STDIN = 4
+
+# sync 协议单个 DATA 包的最大长度
+SYNC_DATA_MAX = 64 * 1024
+
+# APK 安装时在设备上的临时目录
+REMOTE_TMP_DIR = '/data/local/tmp'
+
+
+class AdbError(Exception):
+    """adb server 返回 FAIL 或协议异常"""
+    pass
+
+
+class AdbConnectionError(AdbError):
+    """无法连接 adb server"""
+    pass
+
+
+class AdbTimeoutError(AdbError):
+    """等待设备响应超时，partial_stdout/partial_stderr 保存已收到的输出"""
+
+    def __init__(self, message, partial_stdout=b'', partial_stderr=b''):
+        super().__init__(message)
+        self.partial_stdout = partial_stdout
+        self.partial_stderr = partial_stderr
+
+
+class AdbConnection:
+    """与 adb server 的一条 TCP 连接"""
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+
+    def send_request(self, payload: str):
+        """发送一条 host 请求并检查 OKAY/FAIL"""
+        data = payload.encode('utf-8')
+        self.sock.sendall(b'%04x' % len(data) + data)
+        self.read_status()
+
+    def read_status(self):
+        status = self.read_exact(4)
+        if status == b'OKAY':
+            return
+        if status == b'FAIL':
+            raise AdbError(self.read_length_prefixed().decode('utf-8', errors='replace'))
+        raise AdbError(f'adb 协议异常，未知响应: {status!r}')
+
+    def read_length_prefixed(self) -> bytes:
+        """读取 4 位十六进制长度前缀的数据"""
+        length = int(self.read_exact(4), 16)
+        return self.read_exact(length) if length else b''
+
+    def read_exact(self, size: int) -> bytes:
+        chunks = []
+        remaining = size
+        while remaining > 0:
+            chunk = self.sock.recv(remaining)
+            if not chunk:
+                raise AdbError('adb server 意外关闭了连接')
+            chunks.append(chunk)
+            remaining -= len(chunk)
+        return b''.join(chunks)
+
+    def read_all(self) -> bytes:
+        """读取到连接关闭为止"""
+        chunks = []
+        while True:
+            chunk = self.sock.recv(65536)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        return b''.join(chunks)
+
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+class AdbClient:
+    """adb server 协议客户端（线程安全，每个请求使用独立连接）"""
+
+    def __init__(self, host: str = DEFAULT_ADB_HOST, port: int = DEFAULT_ADB_PORT,
+                 adb_path: Optional[str] = None, connect_timeout: float = 5):
+        self.host = host
+        self.port = port
+        self.adb_path = adb_path
+        self.connect_timeout = connect_timeout
+        # 关闭后设备任务回退为启动 adb 进程执行
+        self.enabled = True
+        self._start_lock = threading.Lock()
+        # shell v2 支持情况缓存：serial -> bool
+        self._shell_v2: Dict[str, bool] = {}
+
+    def configure(self, host: str = None, port: int = None, adb_path: str = None, enabled: bool = None):
+        """调整 adb server 地址、adb 可执行文件路径以及是否启用协议客户端"""
+        if enabled is not None:
+            self.enabled = enabled
+        if host:
+            self.host = host
+        if port:
+            self.port = int(port)
+        if adb_path:
+            self.adb_path = adb_path
+
+    # ------------------------------------------------------------------
+    # 连接管理
+    # ------------------------------------------------------------------
+
+    def _open_socket(self) -> socket.socket:
+        sock = socket.create_connection((self.host, self.port), timeout=self.connect_timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    def _start_server(self):
+        """adb server 未运行时，通过 adb start-server 拉起（仅此一次需要启动进程）"""
+        if not self.adb_path or not os.path.exists(self.adb_path):
+            raise AdbConnectionError(f'无法连接 adb server {self.host}:{self.port}，且找不到adb可执行文件')
+        with self._start_lock:
+            logger.info("adb server 未运行，正在启动")
+            subprocess.run(
+                [self.adb_path, '-P', str(self.port), 'start-server'],
+                capture_output=True, check=False, timeout=30
+            )
+
+    def connect(self, timeout: Optional[float] = None) -> AdbConnection:
+        """
+        建立到 adb server 的连接
+
+        Args:
+            timeout: 后续读写的超时时间（秒），None 表示不限制
+        """
+        try:
+            sock = self._open_socket()
+        except OSError:
+            self._start_server()
+            try:
+                sock = self._open_socket()
+            except OSError as e:
+                raise AdbConnectionError(f'无法连接 adb server {self.host}:{self.port}: {e}') from e
+        sock.settimeout(timeout)
+        return AdbConnection(sock)
+
+    def _transport(self, serial: str, timeout: Optional[float] = None) -> AdbConnection:
+        """建立连接并切换到指定设备"""
+        conn = self.connect(timeout)
+        try:
+            conn.send_request(f'host:transport:{serial}')
+        except Exception:
+            conn.close()
+            raise
+        return conn
+
+    # ------------------------------------------------------------------
+    # host 服务
+    # ------------------------------------------------------------------
+
+    def host_query(self, request: str) -> str:
+        """执行返回长度前缀数据的 host 请求"""
+        with self.connect(self.connect_timeout) as conn:
+            conn.send_request(request)
+            return conn.read_length_prefixed().decode('utf-8', errors='ignore')
+
+    def version(self) -> int:
+        return int(self.host_query('host:version'), 16)
+
+    def list_devices(self) -> List[Dict[str, str]]:
+        """
+        获取已连接的设备列表（等价于 adb devices -l）
+
+        Returns:
+            [{'serial': 序列号, 'state': 状态, 'info': 'product:xx model:xx ...'}]
+        """
+        return parse_devices_l(self.host_query('host:devices-l'))
+
+    def track_devices(self):
+        """
+        订阅设备变化（等价于 adb track-devices -l），连接保持打开，
+        每次设备列表变化时产出一次完整列表，格式同 list_devices
+        """
+        with self.connect(None) as conn:
+            conn.send_request('host:track-devices-l')
+            while True:
+                yield parse_devices_l(conn.read_length_prefixed().decode('utf-8', errors='ignore'))
+
+    def get_state(self, serial: str) -> str:
+        """获取设备状态（等价于 adb -s <serial> get-state），返回 device / offline / unauthorized 等"""
+        return self.host_query(f'host-serial:{serial}:get-state').strip()
+
+    # ------------------------------------------------------------------
+    # shell 服务
+    # ------------------------------------------------------------------
+
+    def supports_shell_v2(self, serial: str) -> bool:
+        """检查设备是否支持 shell v2（可区分 stdout/stderr 并返回退出码）"""
+        supported = self._shell_v2.get(serial)
+        if supported is None:
+            try:
+                features = self.host_query(f'host-serial:{serial}:features')
+            except AdbError:
+                # 设备暂不可用时不缓存，下次重新检查
+                return False
+            supported = 'shell_v2' in features.split(',')
+            self._shell_v2[serial] = supported
+        return supported
+
+    def shell(self, serial: str, command: str, timeout: Optional[float] = None,
+              on_output: Optional[Callable[[int, bytes], None]] = None) -> Tuple[int, bytes, bytes]:
+        """
+        在设备上执行 shell 命令
+
+        Args:
+            serial: 设备序列号
+            command: shell 命令
+            timeout: 超时时间（秒），超时抛出 AdbTimeoutError
+            on_output: 流式输出回调 (stream, data)，stream 为 1(stdout) / 2(stderr)；
+                传入后输出不再缓存，返回值中的 stdout/stderr 为空
+
+        Returns:
+            (exit_code, stdout, stderr)
+        """
+        if self.supports_shell_v2(serial):
+            return self._shell_v2_exec(serial, command, timeout, on_output)
+        return self._shell_v1_exec(serial, command, timeout, on_output)
+
+    def _shell_v2_exec(self, serial: str, command: str, timeout: Optional[float],
+                       on_output: Optional[Callable[[int, bytes], None]] = None) -> Tuple[int, bytes, bytes]:
+        stdout, stderr = [], []
+        exit_code = None
+        deadline = time.monotonic() + timeout if timeout else None
+        with self._transport(serial, timeout) as conn:
+            conn.send_request(f'shell,v2,raw:{command}')
+            try:
+                while True:
+                    if deadline is not None:
+                        conn.sock.settimeout(max(deadline - time.monotonic(), 0.001))
+                    try:
+                        header = conn.read_exact(5)
+                    except AdbError:
+                        # 连接关闭，命令结束
+                        break
+                    packet_id, length = struct.unpack('<BI', header)
+                    payload = conn.read_exact(length) if length else b''
+                    if packet_id in (SHELL_ID_STDOUT, SHELL_ID_STDERR) and on_output is not None:
+                        on_output(packet_id, payload)
+                    elif packet_id == SHELL_ID_STDOUT:
+                        stdout.append(payload)
+                    elif packet_id == SHELL_ID_STDERR:
+                        stderr.append(payload)
+                    elif packet_id == SHELL_ID_EXIT:
+                        exit_code = payload[0] if payload else 0
+                        break
+            except socket.timeout:
+                raise AdbTimeoutError(f'命令执行超时（{timeout}秒）', b''.join(stdout), b''.join(stderr))
+        return (exit_code if exit_code is not None else 0), b''.join(stdout), b''.join(stderr)
+
+    def _shell_v1_exec(self, serial: str, command: str, timeout: Optional[float],
+                       on_output: Optional[Callable[[int, bytes], None]] = None) -> Tuple[int, bytes, bytes]:
+        """旧设备不支持 shell v2 时，通过在命令末尾输出退出码来获取执行结果"""
+        marker = b'__MTP_EXIT__'
+        chunks = []
+        # 流式输出时保留末尾一段数据不回调，确保退出码标记不会被拆开输出
+        held = b''
+        hold_size = len(marker) + 8
+        deadline = time.monotonic() + timeout if timeout else None
+        with self._transport(serial, timeout) as conn:
+            # 放在子 shell 中执行，命令自身 exit 时仍能输出退出码
+            conn.send_request(f'shell:({command}\n); echo "{marker.decode()}$?"')
+            try:
+                while True:
+                    if deadline is not None:
+                        conn.sock.settimeout(max(deadline - time.monotonic(), 0.001))
+                    chunk = conn.sock.recv(65536)
+                    if not chunk:
+                        break
+                    if on_output is None:
+                        chunks.append(chunk)
+                        continue
+                    held += chunk
+                    # 不在 \r\n 中间切开
+                    cut = len(held) - hold_size
+                    if cut > 0 and held[cut - 1:cut] == b'\r':
+                        cut -= 1
+                    if cut > 0:
+                        on_output(SHELL_ID_STDOUT, held[:cut].replace(b'\r\n', b'\n'))
+                        held = held[cut:]
+            except socket.timeout:
+                if on_output is not None:
+                    on_output(SHELL_ID_STDOUT, held.replace(b'\r\n', b'\n'))
+                raise AdbTimeoutError(f'命令执行超时（{timeout}秒）', b''.join(chunks))
+        output = (held if on_output is not None else b''.join(chunks)).replace(b'\r\n', b'\n')
+        exit_code = 0
+        index = output.rfind(marker)
+        if index != -1:
+            code = output[index + len(marker):].strip()
+            exit_code = int(code) if code.isdigit() else 0
+            output = output[:index]
+        if on_output is not None:
+            on_output(SHELL_ID_STDOUT, output)
+            return exit_code, b'', b''
+        return exit_code, output, b''
+
+    # ------------------------------------------------------------------
+    # sync 服务
+    # ------------------------------------------------------------------
+
+    def push(self, serial: str, local_path: str, remote_path: str, mode: int = 0o644,
+             timeout: Optional[float] = None):
+        """
+        推送本地文件到设备（等价于 adb push）
+
+        Args:
+            serial: 设备序列号
+            local_path: 本地文件路径
+            remote_path: 设备上的目标路径
+            mode: 文件权限
+            timeout: 超时时间（秒）
+        """
+        with open(local_path, 'rb') as f, self._transport(serial, timeout) as conn:
+            conn.send_request('sync:')
+            spec = f'{remote_path},{0o100000 | mode}'.encode('utf-8')
+            conn.sock.sendall(b'SEND' + struct.pack('<I', len(spec)) + spec)
+            while True:
+                chunk = f.read(SYNC_DATA_MAX)
+                if not chunk:
+                    break
+                conn.sock.sendall(b'DATA' + struct.pack('<I', len(chunk)) + chunk)
+            mtime = int(os.path.getmtime(local_path))
+            conn.sock.sendall(b'DONE' + struct.pack('<I', mtime))
+            status = conn.read_exact(4)
+            length = struct.unpack('<I', conn.read_exact(4))[0]
+            if status == b'FAIL':
+                raise AdbError(conn.read_exact(length).decode('utf-8', errors='replace'))
+            if status != b'OKAY':
+                raise AdbError(f'adb sync 协议异常，未知响应: {status!r}')
+            conn.sock.sendall(b'QUIT' + struct.pack('<I', 0))
+
+    def stat(self, serial: str, remote_path: str, timeout: Optional[float] = None) -> Tuple[int, int, int]:
+        """
+        查询设备上文件的信息（sync STAT）
+
+        Returns:
+            (mode, size, mtime)，文件不存在时全部为 0
+        """
+        with self._transport(serial, timeout) as conn:
+            conn.send_request('sync:')
+            path = remote_path.encode('utf-8')
+            conn.sock.sendall(b'STAT' + struct.pack('<I', len(path)) + path)
+            response = conn.read_exact(16)
+            if response[:4] != b'STAT':
+                raise AdbError(f'adb sync 协议异常，未知响应: {response[:4]!r}')
+            conn.sock.sendall(b'QUIT' + struct.pack('<I', 0))
+            return struct.unpack('<III', response[4:])
+
+    def install(self, serial: str, apk_path: str, reinstall: bool = True,
+                timeout: Optional[float] = None) -> Tuple[int, bytes, bytes]:
+        """
+        安装 APK（推送到设备临时目录后调用 pm install）
+
+        Returns:
+            (exit_code, stdout, stderr)，pm 输出中包含 Success 视为安装成功
+        """
+        remote_path = f'{REMOTE_TMP_DIR}/mtp_{os.getpid()}_{threading.get_ident()}.apk'
+        self.push(serial, apk_path, remote_path, timeout=timeout)
+        try:
+            flags = '-r ' if reinstall else ''
+            exit_code, stdout, stderr = self.shell(serial, f'pm install {flags}"{remote_path}"', timeout)
+        finally:
+            try:
+                self.shell(serial, f'rm -f "{remote_path}"', timeout=30)
+            except AdbError:
+                pass
+        if b'Success' not in stdout and exit_code == 0:
+            exit_code = 1
+        return exit_code, stdout, stderr
+
+
+def parse_devices_l(output: str) -> List[Dict[str, str]]:
+    """解析 devices -l 的输出"""
+    devices = []
+    for line in output.splitlines():
+        line = line.strip()
+        if not line or line.startswith('List of devices'):
+            continue
+        parts = line.split(None, 2)
+        if len(parts) < 2:
+            continue
+        devices.append({
+            'serial': parts[0],
+            'state': parts[1],
+            'info': parts[2] if len(parts) > 2 else ''
+        })
+    return devices
+
+
+# 全局 adb 客户端实例
+adb_client = AdbClient()
+
+
+def init_adb_client(app):
+    """根据应用配置初始化 adb 客户端"""
+    from app.utils.device_executor import get_adb_path
+    adb_client.configure(
+        host=app.config.get('ADB_SERVER_HOST'),
+        port=app.config.get('ADB_SERVER_PORT'),
+        adb_path=get_adb_path(),
+        enabled=app.config.get('ADB_USE_NATIVE_CLIENT', True)
+    )
@@ -0,0 +1,307 @@
+"""
+AI 生成结果缓存
+同一需求文档反复生成用例时，提示词、模型和温度都相同，直接返回上次解析出的测试用例，不再调用 AI 接口。
+缓存键为 system 提示词、用户提示词、模型和温度的 SHA-256；支持两种存储：
+- disk：每条缓存一个 JSON 文件，保存在 AI_CACHE_PATH 目录，适用于单机部署
+- sql：保存在 ai_response_cache 表中，多个应用进程共享
+缓存超过保留时间后失效，条数超过上限时淘汰最久未使用的
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from app.models.models import db, AIResponseCache, LOCAL_TIMEZONE
+
+logger = logging.getLogger(__name__)
+
+
+def cache_key(prompt: str, model: str, temperature: float, system: str = '') -> str:
+    """缓存键：system 提示词、用户提示词、模型和温度的 SHA-256"""
+    digest = hashlib.sha256()
+    for part in (system or '', prompt or '', model or '', repr(float(temperature or 0))):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class AICacheStore(ABC):
+    """缓存存储接口"""
+
+    def __init__(self, ttl_hours: float = 72, max_entries: int = 500):
+        self.ttl_hours = ttl_hours
+        self.max_entries = max_entries
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def set(self, key: str, model: str, value: List[Dict[str, Any]]) -> int:
+        """写入缓存，返回因超出上限或过期淘汰的条数"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def count(self) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    def clear(self) -> int:
+        raise NotImplementedError
+
+
+class DiskAICacheStore(AICacheStore):
+    """
+    磁盘存储：<cache_dir>/<key>.json
+    文件修改时间为写入时间（判断过期），访问时间为最近使用时间（淘汰依据，命中时主动更新）
+    """
+
+    def __init__(self, cache_dir: str, ttl_hours: float = 72, max_entries: int = 500):
+        super().__init__(ttl_hours, max_entries)
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f'{key}.json')
+
+    def _files(self) -> List[str]:
+        try:
+            return [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir) if name.endswith('.json')]
+        except OSError:
+            return []
+
+    def get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        path = self._path(key)
+        try:
+            stat = os.stat(path)
+            if time.time() - stat.st_mtime > self.ttl_hours * 3600:
+                os.unlink(path)
+                return None
+            with open(path, 'r', encoding='utf-8') as f:
+                value = json.load(f)
+            # 只更新访问时间，保留写入时间
+            os.utime(path, (time.time(), stat.st_mtime))
+            return value
+        except (OSError, ValueError):
+            return None
+
+    def set(self, key: str, model: str, value: List[Dict[str, Any]]) -> int:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key)
+        temp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(value, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+        return self._prune()
+
+    def _prune(self) -> int:
+        """删除过期的缓存，超过上限时再删除最久未使用的"""
+        with self._lock:
+            now = time.time()
+            entries = []
+            removed = 0
+            for path in self._files():
+                try:
+                    stat = os.stat(path)
+                    if now - stat.st_mtime > self.ttl_hours * 3600:
+                        os.unlink(path)
+                        removed += 1
+                    else:
+                        entries.append((stat.st_atime, path))
+                except OSError:
+                    continue
+            if self.max_entries and len(entries) > self.max_entries:
+                entries.sort()
+                for _, path in entries[:len(entries) - self.max_entries]:
+                    try:
+                        os.unlink(path)
+                        removed += 1
+                    except OSError:
+                        pass
+            return removed
+
+    def count(self) -> int:
+        return len(self._files())
+
+    def clear(self) -> int:
+        removed = 0
+        for path in self._files():
+            try:
+                os.unlink(path)
+                removed += 1
+            except OSError:
+                pass
+        return removed
+
+
+class SqlAICacheStore(AICacheStore):
+    """数据库存储（ai_response_cache 表），在后台线程中使用时自行推入应用上下文"""
+
+    def __init__(self, app, ttl_hours: float = 72, max_entries: int = 500):
+        super().__init__(ttl_hours, max_entries)
+        self._app = app
+
+    def get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        now = datetime.now(LOCAL_TIMEZONE)
+        with self._app.app_context():
+            try:
+                record = AIResponseCache.query.filter(
+                    AIResponseCache.cache_key == key,
+                    AIResponseCache.created_at >= now - timedelta(hours=self.ttl_hours)
+                ).first()
+                if record is None:
+                    return None
+                value = json.loads(record.response)
+                AIResponseCache.query.filter_by(cache_key=key).update(
+                    {'last_used_at': now, 'hit_count': AIResponseCache.hit_count + 1}, synchronize_session=False
+                )
+                db.session.commit()
+                return value
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"读取AI生成结果缓存失败: {e}")
+                return None
+
+    def set(self, key: str, model: str, value: List[Dict[str, Any]]) -> int:
+        now = datetime.now(LOCAL_TIMEZONE)
+        with self._app.app_context():
+            try:
+                db.session.merge(AIResponseCache(
+                    cache_key=key,
+                    model=(model or '')[:100],
+                    response=json.dumps(value, ensure_ascii=False),
+                    hit_count=0,
+                    created_at=now,
+                    last_used_at=now
+                ))
+                db.session.commit()
+                return self._prune(now)
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"写入AI生成结果缓存失败: {e}")
+                return 0
+
+    def _prune(self, now: datetime) -> int:
+        """删除过期的缓存，超过上限时再删除最久未使用的，需在应用上下文中调用"""
+        removed = AIResponseCache.query.filter(
+            AIResponseCache.created_at < now - timedelta(hours=self.ttl_hours)
+        ).delete(synchronize_session=False)
+        excess = AIResponseCache.query.count() - self.max_entries if self.max_entries else 0
+        if excess > 0:
+            oldest = [key for (key,) in db.session.query(AIResponseCache.cache_key).order_by(
+                AIResponseCache.last_used_at.asc()
+            ).limit(excess)]
+            removed += AIResponseCache.query.filter(AIResponseCache.cache_key.in_(oldest)).delete(synchronize_session=False)
+        db.session.commit()
+        return removed
+
+    def count(self) -> int:
+        with self._app.app_context():
+            return AIResponseCache.query.count()
+
+    def clear(self) -> int:
+        with self._app.app_context():
+            try:
+                removed = AIResponseCache.query.delete(synchronize_session=False)
+                db.session.commit()
+                return removed
+            except Exception:
+                db.session.rollback()
+                raise
+
+
+class AIResponseCacheManager:
+    """AI 生成结果缓存，统计命中、未命中、写入、淘汰和跳过缓存的次数"""
+
+    def __init__(self):
+        self.store: Optional[AICacheStore] = None  # 未配置存储时不缓存
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0, 'bypassed': 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.store is not None
+
+    def configure(self, store: Optional[AICacheStore]):
+        self.store = store
+
+    def _count(self, key: str, value: int = 1):
+        with self._lock:
+            self._stats[key] += value
+
+    def get(self, prompt: str, ai_config: dict, system: str = '', bypass: bool = False) -> Optional[List[Dict[str, Any]]]:
+        """
+        查询缓存的测试用例
+
+        Args:
+            prompt: build_test_case_prompt 生成的提示词
+            ai_config: AI 配置（取 model、temperature）
+            system: system 提示词
+            bypass: 跳过缓存（强制重新生成，生成结果仍会写入缓存）
+
+        Returns:
+            缓存的测试用例列表，未命中或跳过时返回 None
+        """
+        if not self.enabled:
+            return None
+        if bypass:
+            self._count('bypassed')
+            return None
+        key = cache_key(prompt, ai_config.get('model'), ai_config.get('temperature'), system)
+        value = self.store.get(key)
+        self._count('hits' if value is not None else 'misses')
+        return value
+
+    def set(self, prompt: str, ai_config: dict, value: List[Dict[str, Any]], system: str = ''):
+        """缓存完整生成的测试用例（输出被截断或为空的结果不缓存）"""
+        if not self.enabled or not value:
+            return
+        key = cache_key(prompt, ai_config.get('model'), ai_config.get('temperature'), system)
+        try:
+            evicted = self.store.set(key, ai_config.get('model'), value)
+        except Exception as e:
+            logger.error(f"写入AI生成结果缓存失败: {e}")
+            return
+        self._count('stores')
+        self._count('evictions', evicted)
+
+    def clear(self) -> int:
+        return self.store.clear() if self.enabled else 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else None
+        stats['enabled'] = self.enabled
+        if self.enabled:
+            stats.update(
+                backend='sql' if isinstance(self.store, SqlAICacheStore) else 'disk',
+                entries=self.store.count(),
+                max_entries=self.store.max_entries,
+                ttl_hours=self.store.ttl_hours
+            )
+        return stats
+
+
+# 全局 AI 生成结果缓存实例
+ai_cache = AIResponseCacheManager()
+
+
+def init_ai_cache(app):
+    """根据应用配置初始化 AI 生成结果缓存"""
+    backend = app.config.get('AI_CACHE_BACKEND')
+    ttl_hours = app.config.get('AI_CACHE_TTL_HOURS') or 72
+    max_entries = app.config.get('AI_CACHE_MAX_ENTRIES') or 500
+    if backend == 'sql':
+        store = SqlAICacheStore(app, ttl_hours, max_entries)
+    elif backend == 'disk':
+        store = DiskAICacheStore(app.config.get('AI_CACHE_PATH'), ttl_hours, max_entries)
+    else:
+        store = None
+    ai_cache.configure(store)
@@ -0,0 +1,219 @@
+"""
+AI 接口客户端（OpenAI 兼容）
+所有 AI 调用共用一个带连接池的 requests.Session，保持长连接，不再每次调用都重新建立 TCP/TLS 连接；
+同时调用 AI 接口的请求数受信号量限制，超出时排队等待。
+遇到 429、5xx、连接失败或超时时按指数退避（带随机抖动）重试，服务端返回 Retry-After 时按其等待。
+每次请求记录耗时（流式请求为收到响应头的耗时）、重试次数和结果，供监控接口查看
+"""
+import time
+import random
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+# 需要重试的 HTTP 状态码
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# 退避等待的上限（秒）
+MAX_BACKOFF = 30
+
+# 统计耗时分位数使用的最近请求数
+METRICS_WINDOW = 200
+
+
+class AIClient:
+    """共享连接池、限制并发并自动重试的 AI 接口客户端（线程安全）"""
+
+    def __init__(self, pool_size: int = 10, max_concurrency: int = 4, max_retries: int = 3,
+                 backoff: float = 1.0, timeout: float = 120):
+        self.pool_size = pool_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self._session: Optional[requests.Session] = None
+        self._semaphore = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._durations = deque(maxlen=METRICS_WINDOW)
+        self._metrics = {
+            'requests': 0,  # 成功返回的请求数
+            'failures': 0,  # 重试后仍失败的请求数
+            'retries': 0,  # 重试次数
+            'in_flight': 0,  # 正在请求的数量
+            'waiting': 0,  # 等待并发名额的数量
+            'last_duration': None,  # 最近一次请求耗时（秒，含重试）
+            'last_error': None
+        }
+
+    def configure(self, pool_size: int = None, max_concurrency: int = None, max_retries: int = None,
+                  backoff: float = None, timeout: float = None):
+        with self._lock:
+            if pool_size and pool_size != self.pool_size:
+                self.pool_size = pool_size
+                self._close_session()
+            if max_concurrency and max_concurrency != self.max_concurrency:
+                self.max_concurrency = max_concurrency
+                self._semaphore = threading.BoundedSemaphore(max_concurrency)
+            if max_retries is not None:
+                self.max_retries = max_retries
+            if backoff is not None:
+                self.backoff = backoff
+            if timeout:
+                self.timeout = timeout
+
+    @property
+    def session(self) -> requests.Session:
+        """共享的 Session，首次使用时创建（按连接池大小挂载 HTTP/HTTPS 适配器）"""
+        with self._lock:
+            if self._session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.pool_size)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self._session = session
+            return self._session
+
+    def _close_session(self):
+        """关闭连接池，需持有锁"""
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    def close(self):
+        with self._lock:
+            self._close_session()
+
+    def _retry_delay(self, attempt: int, response: Optional[requests.Response] = None) -> float:
+        """第 attempt 次重试前的等待时间：优先使用 Retry-After，否则指数退避加随机抖动"""
+        if response is not None:
+            retry_after = response.headers.get('Retry-After')
+            if retry_after and retry_after.strip().isdigit():
+                return min(float(retry_after), MAX_BACKOFF)
+        return random.uniform(0, min(MAX_BACKOFF, self.backoff * (2 ** attempt)))
+
+    @contextmanager
+    def _slot(self):
+        """占用一个并发名额，没有空闲名额时等待"""
+        with self._lock:
+            self._metrics['waiting'] += 1
+            semaphore = self._semaphore
+        # 调整并发上限后，已取出的信号量仍归还到原信号量
+        semaphore.acquire()
+        with self._lock:
+            self._metrics['waiting'] -= 1
+            self._metrics['in_flight'] += 1
+        try:
+            yield
+        finally:
+            semaphore.release()
+            with self._lock:
+                self._metrics['in_flight'] -= 1
+
+    def post(self, url: str, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None,
+             timeout: Optional[float] = None) -> requests.Response:
+        """
+        发送 POST 请求，429/5xx/连接失败/超时时重试
+
+        Args:
+            url: 请求地址
+            payload: JSON 请求体
+            headers: 请求头
+            timeout: 超时时间（秒），默认使用客户端配置
+
+        Returns:
+            最后一次请求的响应（非重试状态码直接返回，由调用方处理）；重试后仍连接失败时抛出 requests 异常
+        """
+        with self._slot():
+            return self._send(url, payload, headers, timeout, stream=False)
+
+    @contextmanager
+    def stream(self, url: str, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None,
+               timeout: Optional[float] = None) -> Iterator[requests.Response]:
+        """
+        发送流式读取响应体的 POST 请求，重试规则与 post 相同；读取响应体期间一直占用并发名额，退出时关闭响应
+
+        用法：
+            with ai_client.stream(url, payload, headers) as response:
+                for line in response.iter_lines():
+                    ...
+        """
+        with self._slot():
+            response = self._send(url, payload, headers, timeout, stream=True)
+            try:
+                yield response
+            finally:
+                response.close()
+
+    def _send(self, url: str, payload: Dict[str, Any], headers: Optional[Dict[str, str]],
+              timeout: Optional[float], stream: bool) -> requests.Response:
+        """发送请求并按需重试，需已占用并发名额"""
+        timeout = timeout or self.timeout
+        started = time.monotonic()
+        attempt = 0
+        while True:
+            response = None
+            try:
+                response = self.session.post(url, json=payload, headers=headers, timeout=timeout, stream=stream)
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    self._record(started, response.status_code < 400, None if response.ok else f'HTTP {response.status_code}')
+                    return response
+                reason = f'HTTP {response.status_code}'
+                # 丢弃响应体，连接放回连接池
+                response.close()
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if attempt >= self.max_retries:
+                    self._record(started, False, str(e))
+                    raise
+                reason = type(e).__name__
+            delay = self._retry_delay(attempt, response)
+            attempt += 1
+            with self._lock:
+                self._metrics['retries'] += 1
+            logger.warning(f"AI 接口请求失败（{reason}），{delay:.1f} 秒后第 {attempt} 次重试")
+            time.sleep(delay)
+
+    def _record(self, started: float, success: bool, error: Optional[str]):
+        duration = time.monotonic() - started
+        with self._lock:
+            self._durations.append(duration)
+            self._metrics['last_duration'] = round(duration, 3)
+            if success:
+                self._metrics['requests'] += 1
+            else:
+                self._metrics['failures'] += 1
+                self._metrics['last_error'] = error
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """请求数、重试次数、并发情况以及最近请求耗时的平均值和分位数（秒）"""
+        with self._lock:
+            durations = sorted(self._durations)
+            metrics = dict(self._metrics, max_concurrency=self.max_concurrency, pool_size=self.pool_size)
+        if durations:
+            metrics.update(
+                avg_duration=round(sum(durations) / len(durations), 3),
+                p50_duration=round(durations[len(durations) // 2], 3),
+                p95_duration=round(durations[min(len(durations) - 1, int(len(durations) * 0.95))], 3)
+            )
+        return metrics
+
+
+# 全局 AI 接口客户端实例
+ai_client = AIClient()
+
+
+def init_ai_client(app):
+    """根据应用配置初始化 AI 接口客户端"""
+    ai_client.configure(
+        pool_size=app.config.get('AI_HTTP_POOL_SIZE'),
+        max_concurrency=app.config.get('AI_MAX_CONCURRENT_REQUESTS'),
+        max_retries=app.config.get('AI_MAX_RETRIES'),
+        backoff=app.config.get('AI_RETRY_BACKOFF'),
+        timeout=app.config.get('AI_REQUEST_TIMEOUT')
+    )
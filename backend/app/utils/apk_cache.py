@@ -0,0 +1,343 @@
+"""
+APK 安装缓存
+同一个安装包按内容 MD5（与上传接口返回的 file_hash 一致）缓存：
+本地只解码/落盘一次，每台设备只推送一次到固定的暂存路径，
+设备上已安装相同 versionCode 且安装包内容一致时跳过安装
+"""
+import os
+import re
+import base64
+import binascii
+import struct
+import hashlib
+import logging
+import threading
+import time
+import zipfile
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+from app.utils.adb_client import AdbClient, AdbError, adb_client
+
+logger = logging.getLogger(__name__)
+
+APK_DATA_URL_PREFIX = 'data:application/vnd.android.package-archive;base64,'
+
+# 设备上的暂存目录
+REMOTE_STAGING_DIR = '/data/local/tmp/mtp_apk'
+
+# AXML（二进制 AndroidManifest.xml）相关常量
+AXML_STRING_POOL = 0x0001
+AXML_RESOURCE_MAP = 0x0180
+AXML_START_ELEMENT = 0x0102
+AXML_UTF8_FLAG = 1 << 8
+ATTR_VERSION_CODE = 0x0101021b
+TYPE_STRING = 0x03
+TYPE_INT_DEC = 0x10
+TYPE_INT_HEX = 0x11
+
+
+def _read_pool_string(data: bytes, offset: int, utf8: bool) -> str:
+    if utf8:
+        # UTF-8：字符数、字节数各占 1~2 字节
+        pos = offset + (2 if data[offset] & 0x80 else 1)
+        length = data[pos]
+        if length & 0x80:
+            length = ((length & 0x7f) << 8) | data[pos + 1]
+            pos += 2
+        else:
+            pos += 1
+        return data[pos:pos + length].decode('utf-8', errors='replace')
+    length = struct.unpack_from('<H', data, offset)[0]
+    pos = offset + 2
+    if length & 0x8000:
+        length = ((length & 0x7fff) << 16) | struct.unpack_from('<H', data, pos)[0]
+        pos += 2
+    return data[pos:pos + length * 2].decode('utf-16-le', errors='replace')
+
+
+def parse_manifest(data: bytes) -> Dict[str, Optional[object]]:
+    """
+    从二进制 AndroidManifest.xml 中解析包名和 versionCode
+
+    Returns:
+        {'package': 包名, 'version_code': versionCode}，解析不到的字段为 None
+    """
+    strings = []
+    resource_ids = []
+    pos = struct.unpack_from('<H', data, 2)[0]
+    while pos + 8 <= len(data):
+        chunk_type, header_size, chunk_size = struct.unpack_from('<HHI', data, pos)
+        if chunk_size <= 0:
+            break
+        if chunk_type == AXML_STRING_POOL:
+            count, _, flags, strings_start = struct.unpack_from('<IIII', data, pos + 8)
+            utf8 = bool(flags & AXML_UTF8_FLAG)
+            for i in range(count):
+                offset = struct.unpack_from('<I', data, pos + header_size + i * 4)[0]
+                strings.append(_read_pool_string(data, pos + strings_start + offset, utf8))
+        elif chunk_type == AXML_RESOURCE_MAP:
+            count = (chunk_size - header_size) // 4
+            resource_ids = list(struct.unpack_from(f'<{count}I', data, pos + header_size))
+        elif chunk_type == AXML_START_ELEMENT:
+            name_index = struct.unpack_from('<I', data, pos + 20)[0]
+            if name_index < len(strings) and strings[name_index] == 'manifest':
+                attr_start, attr_size, attr_count = struct.unpack_from('<HHH', data, pos + 24)
+                result = {'package': None, 'version_code': None}
+                for i in range(attr_count):
+                    attr = pos + header_size + attr_start + i * attr_size
+                    _, attr_name, raw_value, _, _, data_type, value = struct.unpack_from('<IIIHBBI', data, attr)
+                    name = strings[attr_name] if attr_name < len(strings) else ''
+                    resource_id = resource_ids[attr_name] if attr_name < len(resource_ids) else None
+                    if name == 'package':
+                        result['package'] = strings[raw_value] if raw_value < len(strings) else None
+                    elif name == 'versionCode' or resource_id == ATTR_VERSION_CODE:
+                        if data_type in (TYPE_INT_DEC, TYPE_INT_HEX):
+                            result['version_code'] = value
+                        elif data_type == TYPE_STRING and raw_value < len(strings) and strings[raw_value].isdigit():
+                            result['version_code'] = int(strings[raw_value])
+                return result
+        pos += chunk_size
+    return {'package': None, 'version_code': None}
+
+
+def read_apk_info(apk_path: str) -> Dict[str, Optional[object]]:
+    """读取 APK 的包名和 versionCode，无法解析时返回空字段"""
+    try:
+        with zipfile.ZipFile(apk_path) as apk:
+            return parse_manifest(apk.read('AndroidManifest.xml'))
+    except (zipfile.BadZipFile, KeyError, struct.error, IndexError, OSError) as e:
+        logger.warning(f"解析 APK 信息失败 {apk_path}: {e}")
+        return {'package': None, 'version_code': None}
+
+
+def file_md5(path: str) -> str:
+    digest = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ApkCache:
+    """
+    APK 内容寻址缓存
+    本地缓存文件为 <cache_dir>/<md5>.apk，设备暂存文件为 REMOTE_STAGING_DIR/<md5>.apk
+    """
+
+    def __init__(self, client: AdbClient, cache_dir: str = None, max_files: int = 20, remote_keep: int = 3):
+        self.client = client
+        self.cache_dir = cache_dir
+        self.max_files = max_files
+        self.remote_keep = remote_keep
+        self._lock = threading.Lock()
+        self._hash_locks: Dict[str, threading.Lock] = {}
+        # 已计算过的文件摘要：(path, size, mtime) -> md5
+        self._digests: Dict[Tuple[str, int, float], str] = {}
+        # 已解析的安装包信息：md5 -> {'package', 'version_code'}
+        self._infos: Dict[str, Dict] = {}
+        # 本地缓存文件最近使用时间（淘汰依据，不依赖文件系统的 atime）：path -> 时间戳
+        self._last_used: Dict[str, float] = {}
+        # 正在被任务使用的本地文件及引用数，淘汰时跳过：path -> 引用数
+        self._in_use: Dict[str, int] = {}
+
+    def configure(self, cache_dir: str = None, max_files: int = None):
+        if cache_dir:
+            self.cache_dir = cache_dir
+        if max_files:
+            self.max_files = max_files
+
+    def _hash_lock(self, key: str) -> threading.Lock:
+        with self._lock:
+            return self._hash_locks.setdefault(key, threading.Lock())
+
+    def _digest(self, path: str) -> str:
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_size, stat.st_mtime)
+        digest = self._digests.get(key)
+        if digest is None:
+            digest = file_md5(path)
+            self._digests[key] = digest
+        return digest
+
+    # ------------------------------------------------------------------
+    # 本地缓存
+    # ------------------------------------------------------------------
+
+    def stage(self, file_content: str = '', file_path: str = '', file_hash: str = '') -> Tuple[str, str]:
+        """
+        准备本地安装包
+
+        Args:
+            file_content: APK 的 data URL（或原始内容）
+            file_path: 服务器上的 APK 路径
+            file_hash: 已缓存安装包的 MD5（如 TestTask.file_hash），只在未提供内容和路径时按它取缓存文件；
+                提供了内容时以解码后的实际 MD5 为准
+
+        Returns:
+            (本地文件路径, md5)；内容无法解码抛出 ValueError，文件不存在抛出 FileNotFoundError
+        """
+        if not file_content:
+            if not file_path and file_hash:
+                file_path = os.path.join(self.cache_dir, f'{file_hash.lower()}.apk')
+            digest = self._digest(file_path)
+            self._touch(file_path)
+            return file_path, digest
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        # 同一内容并发到达时只解码一次
+        content_key = hashlib.md5(file_content[:4096].encode('utf-8', errors='ignore')).hexdigest() + str(len(file_content))
+        with self._hash_lock(content_key):
+            if file_content.startswith(APK_DATA_URL_PREFIX):
+                try:
+                    data = base64.b64decode(file_content[len(APK_DATA_URL_PREFIX):], validate=True)
+                except binascii.Error as e:
+                    raise ValueError(f'安装包内容不是有效的 base64 编码: {e}')
+            else:
+                data = file_content.encode('utf-8')
+            digest = hashlib.md5(data).hexdigest()
+            if file_hash and file_hash.lower() != digest:
+                logger.warning(f"安装包实际 MD5 {digest} 与提供的 file_hash {file_hash} 不一致，以实际内容为准")
+            cached = os.path.join(self.cache_dir, f'{digest}.apk')
+            if not os.path.exists(cached):
+                temp_path = f'{cached}.{threading.get_ident()}.tmp'
+                with open(temp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(temp_path, cached)
+                self._touch(cached)
+                self._prune()
+            else:
+                self._touch(cached)
+        return cached, digest
+
+    @contextmanager
+    def staged(self, file_content: str = '', file_path: str = '', file_hash: str = ''):
+        """
+        准备本地安装包并在使用期间占用，占用中的缓存文件不会被淘汰
+
+        用法：
+            with apk_cache.staged(file_content=...) as (local_path, digest):
+                ...
+        """
+        local_path, digest = self.stage(file_content=file_content, file_path=file_path, file_hash=file_hash)
+        key = os.path.abspath(local_path)
+        with self._lock:
+            self._in_use[key] = self._in_use.get(key, 0) + 1
+        try:
+            yield local_path, digest
+        finally:
+            with self._lock:
+                self._in_use[key] -= 1
+                if not self._in_use[key]:
+                    del self._in_use[key]
+
+    def _touch(self, path: str):
+        """记录本地文件的最近使用时间"""
+        with self._lock:
+            self._last_used[os.path.abspath(path)] = time.time()
+
+    def _prune(self):
+        """本地缓存文件超过上限时删除最久未使用的（本进程未记录使用时间的按写入时间），跳过正在使用的文件"""
+        try:
+            files = [os.path.abspath(os.path.join(self.cache_dir, name))
+                     for name in os.listdir(self.cache_dir) if name.endswith('.apk')]
+        except OSError:
+            return
+        if len(files) <= self.max_files:
+            return
+        with self._lock:
+            candidates = []
+            for path in files:
+                if path in self._in_use:
+                    continue
+                try:
+                    candidates.append((self._last_used.get(path) or os.path.getmtime(path), path))
+                except OSError:
+                    continue
+        candidates.sort()
+        for _, path in candidates[:len(files) - self.max_files]:
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            with self._lock:
+                self._last_used.pop(path, None)
+
+    def apk_info(self, local_path: str, digest: str) -> Dict:
+        info = self._infos.get(digest)
+        if info is None:
+            info = read_apk_info(local_path)
+            self._infos[digest] = info
+        return info
+
+    # ------------------------------------------------------------------
+    # 设备安装
+    # ------------------------------------------------------------------
+
+    def installed_matches(self, serial: str, package: str, version_code: int, digest: str,
+                          timeout: Optional[float] = None) -> bool:
+        """设备上已安装的同名应用 versionCode 与安装包一致，且 base.apk 内容相同"""
+        command = (
+            f"dumpsys package {package} | grep -m1 -o 'versionCode=[0-9]*'; "
+            f"p=$(pm path {package} 2>/dev/null | head -n1); p=${{p#package:}}; "
+            f"[ -n \"$p\" ] && md5sum \"$p\""
+        )
+        _, stdout, _ = self.client.shell(serial, command, timeout)
+        output = stdout.decode('utf-8', errors='ignore')
+        version_match = re.search(r'versionCode=(\d+)', output)
+        md5_match = re.search(r'\b([0-9a-f]{32})\b', output)
+        return bool(
+            version_match and int(version_match.group(1)) == version_code
+            and md5_match and md5_match.group(1) == digest
+        )
+
+    def push_staged(self, serial: str, local_path: str, digest: str, timeout: Optional[float] = None) -> str:
+        """推送安装包到设备暂存目录，已存在同样大小的暂存文件时不再推送，返回设备上的路径"""
+        remote_path = f'{REMOTE_STAGING_DIR}/{digest}.apk'
+        _, size, _ = self.client.stat(serial, remote_path, timeout)
+        if size and size == os.path.getsize(local_path):
+            return remote_path
+        self.client.shell(serial, f'mkdir -p {REMOTE_STAGING_DIR}', timeout)
+        self.client.push(serial, local_path, remote_path, timeout=timeout)
+        # 只保留最近使用的几个暂存文件
+        self.client.shell(
+            serial,
+            f'cd {REMOTE_STAGING_DIR} && ls -t *.apk 2>/dev/null | tail -n +{self.remote_keep + 1} | xargs rm -f',
+            timeout
+        )
+        return remote_path
+
+    def install(self, serial: str, local_path: str, digest: str, timeout: Optional[float] = None) -> Tuple[int, bytes, bytes]:
+        """
+        在设备上安装缓存的安装包
+
+        Returns:
+            (exit_code, stdout, stderr)，与 AdbClient.install 一致；跳过安装时 stdout 说明原因
+        """
+        info = self.apk_info(local_path, digest)
+        if info['package'] and info['version_code'] is not None:
+            try:
+                if self.installed_matches(serial, info['package'], info['version_code'], digest, timeout):
+                    logger.info(f"设备 {serial} 已安装 {info['package']} ({info['version_code']})，跳过安装")
+                    return 0, f"Success: {info['package']} versionCode {info['version_code']} 已安装，跳过安装\n".encode('utf-8'), b''
+            except AdbError as e:
+                logger.warning(f"检查设备 {serial} 已安装版本失败，继续安装: {e}")
+
+        remote_path = self.push_staged(serial, local_path, digest, timeout)
+        exit_code, stdout, stderr = self.client.shell(serial, f'pm install -r "{remote_path}"', timeout)
+        if b'Success' not in stdout and exit_code == 0:
+            exit_code = 1
+        return exit_code, stdout, stderr
+
+
+# 全局 APK 缓存实例
+apk_cache = ApkCache(adb_client)
+
+
+def init_apk_cache(app):
+    """根据应用配置初始化 APK 缓存"""
+    apk_cache.configure(
+        cache_dir=app.config.get('APK_CACHE_PATH'),
+        max_files=app.config.get('APK_CACHE_MAX_FILES')
+    )
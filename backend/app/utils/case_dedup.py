@@ -0,0 +1,140 @@
+"""
+测试用例近似去重
+把用例名称、步骤和预期结果规整后切成 3 字片段，用 MinHash 签名估计两条用例片段集合的 Jaccard 相似度；
+签名按分带（LSH）放入桶中，检查一条用例时只与落在同一个桶中的用例比较，不必逐条比对整个用例集。
+签名采用单次哈希分桶的 MinHash：每个片段只计算一次哈希，按哈希值分到各个槽位取最小值，空槽位向后借用，
+签名计算与片段数成线性关系
+"""
+import re
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from app.models.models import db, TestCase
+
+# 规整时去掉的内容：空白、标点符号和步骤序号（1. / 2、 / (3)）
+NORMALIZE_PATTERN = re.compile(r'[(（]?\d+[.、)）]|[\s\W_]+')
+
+# 片段长度（字符数）
+SHINGLE_SIZE = 3
+
+# 签名槽位数与分带数：每带 4 个槽位，任一带完全相同即成为候选，相似度约 0.5 以上的用例大概率成为候选
+NUM_SLOTS = 64
+NUM_BANDS = 16
+
+# 默认的近似重复相似度阈值（与配置项 AI_DEDUP_THRESHOLD 的默认值一致）
+DEFAULT_THRESHOLD = 0.7
+
+# 借用槽位时按借用距离错开取值，避免与原本的取值相同
+_SLOT_BITS = 6
+_VALUE_RANGE = 1 << (32 - _SLOT_BITS)
+
+
+def normalize_case_text(case: Dict[str, Any]) -> str:
+    """拼接用例名称、步骤和预期结果，去掉空白、标点和步骤序号并转为小写"""
+    text = '|'.join(str(case.get(field) or '') for field in ('case_name', 'steps', 'expected_result'))
+    return NORMALIZE_PATTERN.sub('', text.lower())
+
+
+def case_signature(case: Dict[str, Any]) -> Optional[Tuple[int, ...]]:
+    """计算用例的 MinHash 签名，内容为空时返回 None"""
+    text = normalize_case_text(case)
+    if not text:
+        return None
+    if len(text) <= SHINGLE_SIZE:
+        shingles = {text}
+    else:
+        shingles = {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+    slots: List[Optional[int]] = [None] * NUM_SLOTS
+    for shingle in shingles:
+        value = zlib.crc32(shingle.encode('utf-8'))
+        slot, value = value & (NUM_SLOTS - 1), value >> _SLOT_BITS
+        if slots[slot] is None or value < slots[slot]:
+            slots[slot] = value
+
+    # 空槽位借用后面（循环）第一个非空槽位的值
+    signature = list(slots)
+    for slot in range(NUM_SLOTS):
+        if signature[slot] is None:
+            for distance in range(1, NUM_SLOTS):
+                value = slots[(slot + distance) % NUM_SLOTS]
+                if value is not None:
+                    signature[slot] = value + distance * _VALUE_RANGE
+                    break
+    return tuple(signature)
+
+
+def signature_similarity(a: Tuple[int, ...], b: Tuple[int, ...]) -> float:
+    """两个签名相同槽位的比例，即 Jaccard 相似度的估计值"""
+    return sum(1 for x, y in zip(a, b) if x == y) / NUM_SLOTS
+
+
+class CaseDedupIndex:
+    """用例签名索引，按分带把签名放入桶中，查询时只比较同桶的用例"""
+
+    def __init__(self, threshold: float = DEFAULT_THRESHOLD):
+        self.threshold = threshold
+        self._rows = NUM_SLOTS // NUM_BANDS
+        self._buckets: List[Dict[Tuple[int, ...], List[int]]] = [{} for _ in range(NUM_BANDS)]
+        self._signatures: List[Tuple[int, ...]] = []
+        self._refs: List[Any] = []
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def _bands(self, signature: Tuple[int, ...]) -> Iterable[Tuple[int, Tuple[int, ...]]]:
+        for band in range(NUM_BANDS):
+            yield band, signature[band * self._rows:(band + 1) * self._rows]
+
+    def add(self, signature: Optional[Tuple[int, ...]], ref: Any):
+        """加入一条用例的签名，ref 为查到重复时返回的用例标识"""
+        if signature is None:
+            return
+        position = len(self._signatures)
+        self._signatures.append(signature)
+        self._refs.append(ref)
+        for band, key in self._bands(signature):
+            self._buckets[band].setdefault(key, []).append(position)
+
+    def find(self, signature: Optional[Tuple[int, ...]]) -> Optional[Tuple[Any, float]]:
+        """查找相似度不低于阈值的最相似用例，返回 (ref, 相似度)，没有时返回 None"""
+        if signature is None:
+            return None
+        candidates = set()
+        for band, key in self._bands(signature):
+            candidates.update(self._buckets[band].get(key, ()))
+        best = None
+        for position in candidates:
+            similarity = signature_similarity(signature, self._signatures[position])
+            if similarity >= self.threshold and (best is None or similarity > best[1]):
+                best = (self._refs[position], similarity)
+        return best
+
+    def check(self, case: Dict[str, Any], ref: Any = None) -> Optional[Tuple[Any, float]]:
+        """
+        检查用例是否与索引中的用例近似重复
+
+        Args:
+            case: 用例数据（取 case_name、steps、expected_result）
+            ref: 不重复时以该标识加入索引，之后的用例也会与它比较；为 None 时不加入
+
+        Returns:
+            (重复用例的标识, 相似度)，不重复时返回 None
+        """
+        signature = case_signature(case)
+        match = self.find(signature)
+        if match is None and ref is not None:
+            self.add(signature, ref)
+        return match
+
+
+def build_suite_index(suite_id: int, threshold: float = DEFAULT_THRESHOLD) -> CaseDedupIndex:
+    """为用例集已有的用例建立签名索引，标识为用例编号（无编号时为 用例名称）"""
+    index = CaseDedupIndex(threshold)
+    rows = db.session.query(
+        TestCase.case_number, TestCase.case_name, TestCase.steps, TestCase.expected_result
+    ).filter(TestCase.suite_id == suite_id)
+    for case_number, case_name, steps, expected_result in rows:
+        case = {'case_name': case_name, 'steps': steps, 'expected_result': expected_result}
+        index.add(case_signature(case), case_number or case_name)
+    return index
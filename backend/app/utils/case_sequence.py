@@ -0,0 +1,110 @@
+"""
+用例编号序号分配
+每个用例集在 case_number_sequences 表中有一行，记录已分配的最大尾号。
+分配时用一条 UPDATE 把最大尾号加上本次数量，行锁保证并发的生成任务拿到互不重叠的区间；
+分配在独立事务中立即提交，行锁只持有一瞬间，不受调用方事务影响。
+用例集首次分配时按已有用例的最大尾号初始化
+"""
+import logging
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+
+from app.models.models import (
+    db, TestCase, CaseNumberSequence, LOCAL_TIMEZONE, case_number_seq, case_number_prefix
+)
+
+logger = logging.getLogger(__name__)
+
+# 初始化序号行时与其他进程冲突后的重试次数
+INIT_RETRIES = 3
+
+
+def _latest_prefix(conn, suite_id: int):
+    """用例集中最近一条有尾号的用例的编号前缀，没有时返回 None"""
+    row = conn.execute(
+        select(TestCase.case_number, TestCase.case_seq).where(
+            TestCase.suite_id == suite_id,
+            TestCase.case_seq.isnot(None)
+        ).order_by(TestCase.id.desc()).limit(1)
+    ).first()
+    return case_number_prefix(*row) if row else None
+
+
+def suite_case_prefix(suite_id) -> Optional[str]:
+    """用例集当前使用的编号前缀（取最近一条有尾号的用例），用于解析手动填写的编号；没有时返回 None"""
+    if not suite_id:
+        return None
+    return _latest_prefix(db.session, suite_id)
+
+
+def _current_max(conn, suite_id: int) -> int:
+    """用例集中已有用例的最大尾号；尾号为空的历史用例按用例集的编号前缀解析尾号"""
+    max_seq = conn.execute(
+        select(func.max(TestCase.case_seq)).where(TestCase.suite_id == suite_id)
+    ).scalar() or 0
+    legacy = conn.execute(
+        select(TestCase.case_number).where(
+            TestCase.suite_id == suite_id,
+            TestCase.case_seq.is_(None),
+            TestCase.case_number.isnot(None)
+        )
+    ).scalars().all()
+    if not legacy:
+        return max_seq
+    prefix = _latest_prefix(conn, suite_id)
+    seqs = [case_number_seq(case_number, prefix) for case_number in legacy]
+    return max([max_seq] + [seq for seq in seqs if seq is not None])
+
+
+def reserve_case_numbers(suite_id: int, count: int) -> int:
+    """
+    为用例集预留 count 个连续的尾号
+
+    Args:
+        suite_id: 用例集ID
+        count: 预留数量
+
+    Returns:
+        预留区间的第一个尾号，区间为 [返回值, 返回值 + count)
+    """
+    table = CaseNumberSequence.__table__
+    for _ in range(INIT_RETRIES):
+        with db.engine.begin() as conn:
+            result = conn.execute(
+                table.update().where(table.c.suite_id == suite_id).values(
+                    last_value=table.c.last_value + count, updated_at=datetime.now(LOCAL_TIMEZONE)
+                )
+            )
+            if result.rowcount:
+                # 同一事务内行锁仍在，读到的就是本次更新后的值
+                last_value = conn.execute(select(table.c.last_value).where(table.c.suite_id == suite_id)).scalar()
+                return last_value - count + 1
+        try:
+            with db.engine.begin() as conn:
+                current = _current_max(conn, suite_id)
+                conn.execute(table.insert().values(
+                    suite_id=suite_id, last_value=current + count, updated_at=datetime.now(LOCAL_TIMEZONE)
+                ))
+                return current + 1
+        except IntegrityError:
+            # 其他任务已初始化该用例集的序号，重新走 UPDATE 分配
+            logger.debug(f"用例集 {suite_id} 的编号序号已被并发初始化，重试分配")
+    raise RuntimeError(f"用例集 {suite_id} 分配用例编号失败")
+
+
+def advance_case_sequence(suite_id: int, seq: int):
+    """
+    手动填写的用例编号尾号超过已分配的最大尾号时推进序号，避免之后自动分配出重复编号。
+    在调用方的会话中执行，随用例一起提交；用例集尚未分配过序号时不处理（首次分配时会按已有用例初始化）
+    """
+    if not suite_id or seq is None:
+        return
+    table = CaseNumberSequence.__table__
+    db.session.execute(
+        table.update().where(table.c.suite_id == suite_id, table.c.last_value < seq).values(
+            last_value=seq, updated_at=datetime.now(LOCAL_TIMEZONE)
+        )
+    )
@@ -0,0 +1,234 @@
+"""
+定时设备脚本任务调度
+设备脚本任务创建或修改时按 scheduled_time 注册到 APScheduler，应用启动时为尚未执行的任务重新注册；
+到达执行时间后在设备执行器上并发执行，每台设备的结果按报告使用的 executions 格式写入 TestTask.result，
+随后将任务标记为已完成并按创建者的设置自动生成报告
+"""
+import os
+import json
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from app.models.models import db, TestTask, UserSetting, LOCAL_TIMEZONE
+from app.utils.scheduler import scheduler, leader_election, add_scheduled_task, remove_scheduled_task
+from app.utils.device_executor import run_batch_device_task
+
+logger = logging.getLogger(__name__)
+
+# 脚本文件扩展名对应的执行方式
+EXTENSION_TASK_TYPES = {
+    '.sh': 'shell',
+    '.py': 'python',
+    '.apk': 'install'
+}
+
+
+def scheduled_job_id(task_id: int) -> str:
+    """测试任务在调度器中的任务ID"""
+    return f'device_script_{task_id}'
+
+
+def infer_task_type(test_task: TestTask) -> str:
+    """根据脚本文件扩展名推断执行方式，没有脚本文件时按 Shell 命令执行"""
+    filename = test_task.script_file or test_task.file_path or ''
+    return EXTENSION_TASK_TYPES.get(os.path.splitext(filename)[1].lower(), 'shell')
+
+
+def _aware(value: Optional[datetime]) -> Optional[datetime]:
+    """数据库读出的时间可能不带时区，与创建任务时的 datetime.now() 一致按服务器本地时间处理"""
+    if value is not None and value.tzinfo is None:
+        return value.astimezone()
+    return value
+
+
+def build_executions(results: List[Dict], device_names: Dict[str, str]) -> List[Dict]:
+    """把执行器的结果转换为报告解析的 executions 格式"""
+    executions = []
+    for result in results:
+        executions.append({
+            'device_id': result['device_id'],
+            'device_name': device_names.get(result['device_id'], result['device_id']),
+            'status': 'success' if result['success'] else 'failed',
+            'execution_time': result.get('duration'),
+            'exit_code': result.get('exit_code'),
+            'output': result.get('stdout') or '',
+            'error_output': result.get('stderr') or ('' if result['success'] else result.get('message', ''))
+        })
+    return executions
+
+
+class DeviceTaskDispatcher:
+    """定时设备脚本任务的注册、恢复与执行"""
+
+    def __init__(self, misfire_grace_time: int = 3600):
+        self.misfire_grace_time = misfire_grace_time
+        self.enabled = True
+        self._app = None
+
+    def configure(self, misfire_grace_time: int = None, enabled: bool = None):
+        if misfire_grace_time is not None:
+            self.misfire_grace_time = misfire_grace_time
+        if enabled is not None:
+            self.enabled = enabled
+
+    def init_app(self, app):
+        self._app = app
+
+    # ------------------------------------------------------------------
+    # 注册
+    # ------------------------------------------------------------------
+
+    def schedule(self, test_task: TestTask) -> bool:
+        """
+        按任务的计划时间注册定时执行；不是待执行的设备脚本任务或没有计划时间时移除已有的注册
+
+        Returns:
+            是否已注册
+        """
+        if not self.enabled:
+            return False
+        scheduled_time = _aware(test_task.scheduled_time)
+        if test_task.task_type != 'device_script' or test_task.status != 'pending' or scheduled_time is None:
+            self.unschedule(test_task.id)
+            return False
+
+        now = datetime.now(LOCAL_TIMEZONE)
+        if scheduled_time <= now:
+            # 错过计划时间不久的任务立即执行，过久的不再自动执行，留给用户手动处理
+            if now - scheduled_time > timedelta(seconds=self.misfire_grace_time):
+                logger.warning(f"设备脚本任务 {test_task.id} 已错过计划时间 {scheduled_time}，不再自动执行")
+                self.unschedule(test_task.id)
+                return False
+            scheduled_time = now + timedelta(seconds=1)
+
+        try:
+            add_scheduled_task(scheduled_job_id(test_task.id), dispatch_scheduled_task, scheduled_time, args=[test_task.id])
+        except Exception:
+            # 注册失败不影响任务本身的保存，用户仍可手动执行
+            return False
+        return True
+
+    def unschedule(self, task_id: int):
+        """移除任务的定时执行（没有注册时忽略）"""
+        if scheduler.get_job(scheduled_job_id(task_id)) is not None:
+            remove_scheduled_task(scheduled_job_id(task_id))
+
+    def rehydrate(self) -> int:
+        """应用启动时为所有待执行的定时设备脚本任务重新注册，返回注册的任务数"""
+        if not self.enabled or self._app is None:
+            return 0
+        count = 0
+        with self._app.app_context():
+            tasks = TestTask.query.filter(
+                TestTask.task_type == 'device_script',
+                TestTask.status == 'pending',
+                TestTask.scheduled_time.isnot(None)
+            ).all()
+            for test_task in tasks:
+                if self.schedule(test_task):
+                    count += 1
+        if count:
+            logger.info(f"已恢复 {count} 个定时设备脚本任务")
+        return count
+
+    # ------------------------------------------------------------------
+    # 执行
+    # ------------------------------------------------------------------
+
+    def _claim(self, task_id: int) -> Optional[Tuple[List[str], Dict[str, str], Dict]]:
+        """
+        将待执行的任务标记为执行中，并取出执行参数；任务已被删除、取消或已经开始执行时返回 None
+        """
+        now = datetime.now(LOCAL_TIMEZONE)
+        claimed = TestTask.query.filter(
+            TestTask.id == task_id,
+            TestTask.task_type == 'device_script',
+            TestTask.status == 'pending'
+        ).update({'status': 'running', 'started_time': now, 'completed_time': None}, synchronize_session=False)
+        db.session.commit()
+        if not claimed:
+            return None
+
+        test_task = TestTask.query.get(task_id)
+        device_names = {device.device_id: device.device_name for device in test_task.devices}
+        file_path = test_task.file_path or ''
+        if file_path and not os.path.isabs(file_path):
+            # 上传的脚本保存的是相对存储路径
+            file_path = os.path.join(self._app.config['SCRIPT_STORAGE_PATH'], file_path)
+        params = {
+            'task_type': infer_task_type(test_task),
+            'command': test_task.command or '',
+            'file_path': file_path,
+            'file_hash': test_task.file_hash or ''
+        }
+        return list(device_names), device_names, params
+
+    def dispatch(self, task_id: int):
+        """到达计划时间后执行任务，记录各设备结果并完成任务"""
+        with self._app.app_context():
+            claimed = self._claim(task_id)
+            if claimed is None:
+                logger.info(f"设备脚本任务 {task_id} 不是待执行状态，跳过定时执行")
+                return
+            serials, device_names, params = claimed
+
+        logger.info(f"开始执行定时设备脚本任务 {task_id}，设备数量: {len(serials)}")
+        try:
+            results = run_batch_device_task(serials, task_id=task_id, **params) if serials else []
+            error = None
+        except Exception as e:
+            logger.error(f"定时设备脚本任务 {task_id} 执行失败: {e}")
+            results = [{'device_id': serial, 'success': False, 'message': f'任务执行失败: {e}'} for serial in serials]
+            error = str(e)
+
+        with self._app.app_context():
+            self._complete(task_id, build_executions(results, device_names), error)
+
+    def _complete(self, task_id: int, executions: List[Dict], error: Optional[str]):
+        try:
+            test_task = TestTask.query.get(task_id)
+            if test_task is None:
+                return
+            result = {'executions': executions}
+            if error:
+                result['error'] = error
+            test_task.result = json.dumps(result, ensure_ascii=False)
+            if test_task.status == 'running':
+                test_task.status = 'completed'
+                test_task.completed_time = datetime.now(LOCAL_TIMEZONE)
+                if self._auto_generate_report(test_task.creator_id):
+                    from app.routes.reports import create_report_for_task
+                    create_report_for_task(test_task)
+            db.session.commit()
+            success_count = sum(1 for execution in executions if execution['status'] == 'success')
+            logger.info(f"定时设备脚本任务 {task_id} 执行完成，成功 {success_count}/{len(executions)}")
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"保存设备脚本任务 {task_id} 的执行结果失败: {e}")
+
+    @staticmethod
+    def _auto_generate_report(user_id: int) -> bool:
+        """与手动完成任务一致：用户未设置为手动生成报告时自动生成"""
+        setting = UserSetting.query.filter_by(user_id=user_id, setting_key='report_auto_generate').first()
+        return not (setting and setting.setting_value == 'manual')
+
+
+# 全局定时任务调度实例
+device_dispatcher = DeviceTaskDispatcher()
+
+
+def dispatch_scheduled_task(task_id: int):
+    """调度器到点调用的入口"""
+    device_dispatcher.dispatch(task_id)
+
+
+def init_device_dispatcher(app):
+    """根据应用配置初始化定时任务调度，成为调度器主进程时恢复待执行的定时任务"""
+    device_dispatcher.configure(
+        misfire_grace_time=app.config.get('DEVICE_SCHEDULE_MISFIRE_GRACE'),
+        enabled=app.config.get('DEVICE_SCHEDULE_ENABLED', True)
+    )
+    device_dispatcher.init_app(app)
+    # 只由调度器主进程恢复，主进程切换后由新的主进程再次恢复
+    leader_election.on_elected(device_dispatcher.rehydrate)
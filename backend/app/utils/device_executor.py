@@ -0,0 +1,478 @@
+"""
+设备任务执行引擎
+统一封装单设备任务（APK 安装 / Shell / Python 脚本）的执行逻辑，
+并通过全局有界线程池并发下发到多台设备，批量任务耗时取决于最慢的设备而不是所有设备耗时之和
+"""
+import os
+import sys
+import logging
+import tempfile
+import time
+import subprocess
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from contextlib import ExitStack
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from app.utils.adb_client import adb_client, AdbError, AdbTimeoutError
+from app.utils.shell_session import shell_sessions
+from app.utils.device_lease import device_leases, DeviceLeaseError
+from app.utils.apk_cache import apk_cache
+from app.utils.python_worker import python_workers
+
+logger = logging.getLogger(__name__)
+
+# 项目根目录（backend/app/utils -> 项目根）
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+# 支持的任务类型
+DEVICE_TASK_TYPES = ('install', 'shell', 'python')
+
+
+def get_adb_path() -> str:
+    """获取 escrcpy 中自带的 adb 路径"""
+    return os.path.join(
+        PROJECT_ROOT,
+        'escrcpy', 'electron', 'resources', 'extra', 'win', 'scrcpy', 'adb.exe'
+    )
+
+
+def decode_output(data) -> str:
+    """尝试多种编码方式解码输出"""
+    if data is None:
+        return ''
+    if isinstance(data, str):
+        return data
+    for encoding in ['utf-8', 'gbk', 'gb2312', 'latin-1']:
+        try:
+            return data.decode(encoding)
+        except (UnicodeDecodeError, LookupError):
+            continue
+    # 如果所有编码都失败，使用 replace 模式
+    return data.decode('utf-8', errors='replace')
+
+
+def _build_result(device_id, success: bool, message: str, stdout='', stderr='', exit_code=None) -> Dict[str, Any]:
+    """构建单设备执行结果"""
+    return {
+        'device_id': device_id,
+        'success': success,
+        'message': message,
+        'output': stdout or stderr,
+        'stdout': stdout,
+        'stderr': stderr,
+        'exit_code': exit_code,
+        'finished_at': datetime.now().isoformat()
+    }
+
+
+def _run_process(args: List[str], timeout: Optional[float], env: dict = None,
+                 on_output: Optional[Callable[[int, bytes], None]] = None):
+    """执行子进程并返回 (exit_code, stdout, stderr, timed_out)，超时时保留已产生的输出"""
+    proc = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env)
+    return _wait_process(proc, timeout, on_output)
+
+
+def _wait_process(proc: subprocess.Popen, timeout: Optional[float],
+                  on_output: Optional[Callable[[int, bytes], None]] = None, input_data: Optional[bytes] = None):
+    """
+    向已启动的子进程写入 input_data 并等待结束，返回 (exit_code, stdout, stderr, timed_out)
+    传入 on_output 时输出产生即回调，不在内存中缓存输出
+    """
+    if on_output is None:
+        try:
+            stdout, stderr = proc.communicate(input=input_data, timeout=timeout)
+            return proc.returncode, decode_output(stdout), decode_output(stderr), False
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            stdout, stderr = proc.communicate()
+            return None, decode_output(stdout), decode_output(stderr), True
+
+    if proc.stdin is not None:
+        try:
+            if input_data:
+                proc.stdin.write(input_data)
+            proc.stdin.close()
+        except OSError:
+            pass
+
+    def pump(pipe, stream):
+        for chunk in iter(lambda: pipe.read1(65536), b''):
+            on_output(stream, chunk)
+        pipe.close()
+
+    readers = [
+        threading.Thread(target=pump, args=(proc.stdout, 1), daemon=True),
+        threading.Thread(target=pump, args=(proc.stderr, 2), daemon=True)
+    ]
+    for reader in readers:
+        reader.start()
+    try:
+        exit_code, timed_out = proc.wait(timeout=timeout), False
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+        exit_code, timed_out = None, True
+    for reader in readers:
+        # 脚本启动的后台进程可能继续占用管道，不无限等待
+        reader.join(timeout=5)
+    return exit_code, '', '', timed_out
+
+
+def _run_adb(call: Callable):
+    """通过 adb 协议客户端执行请求，返回值格式与 _run_process 一致"""
+    try:
+        exit_code, stdout, stderr = call()
+        return exit_code, decode_output(stdout), decode_output(stderr), False
+    except AdbTimeoutError as e:
+        return None, decode_output(e.partial_stdout), decode_output(e.partial_stderr), True
+    except AdbError as e:
+        # 与 adb 命令行一致：设备不存在等错误输出到 stderr，退出码为 1
+        return 1, '', f'error: {e}', False
+
+
+def run_device_task(device_id, task_type: str, command: str = '', file_path: str = '',
+                    file_content: str = '', script_args: Optional[List[str]] = None, file_hash: str = '',
+                    timeout: Optional[float] = None,
+                    on_output: Optional[Callable[[int, bytes], None]] = None) -> Dict[str, Any]:
+    """
+    在单台设备上执行任务
+
+    Args:
+        device_id: 设备序列号（adb -s 使用的标识）
+        task_type: 任务类型 install / shell / python
+        command: Shell 命令或 Python 代码
+        file_path: 脚本或 APK 的完整路径（调用方负责解析相对路径）
+        file_content: 脚本内容或 APK 的 data URL
+        script_args: Python 脚本的命令行参数
+        file_hash: 已缓存 APK 的 MD5（如 TestTask.file_hash），未提供 file_path/file_content 时按它取本地缓存文件
+        timeout: 单设备超时时间（秒），None 表示不限制
+        on_output: 流式输出回调 (stream, data)，stream 为 1(stdout) / 2(stderr)；
+            传入后 Shell/Python 任务的输出边执行边回调，结果中的 stdout/stderr 为空
+
+    Returns:
+        单设备执行结果字典；参数或安装包内容错误抛出 ValueError，adb/脚本文件缺失抛出 FileNotFoundError
+    """
+    device_id = str(device_id)
+    adb_path = get_adb_path()
+
+    if task_type == 'install' and (file_path or file_content or file_hash):
+        # 安装 APK
+        env = os.environ.copy()
+        env['ADB'] = adb_path
+
+        # 安装包按内容缓存，同一安装包只解码一次；安装期间占用缓存文件，避免被淘汰
+        with apk_cache.staged(file_content=file_content, file_path=file_path, file_hash=file_hash) as (apk_path, apk_hash):
+            if adb_client.enabled:
+                exit_code, stdout, stderr, timed_out = _run_adb(
+                    lambda: apk_cache.install(device_id, apk_path, apk_hash, timeout=timeout)
+                )
+            else:
+                exit_code, stdout, stderr, timed_out = _run_process(
+                    [adb_path, '-s', device_id, 'install', '-r', apk_path],
+                    timeout, env
+                )
+
+        if timed_out:
+            return _build_result(device_id, False, f'应用安装超时（{timeout}秒）', stdout, stderr)
+        success = exit_code == 0
+        return _build_result(device_id, success, '应用安装成功' if success else '应用安装失败', stdout, stderr, exit_code)
+
+    if task_type == 'shell':
+        # 执行 Shell 脚本
+        env = os.environ.copy()
+        env['ADB'] = adb_path
+
+        if file_content:
+            # 执行脚本内容
+            shell_args = [file_content]
+        elif file_path:
+            # 执行脚本文件
+            with open(file_path, 'r', encoding='utf-8') as f:
+                shell_args = [f.read()]
+        elif command:
+            # 执行命令
+            shell_args = command.split()
+        else:
+            raise ValueError('请提供脚本文件或命令')
+
+        if adb_client.enabled and on_output is not None:
+            # 流式输出使用独立的 shell 连接，保留 stdout/stderr 的区分
+            exit_code, stdout, stderr, timed_out = _run_adb(
+                lambda: adb_client.shell(device_id, ' '.join(shell_args), timeout, on_output=on_output)
+            )
+        elif adb_client.enabled:
+            # 复用设备上的长连接 shell 会话
+            exit_code, stdout, stderr, timed_out = _run_adb(
+                lambda: shell_sessions.run(device_id, ' '.join(shell_args), timeout)
+            )
+        else:
+            exit_code, stdout, stderr, timed_out = _run_process(
+                [adb_path, '-s', device_id, 'shell'] + shell_args, timeout, env, on_output
+            )
+        if timed_out:
+            return _build_result(device_id, False, f'命令执行超时（{timeout}秒）', stdout, stderr)
+        success = exit_code == 0
+        return _build_result(device_id, success, '命令执行成功' if success else '命令执行失败', stdout, stderr, exit_code)
+
+    if task_type == 'python':
+        # 执行 Python 脚本（使用本地Python解释器）
+        if file_content:
+            script_content = file_content
+        elif file_path:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                script_content = f.read()
+        else:
+            # 直接执行 Python 命令
+            script_content = command
+
+        if python_workers.enabled:
+            # 交给预热好的工作进程执行，设备ID等通过请求传入
+            request = python_workers.build_request(
+                script_content, script_args, {'DEVICE_ID': device_id, 'ADB_PATH': adb_path}, timeout
+            )
+            exit_code, stdout, stderr, timed_out = _wait_process(
+                python_workers.acquire(), timeout, on_output, request
+            )
+        else:
+            # 保存到临时文件
+            with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False, encoding='utf-8') as f:
+                f.write(script_content)
+                temp_script_path = f.name
+
+            try:
+                # 设置环境变量，传递设备ID
+                env = os.environ.copy()
+                env['DEVICE_ID'] = device_id
+                env['ADB_PATH'] = adb_path
+
+                exit_code, stdout, stderr, timed_out = _run_process(
+                    [sys.executable, temp_script_path] + list(script_args or []), timeout, env, on_output
+                )
+            finally:
+                # 清理临时文件
+                if os.path.exists(temp_script_path):
+                    os.unlink(temp_script_path)
+
+        if timed_out:
+            return _build_result(device_id, False, f'Python 脚本执行超时（{timeout}秒）', stdout, stderr)
+        success = exit_code == 0
+        return _build_result(device_id, success, 'Python 脚本执行成功' if success else 'Python 脚本执行失败', stdout, stderr, exit_code)
+
+    raise ValueError('不支持的任务类型')
+
+
+def submit_leased_device_task(device_id, task_type: str, task_id: Optional[int] = None, priority: str = 'medium',
+                              lease_timeout: Optional[float] = None, **kwargs) -> Future:
+    """
+    排队租用设备，取得租约后才提交到执行器线程池执行；等待设备空闲期间不占用线程池名额，
+    空闲设备上的任务不会被等待忙碌设备的任务挡住
+
+    Args:
+        device_id: 设备序列号
+        task_type: 任务类型 install / shell / python
+        task_id: 关联的测试任务ID
+        priority: 任务优先级 high / medium / low
+        lease_timeout: 等待租约的最长时间（秒），默认使用租约管理器的配置
+        **kwargs: 传给 run_device_task 的其余参数
+
+    Returns:
+        Future，结果为单设备执行结果字典（duration 为取得租约后的执行耗时，秒）；
+        等待租约超时或设备维护中时 Future 抛出 DeviceLeaseError
+    """
+    device_id = str(device_id)
+
+    def run():
+        started = time.monotonic()
+        result = run_device_task(device_id, task_type, **kwargs)
+        result['duration'] = round(time.monotonic() - started, 2)
+        return result
+
+    return device_executor.submit_leased(device_id, run, task_id=task_id, priority=priority, lease_timeout=lease_timeout)
+
+
+def run_batch_device_task(device_ids: List, task_type: str, command: str = '', file_path: str = '',
+                          file_content: str = '', task_id: Optional[int] = None,
+                          file_hash: str = '') -> List[Dict[str, Any]]:
+    """
+    在多台设备上并发执行同一个任务（立即执行的批量任务和定时任务共用）
+    每台设备租用后才执行，被其他任务占用的设备按测试任务优先级排队等待
+
+    Returns:
+        与 device_ids 顺序一致的结果列表
+    """
+    # 只有直接执行 Python 命令时才把命令拆分为脚本参数
+    script_args = None
+    if task_type == 'python' and command and not file_content and not file_path:
+        script_args = command.split()
+    priority = device_leases.task_priority(task_id)
+
+    with ExitStack() as stack:
+        if task_type == 'install' and (file_content or file_path or file_hash):
+            # 安装包在分发到各设备前解码并缓存一次，各设备直接使用缓存文件；批量执行期间占用缓存文件
+            try:
+                file_path, file_hash = stack.enter_context(
+                    apk_cache.staged(file_content=file_content, file_path=file_path, file_hash=file_hash)
+                )
+            except Exception as e:
+                logger.warning(f"安装包准备失败: {e}")
+                return [_build_result(str(device_id), False, f'安装包准备失败: {e}') for device_id in device_ids]
+            file_content = ''
+
+        futures = [(device_id, submit_leased_device_task(
+            device_id, task_type, task_id=task_id, priority=priority, lease_timeout=device_executor.batch_deadline,
+            command=command, file_path=file_path, file_content=file_content, file_hash=file_hash,
+            script_args=script_args, timeout=device_executor.device_timeout
+        )) for device_id in device_ids]
+        return device_executor.collect(futures)
+
+
+class DeviceTaskExecutor:
+    """
+    设备任务并发执行器
+    整个进程共享一个有界线程池，限制本机同时操作的设备数量；
+    单设备失败或超时只影响该设备的结果，其余设备的结果照常返回
+    """
+
+    def __init__(self, max_workers: int = 8, device_timeout: Optional[float] = 600,
+                 batch_deadline: Optional[float] = None):
+        self.max_workers = max_workers
+        self.device_timeout = device_timeout
+        self.batch_deadline = batch_deadline
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def configure(self, max_workers: int = None, device_timeout: Optional[float] = None,
+                  batch_deadline: Optional[float] = None):
+        """
+        调整并发上限和超时时间
+
+        Args:
+            max_workers: 本机最大并发设备数
+            device_timeout: 单设备超时时间（秒），0 或 None 表示不限制
+            batch_deadline: 整批任务最长等待时间（秒），0 或 None 表示不限制
+        """
+        with self._lock:
+            if max_workers and max_workers != self.max_workers:
+                self.max_workers = max_workers
+                if self._pool is not None:
+                    # 已提交的任务继续执行，新任务使用新线程池
+                    self._pool.shutdown(wait=False)
+                    self._pool = None
+            self.device_timeout = device_timeout or None
+            self.batch_deadline = batch_deadline or None
+
+    @property
+    def pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='device-task')
+            return self._pool
+
+    def submit(self, func: Callable, *args, **kwargs):
+        """提交单个设备任务，返回 Future"""
+        return self.pool.submit(func, *args, **kwargs)
+
+    def submit_leased(self, device_serial: str, func: Callable[[], Dict[str, Any]], task_id: Optional[int] = None,
+                      priority: str = 'medium', lease_timeout: Optional[float] = None) -> Future:
+        """
+        在独立的等待线程中按优先级排队租用设备，取得租约后才把 func 提交到线程池，执行结束释放租约；
+        未启用租约管理时直接提交。无法取得租约时 Future 抛出 DeviceLeaseError；
+        返回的 Future 在开始执行前取消后，即使之后取得租约也不再执行
+        """
+        future = Future()
+
+        def execute(lease):
+            try:
+                if not future.set_running_or_notify_cancel():
+                    return
+                try:
+                    future.set_result(func())
+                except Exception as e:
+                    future.set_exception(e)
+            finally:
+                if lease is not None:
+                    device_leases.release(lease)
+
+        def wait_for_lease():
+            try:
+                lease = device_leases.acquire(device_serial, task_id, priority, lease_timeout)
+            except Exception as e:
+                if future.set_running_or_notify_cancel():
+                    future.set_exception(e)
+                return
+            if future.cancelled():
+                device_leases.release(lease)
+                return
+            try:
+                self.submit(execute, lease)
+            except Exception as e:
+                device_leases.release(lease)
+                if future.set_running_or_notify_cancel():
+                    future.set_exception(e)
+
+        if device_leases.active:
+            threading.Thread(target=wait_for_lease, name='device-lease-wait', daemon=True).start()
+        else:
+            self.submit(execute, None)
+        return future
+
+    def run_on_devices(self, device_ids: List, func: Callable[[Any], Dict[str, Any]],
+                       deadline: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        在多台设备上并发执行任务
+
+        Args:
+            device_ids: 设备标识列表
+            func: 单设备执行函数，参数为设备标识，返回结果字典
+            deadline: 整批任务的最长等待时间（秒），默认使用 batch_deadline，超时后未完成的设备返回超时结果
+
+        Returns:
+            与 device_ids 顺序一致的结果列表
+        """
+        return self.collect([(device_id, self.submit(func, device_id)) for device_id in device_ids], deadline)
+
+    def collect(self, futures: List, deadline: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        等待各设备的 Future 并收集结果
+
+        Args:
+            futures: [(设备标识, Future)]
+            deadline: 整批任务的最长等待时间（秒），默认使用 batch_deadline；超时后尚未开始执行的设备取消执行
+
+        Returns:
+            与 futures 顺序一致的结果列表
+        """
+        if deadline is None:
+            deadline = self.batch_deadline
+        done, _ = wait([future for _, future in futures], timeout=deadline or None)
+
+        results = []
+        for device_id, future in futures:
+            if future in done:
+                try:
+                    results.append(future.result())
+                except DeviceLeaseError as e:
+                    results.append(_build_result(device_id, False, str(e)))
+                except Exception as e:
+                    logger.warning(f"设备 {device_id} 执行任务失败: {e}")
+                    results.append(_build_result(device_id, False, f'任务执行失败: {str(e)}'))
+            elif future.cancel():
+                results.append(_build_result(device_id, False, f'等待执行超时（{deadline}秒），任务未执行'))
+            else:
+                results.append(_build_result(device_id, False, f'任务执行超时（{deadline}秒）'))
+        return results
+
+
+# 全局设备任务执行器实例
+device_executor = DeviceTaskExecutor()
+
+
+def init_device_executor(app):
+    """根据应用配置初始化设备任务执行器"""
+    device_executor.configure(
+        max_workers=app.config.get('DEVICE_TASK_MAX_WORKERS'),
+        device_timeout=app.config.get('DEVICE_TASK_TIMEOUT'),
+        batch_deadline=app.config.get('DEVICE_BATCH_DEADLINE')
+    )
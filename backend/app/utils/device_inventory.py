@@ -0,0 +1,174 @@
+"""
+设备信息采集
+一条组合 shell 命令一次取回设备型号、系统版本、屏幕、内存、存储、电量等信息（每项一行 @@key=value），
+多台设备并发采集后批量写入 devices 和 device_hardware_specs
+"""
+import re
+import logging
+import subprocess
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from app.models.models import db, Device, DeviceHardwareSpec, LOCAL_TIMEZONE
+from app.utils.adb_client import adb_client, AdbError
+from app.utils.device_executor import device_executor, decode_output, get_adb_path
+
+logger = logging.getLogger(__name__)
+
+# 需要读取的系统属性
+FINGERPRINT_PROPS = {
+    'model': 'ro.product.model',
+    'manufacturer': 'ro.product.manufacturer',
+    'release': 'ro.build.version.release',
+    'sdk': 'ro.build.version.sdk',
+    'cpu_abi': 'ro.product.cpu.abi',
+    'serialno': 'ro.serialno'
+}
+
+# 一次性采集所有信息的组合命令
+FINGERPRINT_COMMAND = '; '.join(
+    [f'echo "@@{key}=$(getprop {prop})"' for key, prop in FINGERPRINT_PROPS.items()] + [
+        'echo "@@wm_size=$(wm size 2>/dev/null | tail -n1)"',
+        'echo "@@wm_density=$(wm density 2>/dev/null | tail -n1)"',
+        'echo "@@mem_total=$(grep MemTotal /proc/meminfo)"',
+        'echo "@@mem_available=$(grep MemAvailable /proc/meminfo)"',
+        'echo "@@df=$(df -h /data 2>/dev/null | tail -n1)"',
+        'echo "@@battery=$(dumpsys battery 2>/dev/null | grep -m1 level)"'
+    ]
+)
+
+FIELD_PATTERN = re.compile(r'^@@(\w+)=(.*)$')
+
+
+def _after_colon(value: str) -> str:
+    return value.split(':')[-1].strip() if ':' in value else value.strip()
+
+
+def _parse_int(value: str) -> Optional[int]:
+    match = re.search(r'\d+', value or '')
+    return int(match.group()) if match else None
+
+
+def parse_fingerprint(output: str) -> Dict[str, object]:
+    """解析组合命令的输出"""
+    fields = {}
+    for line in output.splitlines():
+        match = FIELD_PATTERN.match(line.strip())
+        if match:
+            fields[match.group(1)] = match.group(2).strip()
+
+    storage_total = storage_available = None
+    df_columns = fields.get('df', '').split()
+    # Filesystem Size Used Avail Use% Mounted on
+    if len(df_columns) >= 4:
+        storage_total, storage_available = df_columns[1], df_columns[3]
+
+    return {
+        'model': fields.get('model', ''),
+        'manufacturer': fields.get('manufacturer', ''),
+        'os_version': fields.get('release', ''),
+        'sdk_version': fields.get('sdk', ''),
+        'cpu_abi': fields.get('cpu_abi', ''),
+        'serial_no': fields.get('serialno', ''),
+        'screen_resolution': _after_colon(fields.get('wm_size', '')),
+        'screen_density': _after_colon(fields.get('wm_density', '')),
+        'total_memory_kb': _parse_int(fields.get('mem_total')),
+        'available_memory_kb': _parse_int(fields.get('mem_available')),
+        'storage_total': storage_total,
+        'storage_available': storage_available,
+        'battery_level': _parse_int(_after_colon(fields.get('battery', '')))
+    }
+
+
+def collect_fingerprint(serial: str, timeout: Optional[float] = 30) -> Dict[str, object]:
+    """
+    采集单台设备的信息（一次 shell 往返）
+
+    Returns:
+        {'device_id', 'success', 'message', 'info'}
+    """
+    try:
+        if adb_client.enabled:
+            _, stdout, _ = adb_client.shell(serial, FINGERPRINT_COMMAND, timeout)
+        else:
+            stdout = subprocess.run(
+                [get_adb_path(), '-s', serial, 'shell', FINGERPRINT_COMMAND],
+                capture_output=True, check=False, timeout=timeout
+            ).stdout
+    except (AdbError, subprocess.TimeoutExpired, OSError) as e:
+        return {'device_id': serial, 'success': False, 'message': f'采集设备信息失败: {e}', 'info': None}
+
+    info = parse_fingerprint(decode_output(stdout))
+    if not info['model']:
+        return {'device_id': serial, 'success': False, 'message': '未获取到设备信息', 'info': None}
+    return {'device_id': serial, 'success': True, 'message': '采集成功', 'info': info}
+
+
+def collect_inventory(serials: List[str]) -> List[Dict[str, object]]:
+    """并发采集多台设备的信息，返回与 serials 顺序一致的结果"""
+    return device_executor.run_on_devices(serials, collect_fingerprint)
+
+
+def save_inventory(results: List[Dict[str, object]], register_new: bool = True) -> Dict[str, int]:
+    """
+    批量写入采集结果：更新 devices 的型号和系统版本，写入或更新硬件规格
+
+    Args:
+        results: collect_inventory 的结果
+        register_new: 未登记的设备是否自动创建
+
+    Returns:
+        {'updated': 更新的设备数, 'created': 新建的设备数}
+    """
+    collected = {r['device_id']: r['info'] for r in results if r.get('success') and r.get('info')}
+    if not collected:
+        return {'updated': 0, 'created': 0}
+
+    devices = {d.device_id: d for d in Device.query.filter(Device.device_id.in_(list(collected))).all()}
+    specs = {
+        s.device_id: s for s in DeviceHardwareSpec.query.filter(
+            DeviceHardwareSpec.device_id.in_([d.id for d in devices.values()])
+        ).all()
+    } if devices else {}
+
+    now = datetime.now(LOCAL_TIMEZONE)
+    updated = created = 0
+    for serial, info in collected.items():
+        device = devices.get(serial)
+        if device is None:
+            if not register_new:
+                continue
+            device = Device(
+                device_name=' '.join(filter(None, [info['manufacturer'], info['model']]))[:100],
+                device_model=info['model'][:100],
+                os_type='android',
+                os_version=(info['os_version'] or 'unknown')[:50],
+                device_id=serial,
+                status='online'
+            )
+            db.session.add(device)
+            created += 1
+        else:
+            device.device_model = info['model'][:100]
+            device.os_version = (info['os_version'] or device.os_version)[:50]
+            updated += 1
+
+        spec = specs.get(device.id) if device.id else None
+        if spec is None:
+            spec = DeviceHardwareSpec()
+            device.hardware_spec = spec
+        spec.manufacturer = info['manufacturer']
+        spec.sdk_version = info['sdk_version']
+        spec.cpu_abi = info['cpu_abi']
+        spec.screen_resolution = info['screen_resolution']
+        spec.screen_density = info['screen_density']
+        spec.serial_no = info['serial_no']
+        spec.total_memory_kb = info['total_memory_kb']
+        spec.available_memory_kb = info['available_memory_kb']
+        spec.storage_total = info['storage_total']
+        spec.storage_available = info['storage_available']
+        spec.battery_level = info['battery_level']
+        spec.collected_at = now
+
+    db.session.commit()
+    return {'updated': updated, 'created': created}
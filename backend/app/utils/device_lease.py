@@ -0,0 +1,308 @@
+"""
+设备租约管理
+任务在设备上执行前必须先取得该设备的租约：device_leases.device_serial 唯一约束保证同一时间只有一个持有者，
+持有期间 devices.status 置为 busy，释放后恢复；租约通过心跳续期，进程异常退出后租约到期自动失效。
+同一设备的等待者按测试任务优先级排队，设备空闲后优先分配给高优先级任务
+"""
+import heapq
+import itertools
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy.exc import IntegrityError
+
+from app.models.models import db, Device, DeviceLease, TestTask, LOCAL_TIMEZONE
+
+logger = logging.getLogger(__name__)
+
+# 优先级排序：数值越小越先分配
+PRIORITY_RANK = {'high': 0, 'medium': 1, 'low': 2}
+
+
+class DeviceLeaseError(Exception):
+    """无法取得设备租约"""
+
+
+class DeviceLeaseTimeout(DeviceLeaseError):
+    """等待设备空闲超时"""
+
+
+class DeviceUnavailableError(DeviceLeaseError):
+    """设备处于维护状态，不可租用"""
+
+
+class Lease:
+    """本进程持有的一条租约"""
+
+    def __init__(self, device_serial: str, holder: str, task_id: Optional[int], priority: str):
+        self.device_serial = device_serial
+        self.holder = holder
+        self.task_id = task_id
+        self.priority = priority
+        self.released = False
+
+
+class DeviceLeaseManager:
+
+    def __init__(self, lease_ttl: float = 120, heartbeat_interval: float = 30, poll_interval: float = 2,
+                 wait_timeout: Optional[float] = 1800):
+        self.lease_ttl = lease_ttl
+        self.heartbeat_interval = heartbeat_interval
+        self.poll_interval = poll_interval
+        self.wait_timeout = wait_timeout
+        self.enabled = True
+        self._app = None
+        self._held: Dict[str, Lease] = {}
+        # 每台设备的等待队列：serial -> [(优先级, 序号, 等待者标识)]
+        self._waiters: Dict[str, List] = {}
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._heartbeat_thread = None
+        self._holder_prefix = f'{socket.gethostname()}:{os.getpid()}'
+
+    def configure(self, lease_ttl: float = None, heartbeat_interval: float = None,
+                  wait_timeout: float = None, enabled: bool = None):
+        if lease_ttl:
+            self.lease_ttl = lease_ttl
+        if heartbeat_interval:
+            self.heartbeat_interval = heartbeat_interval
+        if wait_timeout is not None:
+            self.wait_timeout = wait_timeout or None
+        if enabled is not None:
+            self.enabled = enabled
+
+    def init_app(self, app):
+        self._app = app
+
+    @property
+    def active(self) -> bool:
+        """是否启用租约管理（未启用或未初始化时执行任务不租用设备）"""
+        return self.enabled and self._app is not None
+
+    # ------------------------------------------------------------------
+    # 租用与释放
+    # ------------------------------------------------------------------
+
+    def acquire(self, device_serial: str, task_id: Optional[int] = None, priority: str = 'medium',
+                timeout: Optional[float] = None) -> Lease:
+        """
+        租用设备，设备被占用时按优先级排队等待
+
+        Args:
+            device_serial: 设备序列号
+            task_id: 关联的测试任务ID
+            priority: 任务优先级 high / medium / low
+            timeout: 最长等待时间（秒），默认使用 wait_timeout
+
+        Returns:
+            Lease；等待超时抛出 DeviceLeaseTimeout，设备维护中抛出 DeviceUnavailableError
+        """
+        device_serial = str(device_serial)
+        priority = priority if priority in PRIORITY_RANK else 'medium'
+        timeout = self.wait_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout if timeout else None
+        holder = f'{self._holder_prefix}:{uuid.uuid4().hex[:12]}'
+        entry = (PRIORITY_RANK[priority], next(self._counter), holder)
+
+        with self._condition:
+            heapq.heappush(self._waiters.setdefault(device_serial, []), entry)
+        try:
+            while True:
+                with self._condition:
+                    # 只有排在队首的等待者尝试租用，保证本进程内按优先级分配
+                    while self._waiters[device_serial][0] is not entry:
+                        if not self._condition.wait(timeout=self._remaining(deadline)):
+                            if deadline is not None and time.monotonic() >= deadline:
+                                raise DeviceLeaseTimeout(f'设备 {device_serial} 忙碌，等待超时（{timeout}秒）')
+                lease = self._try_acquire(device_serial, holder, task_id, priority)
+                if lease is not None:
+                    return lease
+                # 设备被其他进程或任务占用，等待释放通知或轮询
+                with self._condition:
+                    remaining = self._remaining(deadline)
+                    if deadline is not None and remaining <= 0:
+                        raise DeviceLeaseTimeout(f'设备 {device_serial} 忙碌，等待超时（{timeout}秒）')
+                    self._condition.wait(timeout=min(self.poll_interval, remaining))
+        finally:
+            with self._condition:
+                queue = self._waiters[device_serial]
+                queue.remove(entry)
+                heapq.heapify(queue)
+                if not queue:
+                    del self._waiters[device_serial]
+                self._condition.notify_all()
+
+    def _remaining(self, deadline: Optional[float]) -> float:
+        if deadline is None:
+            return self.poll_interval
+        return max(deadline - time.monotonic(), 0)
+
+    def _try_acquire(self, device_serial: str, holder: str, task_id: Optional[int], priority: str) -> Optional[Lease]:
+        """尝试插入租约记录，唯一约束冲突说明设备已被占用"""
+        now = datetime.now(LOCAL_TIMEZONE)
+        with self._app.app_context():
+            try:
+                self._expire(DeviceLease.device_serial == device_serial)
+                device = Device.query.filter_by(device_id=device_serial).first()
+                if device and device.status == 'maintenance':
+                    raise DeviceUnavailableError(f'设备 {device_serial} 维护中，不可执行任务')
+                db.session.add(DeviceLease(
+                    device_serial=device_serial,
+                    holder=holder,
+                    task_id=task_id,
+                    priority=priority,
+                    previous_status=device.status if device else None,
+                    acquired_at=now,
+                    heartbeat_at=now,
+                    expires_at=now + timedelta(seconds=self.lease_ttl)
+                ))
+                db.session.flush()
+                if device:
+                    Device.query.filter(Device.id == device.id, Device.status != 'maintenance').update(
+                        {'status': 'busy'}, synchronize_session=False
+                    )
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()
+                return None
+            except Exception:
+                db.session.rollback()
+                raise
+
+        lease = Lease(device_serial, holder, task_id, priority)
+        with self._condition:
+            self._held[holder] = lease
+        self._ensure_heartbeat()
+        logger.info(f"设备 {device_serial} 已租用（任务 {task_id}，优先级 {priority}）")
+        return lease
+
+    def release(self, lease: Lease):
+        """释放租约，恢复设备原状态并唤醒等待者"""
+        if lease.released:
+            return
+        lease.released = True
+        with self._condition:
+            self._held.pop(lease.holder, None)
+        try:
+            with self._app.app_context():
+                self._expire(DeviceLease.holder == lease.holder, force=True)
+        except Exception as e:
+            # 释放失败时租约到期后自动失效
+            logger.error(f"释放设备 {lease.device_serial} 的租约失败: {e}")
+        with self._condition:
+            self._condition.notify_all()
+
+    @contextmanager
+    def lease(self, device_serial: str, task_id: Optional[int] = None, priority: str = 'medium',
+              timeout: Optional[float] = None):
+        """租用设备的上下文管理器，未启用租约管理时直接执行"""
+        if not self.active:
+            yield None
+            return
+        lease = self.acquire(device_serial, task_id, priority, timeout)
+        try:
+            yield lease
+        finally:
+            self.release(lease)
+
+    def _expire(self, criterion, force: bool = False) -> int:
+        """删除符合条件的租约（force=False 时只删除已过期的），恢复对应设备的状态，需在应用上下文中调用"""
+        query = DeviceLease.query.filter(criterion)
+        if not force:
+            query = query.filter(DeviceLease.expires_at < datetime.now(LOCAL_TIMEZONE))
+        leases = query.all()
+        for lease in leases:
+            if not force:
+                logger.warning(f"设备 {lease.device_serial} 的租约已过期（持有者 {lease.holder}），自动回收")
+            Device.query.filter(Device.device_id == lease.device_serial, Device.status == 'busy').update(
+                {'status': lease.previous_status if lease.previous_status in ('online', 'offline') else 'online'},
+                synchronize_session=False
+            )
+            db.session.delete(lease)
+        db.session.commit()
+        return len(leases)
+
+    # ------------------------------------------------------------------
+    # 心跳
+    # ------------------------------------------------------------------
+
+    def _ensure_heartbeat(self):
+        with self._condition:
+            if self._heartbeat_thread is not None and self._heartbeat_thread.is_alive():
+                return
+            self._heartbeat_thread = threading.Thread(target=self._heartbeat_loop, name='device-lease-heartbeat', daemon=True)
+            self._heartbeat_thread.start()
+
+    def _heartbeat_loop(self):
+        while True:
+            time.sleep(self.heartbeat_interval)
+            try:
+                self.heartbeat()
+            except Exception as e:
+                logger.error(f"设备租约续期失败: {e}")
+
+    def heartbeat(self):
+        """为本进程持有的租约续期，并回收其他进程遗留的过期租约"""
+        with self._condition:
+            holders = list(self._held)
+        now = datetime.now(LOCAL_TIMEZONE)
+        with self._app.app_context():
+            try:
+                if holders:
+                    DeviceLease.query.filter(DeviceLease.holder.in_(holders)).update({
+                        'heartbeat_at': now,
+                        'expires_at': now + timedelta(seconds=self.lease_ttl)
+                    }, synchronize_session=False)
+                    db.session.commit()
+                expired = self._expire(DeviceLease.id.isnot(None))
+            except Exception:
+                db.session.rollback()
+                raise
+        if expired:
+            with self._condition:
+                self._condition.notify_all()
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+
+    def list_leases(self) -> List[Dict]:
+        """当前所有租约及本进程的等待队列"""
+        with self._condition:
+            waiting = {serial: len(queue) for serial, queue in self._waiters.items()}
+        leases = []
+        for lease in DeviceLease.query.order_by(DeviceLease.acquired_at).all():
+            item = lease.to_dict()
+            item['waiting'] = waiting.get(lease.device_serial, 0)
+            leases.append(item)
+        return leases
+
+    def task_priority(self, task_id: Optional[int]) -> str:
+        """获取测试任务的优先级，用于排队"""
+        if not task_id or self._app is None:
+            return 'medium'
+        with self._app.app_context():
+            task = TestTask.query.get(task_id)
+            return task.priority if task and task.priority else 'medium'
+
+
+# 全局设备租约管理器实例
+device_leases = DeviceLeaseManager()
+
+
+def init_device_leases(app):
+    """根据应用配置初始化设备租约管理器"""
+    device_leases.configure(
+        lease_ttl=app.config.get('DEVICE_LEASE_TTL'),
+        heartbeat_interval=app.config.get('DEVICE_LEASE_HEARTBEAT_INTERVAL'),
+        wait_timeout=app.config.get('DEVICE_LEASE_WAIT_TIMEOUT'),
+        enabled=app.config.get('DEVICE_LEASE_ENABLED', True)
+    )
+    device_leases.init_app(app)
@@ -0,0 +1,193 @@
+"""
+设备状态注册表
+后台线程订阅 adb track-devices（协议客户端关闭时退回定时执行 adb devices -l），
+在内存中维护设备状态表，状态查询接口直接读取缓存；
+设备上线/离线的变化按批写回 devices.status
+"""
+import logging
+import subprocess
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from app.models.models import db, Device, LOCAL_TIMEZONE
+from app.utils.adb_client import adb_client, parse_devices_l
+
+logger = logging.getLogger(__name__)
+
+
+class DeviceRegistry:
+    """内存设备状态表：serial -> {'serial', 'state', 'info', 'updated_at'}"""
+
+    def __init__(self, poll_interval: float = 3, flush_interval: float = 5, retry_interval: float = 5):
+        self.poll_interval = poll_interval
+        self.flush_interval = flush_interval
+        self.retry_interval = retry_interval
+        self.states: Dict[str, Dict] = {}
+        self.lock = threading.Lock()
+        # 与 adb server 的订阅是否正常；断开期间缓存不可信，查询接口回退为实时查询
+        self.synced = False
+        self.last_sync = None
+        self._dirty = False
+        self._app = None
+        self._threads = []
+        self._stop = threading.Event()
+
+    def configure(self, poll_interval: float = None, flush_interval: float = None):
+        if poll_interval:
+            self.poll_interval = poll_interval
+        if flush_interval:
+            self.flush_interval = flush_interval
+
+    # ------------------------------------------------------------------
+    # 查询
+    # ------------------------------------------------------------------
+
+    def get(self, serial: str) -> Optional[Dict]:
+        """
+        获取单台设备的缓存状态
+
+        Returns:
+            缓存未同步时返回 None；设备未连接时 state 为空字符串
+        """
+        if not self.synced:
+            return None
+        entry = self.states.get(serial)
+        if entry is None:
+            return {'serial': serial, 'state': '', 'info': '', 'updated_at': self.last_sync}
+        return entry
+
+    def list_devices(self) -> Optional[List[Dict]]:
+        """获取已连接设备列表，格式同 adb_client.list_devices；缓存未同步时返回 None"""
+        if not self.synced:
+            return None
+        with self.lock:
+            return list(self.states.values())
+
+    # ------------------------------------------------------------------
+    # 更新
+    # ------------------------------------------------------------------
+
+    def apply(self, entries: List[Dict]):
+        """用一次完整的设备列表更新状态表"""
+        now = datetime.now(LOCAL_TIMEZONE).isoformat()
+        with self.lock:
+            old_states = self.states
+            states = {}
+            for entry in entries:
+                previous = old_states.get(entry['serial'])
+                if previous and previous['state'] == entry['state'] and previous['info'] == entry['info']:
+                    states[entry['serial']] = previous
+                    continue
+                states[entry['serial']] = dict(entry, updated_at=now)
+                if not previous or previous['state'] != entry['state']:
+                    logger.info(f"设备 {entry['serial']} 状态变为 {entry['state']}")
+                    self._dirty = True
+            for serial in old_states.keys() - states.keys():
+                logger.info(f"设备 {serial} 已断开")
+                self._dirty = True
+            self.states = states
+            if not self.synced:
+                # 首次同步需要校正数据库中的全部设备状态
+                self._dirty = True
+            self.synced = True
+            self.last_sync = now
+
+    def flush(self) -> int:
+        """
+        把在线/离线状态批量写回数据库
+        只在 online/offline 之间切换，busy、maintenance 由任务和人工维护，不覆盖
+
+        Returns:
+            更新的行数
+        """
+        with self.lock:
+            if not self._dirty or not self.synced:
+                return 0
+            online = [serial for serial, entry in self.states.items() if entry['state'] == 'device']
+            self._dirty = False
+
+        now = datetime.now(LOCAL_TIMEZONE)
+        try:
+            to_online = Device.query.filter(
+                Device.status == 'offline', Device.device_id.in_(online)
+            ).update({'status': 'online', 'updated_at': now}, synchronize_session=False)
+            to_offline = Device.query.filter(
+                Device.status == 'online', Device.device_id.notin_(online)
+            ).update({'status': 'offline', 'updated_at': now}, synchronize_session=False)
+            db.session.commit()
+            return to_online + to_offline
+        except Exception as e:
+            db.session.rollback()
+            with self.lock:
+                self._dirty = True
+            logger.error(f"写入设备状态失败: {e}")
+            return 0
+
+    # ------------------------------------------------------------------
+    # 后台线程
+    # ------------------------------------------------------------------
+
+    def start(self, app):
+        """启动状态监听线程和写回线程"""
+        if self._threads:
+            return
+        self._app = app
+        self._stop.clear()
+        for target, name in ((self._watch_loop, 'device-registry-watch'), (self._flush_loop, 'device-registry-flush')):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self):
+        self._stop.set()
+        self._threads = []
+
+    def _watch_loop(self):
+        while not self._stop.is_set():
+            try:
+                if adb_client.enabled:
+                    # 长连接订阅，设备变化时 adb server 主动推送
+                    for entries in adb_client.track_devices():
+                        self.apply(entries)
+                        if self._stop.is_set():
+                            return
+                else:
+                    self.apply(self._poll_adb())
+                    self._stop.wait(self.poll_interval)
+                    continue
+            except Exception as e:
+                logger.warning(f"设备状态监听中断，{self.retry_interval} 秒后重试: {e}")
+            self.synced = False
+            self._stop.wait(self.retry_interval)
+
+    @staticmethod
+    def _poll_adb() -> List[Dict]:
+        from app.utils.device_executor import get_adb_path
+        result = subprocess.run([get_adb_path(), 'devices', '-l'], capture_output=True, text=True, check=True,
+                                encoding='utf-8', errors='ignore', timeout=30)
+        return parse_devices_l(result.stdout)
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                with self._app.app_context():
+                    updated = self.flush()
+                if updated:
+                    logger.info(f"已同步 {updated} 台设备的在线状态")
+            except Exception as e:
+                logger.error(f"同步设备状态失败: {e}")
+
+
+# 全局设备状态注册表实例
+device_registry = DeviceRegistry()
+
+
+def init_device_registry(app):
+    """根据应用配置启动设备状态注册表"""
+    device_registry.configure(
+        poll_interval=app.config.get('DEVICE_POLL_INTERVAL'),
+        flush_interval=app.config.get('DEVICE_STATUS_FLUSH_INTERVAL')
+    )
+    if app.config.get('DEVICE_REGISTRY_ENABLED', True):
+        device_registry.start(app)
@@ -0,0 +1,137 @@
+"""
+需求文档分段
+按标题切分为章节，再把相邻章节合并为不超过 token 预算的分段；超出预算的章节按段落、行依次细分。
+每个分段带上所属的标题路径，单独生成用例时 AI 仍能知道该段在文档中的位置
+"""
+import re
+from typing import List
+
+# Markdown 标题（# 标题）以及常见的中文编号标题（一、 / （一） / 1. / 1.1 / 第一章）
+HEADING_PATTERN = re.compile(
+    r'^\s*(?:'
+    r'(?P<md>#{1,6})\s+\S'
+    r'|(?P<cn>[一二三四五六七八九十]+、)'
+    r'|(?P<cnp>[（(][一二三四五六七八九十]+[）)])'
+    r'|(?P<num>\d+(?:\.\d+)*)[.、]?\s*[^\d\s.、]'
+    r'|(?P<chapter>第[一二三四五六七八九十百\d]+[章节部分])'
+    r')'
+)
+
+# 中日韩字符，按每个字符约 1 个 token 估算
+CJK_PATTERN = re.compile('[\u3000-\u303f\u3400-\u9fff\uf900-\ufaff\uff00-\uffef]')
+
+
+def estimate_tokens(text: str) -> int:
+    """估算文本的 token 数：中文每字约 1 个，其他字符每 4 个约 1 个"""
+    if not text:
+        return 0
+    cjk = len(CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def _heading_level(line: str) -> int:
+    """标题级别（数字越小级别越高），不是标题时返回 0"""
+    if len(line) > 80:
+        return 0
+    match = HEADING_PATTERN.match(line)
+    if not match:
+        return 0
+    if match.group('md'):
+        return len(match.group('md'))
+    if match.group('chapter'):
+        return 1
+    if match.group('cn'):
+        return 2
+    if match.group('cnp'):
+        return 3
+    return 2 + match.group('num').count('.')
+
+
+def split_sections(text: str) -> List[dict]:
+    """按标题切分章节，返回 [{'path': [上级标题..., 本节标题], 'text': 章节全文（含标题行）}]"""
+    sections = []
+    stack = []  # [(级别, 标题)]
+    lines = []
+
+    def close():
+        body = '\n'.join(lines).strip()
+        if body:
+            sections.append({'path': [title for _, title in stack], 'text': body})
+        lines.clear()
+
+    for line in text.splitlines():
+        level = _heading_level(line)
+        if level:
+            close()
+            while stack and stack[-1][0] >= level:
+                stack.pop()
+            stack.append((level, line.strip().lstrip('#').strip()))
+        lines.append(line)
+    close()
+    return sections
+
+
+def _split_oversized(text: str, max_tokens: int) -> List[str]:
+    """把超出预算的文本按段落、行、固定长度依次细分"""
+    if estimate_tokens(text) <= max_tokens:
+        return [text]
+    for separator in ('\n\n', '\n'):
+        parts = [part for part in text.split(separator) if part.strip()]
+        if len(parts) > 1:
+            return _pack(parts, max_tokens, separator)
+    # 没有换行的超长段落按字符数硬切分（中文按 1 字 1 token 保守估算）
+    return [text[i:i + max_tokens] for i in range(0, len(text), max_tokens)]
+
+
+def _pack(parts: List[str], max_tokens: int, separator: str) -> List[str]:
+    """按顺序合并相邻片段，每段不超过预算"""
+    chunks = []
+    current, current_tokens = [], 0
+    for part in parts:
+        for piece in _split_oversized(part, max_tokens):
+            tokens = estimate_tokens(piece)
+            if current and current_tokens + tokens > max_tokens:
+                chunks.append(separator.join(current))
+                current, current_tokens = [], 0
+            current.append(piece)
+            current_tokens += tokens
+    if current:
+        chunks.append(separator.join(current))
+    return chunks
+
+
+def split_document(text: str, max_tokens: int = 3000) -> List[str]:
+    """
+    把需求文档切分为不超过 max_tokens 的分段，优先在标题处切分，其次在段落处
+
+    Args:
+        text: 需求文档内容
+        max_tokens: 每段的 token 预算（估算值）
+
+    Returns:
+        分段文本列表；文档未超出预算时只有一段（原文）
+    """
+    text = (text or '').strip()
+    if estimate_tokens(text) <= max_tokens:
+        return [text] if text else []
+
+    chunks = []
+    current, current_tokens = [], 0
+    for section in split_sections(text):
+        pieces = _split_oversized(section['text'], max_tokens)
+        for index, piece in enumerate(pieces):
+            tokens = estimate_tokens(piece)
+            if current and current_tokens + tokens > max_tokens:
+                chunks.append('\n\n'.join(current))
+                current, current_tokens = [], 0
+            if not current:
+                # 分段从章节中间开始时带上标题路径（第一片已含本节标题，只需上级标题）
+                path = section['path'] if index else section['path'][:-1]
+                if path:
+                    piece = f"【所属章节：{' > '.join(path)}】\n{piece}"
+                    tokens = estimate_tokens(piece)
+            current.append(piece)
+            current_tokens += tokens
+    if current:
+        chunks.append('\n\n'.join(current))
+    return chunks
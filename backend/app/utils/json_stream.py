@@ -0,0 +1,90 @@
+"""
+JSON 数组增量解析
+AI 以流式返回 {"test_cases": [{...}, {...}, ...]} 时，逐段喂入文本，数组中的每个对象一闭合就解析返回，
+不必等待整个响应结束；响应在中途被截断时，已闭合的对象不受影响
+"""
+import re
+import json
+from typing import Any, Dict, List
+
+
+class JsonArrayStreamParser:
+    """增量解析 JSON 文本中指定键对应数组的元素（只返回对象元素）"""
+
+    def __init__(self, key: str = 'test_cases'):
+        self._key_pattern = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+        self._buffer = ''
+        self._pos = 0  # 已扫描到的位置
+        self._start = None  # 当前对象在缓冲区中的起始位置
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self.in_array = False
+        self.finished = False  # 数组已闭合
+        self.count = 0  # 已解析的对象数
+        self.errors = 0  # 无法解析的对象数
+
+    def feed(self, text: str) -> List[Dict[str, Any]]:
+        """喂入一段文本，返回本段中闭合的对象"""
+        if self.finished or not text:
+            return []
+        self._buffer += text
+        if not self.in_array:
+            match = self._key_pattern.search(self._buffer)
+            if not match:
+                return []
+            self._buffer = self._buffer[match.end():]
+            self.in_array = True
+        return self._scan()
+
+    def _scan(self) -> List[Dict[str, Any]]:
+        items = []
+        buffer = self._buffer
+        for index in range(self._pos, len(buffer)):
+            char = buffer[index]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+            if char == '"':
+                self._in_string = True
+            elif char in '{[':
+                if self._depth == 0 and char == '{':
+                    self._start = index
+                self._depth += 1
+            elif char in '}]':
+                if self._depth == 0:
+                    # 数组结束
+                    self.finished = True
+                    break
+                self._depth -= 1
+                if self._depth == 0 and self._start is not None:
+                    item = self._decode(buffer[self._start:index + 1])
+                    if item is not None:
+                        items.append(item)
+                    self._start = None
+
+        # 丢弃已处理的文本，只保留未闭合的对象
+        if self._start is not None:
+            self._buffer = buffer[self._start:]
+            self._pos = len(self._buffer)
+            self._start = 0
+        else:
+            self._buffer = ''
+            self._pos = 0
+        return items
+
+    def _decode(self, text: str):
+        try:
+            item = json.loads(text)
+        except ValueError:
+            self.errors += 1
+            return None
+        if not isinstance(item, dict):
+            return None
+        self.count += 1
+        return item
@@ -0,0 +1,255 @@
+"""
+设备任务输出流
+长时间运行的脚本（monkey、性能采集等）边执行边读取输出：
+最近的输出保存在固定大小的环形缓冲区中供前端按偏移量增量拉取，
+完整日志同时写入 storage 下的日志文件，内存占用与输出总量无关
+"""
+import os
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, Optional
+
+from app.models.models import LOCAL_TIMEZONE
+
+logger = logging.getLogger(__name__)
+
+# 清理过期日志文件的最小间隔（秒），避免每次创建输出流都扫描日志目录
+LOG_SWEEP_INTERVAL = 3600
+
+
+def utf8_safe_end(data: bytes) -> int:
+    """返回 data 中完整 UTF-8 字符的结束位置，避免把多字节字符截断在两次读取之间"""
+    for back in range(1, min(4, len(data)) + 1):
+        byte = data[-back]
+        if byte & 0xC0 == 0x80:
+            # 续字节，继续向前找首字节
+            continue
+        if byte & 0x80 == 0:
+            return len(data)
+        need = 2 if byte & 0xE0 == 0xC0 else 3 if byte & 0xF0 == 0xE0 else 4
+        return len(data) if back >= need else len(data) - back
+    return len(data)
+
+
+class OutputStream:
+    """
+    单个设备任务的输出流
+    偏移量为完整日志中的字节偏移，环形缓冲区保存最近 buffer_size 字节，
+    更早的数据从日志文件读取
+    """
+
+    def __init__(self, stream_id: str, device_id: str, log_path: str, buffer_size: int = 256 * 1024):
+        self.stream_id = stream_id
+        self.device_id = device_id
+        self.log_path = log_path
+        self.buffer_size = buffer_size
+        self.buffer = bytearray()
+        self.total = 0
+        self.finished = False
+        self.result: Optional[Dict] = None
+        self.created_at = datetime.now(LOCAL_TIMEZONE)
+        self.finished_monotonic = None
+        self.condition = threading.Condition()
+        self._log_file = open(log_path, 'ab')
+
+    @property
+    def base_offset(self) -> int:
+        """环形缓冲区中第一个字节的偏移量"""
+        return self.total - len(self.buffer)
+
+    def write(self, data: bytes):
+        if not data:
+            return
+        with self.condition:
+            if self.finished:
+                return
+            self._log_file.write(data)
+            self._log_file.flush()
+            self.buffer += data
+            overflow = len(self.buffer) - self.buffer_size
+            if overflow > 0:
+                del self.buffer[:overflow]
+            self.total += len(data)
+            self.condition.notify_all()
+
+    def close(self, result: Optional[Dict] = None):
+        """结束输出流，result 为 run_device_task 的执行结果"""
+        with self.condition:
+            if self.finished:
+                return
+            self.finished = True
+            self.finished_monotonic = time.monotonic()
+            self.result = result
+            self._log_file.close()
+            self.condition.notify_all()
+
+    def read(self, offset: int = 0, limit: int = 64 * 1024, wait: float = 0) -> Dict:
+        """
+        从指定偏移量读取输出
+
+        Args:
+            offset: 起始字节偏移
+            limit: 最多读取的字节数
+            wait: 没有新输出时最多等待的秒数（长轮询）
+
+        Returns:
+            {'data', 'offset', 'next_offset', 'finished', ...}，
+            客户端下次请求使用 next_offset 继续读取
+        """
+        offset = max(int(offset), 0)
+        with self.condition:
+            if wait and not self.finished and not self._has_complete_data(offset):
+                self.condition.wait(timeout=wait)
+            total = self.total
+            finished = self.finished
+            if offset >= self.base_offset:
+                start = offset - self.base_offset
+                data = bytes(self.buffer[start:start + limit])
+                from_buffer = True
+            else:
+                data = None
+                from_buffer = False
+
+        if not from_buffer:
+            # 已滚出环形缓冲区，从日志文件读取
+            with open(self.log_path, 'rb') as f:
+                f.seek(offset)
+                data = f.read(min(limit, total - offset))
+
+        # 流未结束时不返回不完整的 UTF-8 字符，留到下次读取
+        end = len(data) if finished and offset + len(data) >= total else utf8_safe_end(data)
+        data = data[:end]
+        next_offset = offset + len(data)
+        return {
+            'stream_id': self.stream_id,
+            'device_id': self.device_id,
+            'data': data.decode('utf-8', errors='replace'),
+            'offset': offset,
+            'next_offset': next_offset,
+            'total': total,
+            'finished': finished and next_offset >= total,
+            'result': self.result if finished else None
+        }
+
+    def _has_complete_data(self, offset: int) -> bool:
+        """offset 之后是否有至少一个完整字符可读"""
+        pending = self.total - offset
+        if pending <= 0:
+            return False
+        if pending >= 4 or pending > len(self.buffer):
+            return True
+        return utf8_safe_end(bytes(self.buffer[-pending:])) > 0
+
+    def to_dict(self) -> Dict:
+        return {
+            'stream_id': self.stream_id,
+            'device_id': self.device_id,
+            'total': self.total,
+            'finished': self.finished,
+            'created_at': self.created_at.isoformat(),
+            'result': self.result
+        }
+
+
+class OutputStreamManager:
+    """
+    输出流管理器，已结束的输出流在保留时间后从内存中移除；
+    日志文件按 log_retention 保留，过期后从日志目录删除
+    """
+
+    def __init__(self, log_dir: str = None, buffer_size: int = 256 * 1024, retention: float = 3600,
+                 log_retention: float = 7 * 86400):
+        self.log_dir = log_dir
+        self.buffer_size = buffer_size
+        self.retention = retention
+        self.log_retention = log_retention
+        self.streams: Dict[str, OutputStream] = {}
+        self.lock = threading.Lock()
+        self._last_log_sweep = 0.0
+
+    def configure(self, log_dir: str = None, buffer_size: int = None, retention: float = None,
+                  log_retention: float = None):
+        if log_dir:
+            self.log_dir = log_dir
+        if buffer_size:
+            self.buffer_size = buffer_size
+        if retention:
+            self.retention = retention
+        if log_retention is not None:
+            self.log_retention = log_retention
+
+    def create(self, device_id: str) -> OutputStream:
+        """为设备任务创建输出流"""
+        self.cleanup()
+        os.makedirs(self.log_dir, exist_ok=True)
+        stream_id = uuid.uuid4().hex
+        timestamp = datetime.now(LOCAL_TIMEZONE).strftime('%Y%m%d%H%M%S')
+        safe_device_id = ''.join(c if c.isalnum() or c in '-_.' else '_' for c in device_id)
+        log_path = os.path.join(self.log_dir, f'{timestamp}_{safe_device_id}_{stream_id}.log')
+        stream = OutputStream(stream_id, device_id, log_path, self.buffer_size)
+        with self.lock:
+            self.streams[stream_id] = stream
+        return stream
+
+    def get(self, stream_id: str) -> Optional[OutputStream]:
+        return self.streams.get(stream_id)
+
+    def cleanup(self) -> int:
+        """移除超过保留时间的已结束输出流，并定期删除过期的日志文件"""
+        now = time.monotonic()
+        with self.lock:
+            expired = [
+                stream_id for stream_id, stream in self.streams.items()
+                if stream.finished and now - stream.finished_monotonic > self.retention
+            ]
+            for stream_id in expired:
+                del self.streams[stream_id]
+            sweep_logs = now - self._last_log_sweep >= LOG_SWEEP_INTERVAL
+            if sweep_logs:
+                self._last_log_sweep = now
+        if sweep_logs:
+            self.cleanup_logs()
+        return len(expired)
+
+    def cleanup_logs(self) -> int:
+        """删除最后写入时间超过 log_retention 的日志文件（仍在内存中的输出流除外），返回删除数量"""
+        if not self.log_retention or not self.log_dir:
+            return 0
+        try:
+            names = [name for name in os.listdir(self.log_dir) if name.endswith('.log')]
+        except OSError:
+            return 0
+        with self.lock:
+            active = {os.path.abspath(stream.log_path) for stream in self.streams.values()}
+        cutoff = time.time() - self.log_retention
+        removed = 0
+        for name in names:
+            path = os.path.abspath(os.path.join(self.log_dir, name))
+            if path in active:
+                continue
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.unlink(path)
+                    removed += 1
+            except OSError:
+                continue
+        if removed:
+            logger.info(f"已删除 {removed} 个过期的设备任务日志文件")
+        return removed
+
+
+# 全局输出流管理器实例
+output_streams = OutputStreamManager()
+
+
+def init_output_streams(app):
+    """根据应用配置初始化输出流管理器"""
+    output_streams.configure(
+        log_dir=app.config.get('DEVICE_LOG_PATH'),
+        buffer_size=app.config.get('DEVICE_STREAM_BUFFER_SIZE'),
+        retention=app.config.get('DEVICE_STREAM_RETENTION'),
+        log_retention=app.config.get('DEVICE_LOG_RETENTION_DAYS', 7) * 86400
+    )
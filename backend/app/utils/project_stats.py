@@ -0,0 +1,125 @@
+"""
+项目统计
+项目列表和详情中的用例、迭代、需求统计以及成员列表，按项目 ID 批量用聚合查询计算，
+一页项目只需固定几次查询，不再逐个项目加载全部用例、执行记录、迭代和需求后在内存中计数
+"""
+from typing import Any, Dict, Iterable
+
+from sqlalchemy import case, distinct, func
+
+from app.models.models import (
+    db, TestCase, TestCaseExecution, Iteration, VersionRequirement, ProjectMember, User,
+    ITERATION_STATUS, VERSION_REQUIREMENT_STATUS
+)
+
+# case_stats 中单独计数的用例状态
+CASE_STAT_STATUSES = ('pass', 'fail', 'blocked', 'not_applicable')
+
+
+def _empty_stats() -> Dict[str, Any]:
+    return {
+        'case_counts': {},
+        'total_cases': 0,
+        'executed_cases': 0,
+        'passed_cases': 0,
+        'iterations': [],
+        'iteration_counts': {},
+        'requirement_counts': {},
+        'members': []
+    }
+
+
+def _percent(part: int, whole: int) -> float:
+    return round(part / whole * 100, 2) if whole > 0 else 0
+
+
+def get_project_stats(project_ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+    """
+    批量计算项目统计
+
+    Args:
+        project_ids: 项目ID列表
+
+    Returns:
+        {项目ID: 统计}，统计传给 Project.to_dict(stats=...)；不存在的项目统计为空
+    """
+    project_ids = list(set(project_ids))
+    stats = {project_id: _empty_stats() for project_id in project_ids}
+    if not project_ids:
+        return stats
+
+    # 用例按状态计数
+    for project_id, status, count in db.session.query(
+        TestCase.project_id, TestCase.status, func.count(TestCase.id)
+    ).filter(TestCase.project_id.in_(project_ids)).group_by(TestCase.project_id, TestCase.status):
+        stats[project_id]['case_counts'][status] = count
+        stats[project_id]['total_cases'] += count
+
+    # 有执行记录的用例数、有通过记录的用例数
+    for project_id, executed, passed in db.session.query(
+        TestCase.project_id,
+        func.count(distinct(TestCaseExecution.case_id)),
+        func.count(distinct(case((TestCaseExecution.status == 'pass', TestCaseExecution.case_id))))
+    ).join(TestCaseExecution, TestCaseExecution.case_id == TestCase.id).filter(
+        TestCase.project_id.in_(project_ids)
+    ).group_by(TestCase.project_id):
+        stats[project_id]['executed_cases'] = executed
+        stats[project_id]['passed_cases'] = passed
+
+    # 迭代名称列表与按状态计数（迭代需要返回名称，直接取行计数）
+    for project_id, iteration_name, status in db.session.query(
+        Iteration.project_id, Iteration.iteration_name, Iteration.status
+    ).filter(Iteration.project_id.in_(project_ids)).order_by(Iteration.id):
+        project_stats = stats[project_id]
+        project_stats['iterations'].append(iteration_name)
+        project_stats['iteration_counts'][status] = project_stats['iteration_counts'].get(status, 0) + 1
+
+    # 版本需求按状态计数
+    for project_id, status, count in db.session.query(
+        VersionRequirement.project_id, VersionRequirement.status, func.count(VersionRequirement.id)
+    ).filter(VersionRequirement.project_id.in_(project_ids)).group_by(VersionRequirement.project_id, VersionRequirement.status):
+        stats[project_id]['requirement_counts'][status] = count
+
+    # 项目成员，用户不存在时显示为"未知用户"
+    for project_id, user_id, role, real_name in db.session.query(
+        ProjectMember.project_id, ProjectMember.user_id, ProjectMember.role, User.real_name
+    ).outerjoin(User, User.id == ProjectMember.user_id).filter(
+        ProjectMember.project_id.in_(project_ids)
+    ).order_by(ProjectMember.id):
+        stats[project_id]['members'].append({
+            'user_id': user_id,
+            'user_name': real_name if real_name is not None else "未知用户",
+            'role': role
+        })
+
+    return stats
+
+
+def build_stats_fields(stats: Dict[str, Any]) -> Dict[str, Any]:
+    """把 get_project_stats 的单个项目统计转换为 Project.to_dict 中的统计字段"""
+    total_cases = stats['total_cases']
+    executed_cases = stats['executed_cases']
+    case_stats = {'total': total_cases}
+    case_stats.update({status: stats['case_counts'].get(status, 0) for status in CASE_STAT_STATUSES})
+    case_stats.update(
+        pass_rate=_percent(stats['passed_cases'], executed_cases),
+        execution_progress=_percent(executed_cases, total_cases)
+    )
+
+    iteration_stats = {'total': len(stats['iterations'])}
+    iteration_stats.update({status: stats['iteration_counts'].get(status, 0) for status in ITERATION_STATUS})
+
+    total_requirements = sum(stats['requirement_counts'].values())
+    requirement_stats = {'total': total_requirements}
+    requirement_stats.update({status: stats['requirement_counts'].get(status, 0) for status in VERSION_REQUIREMENT_STATUS})
+
+    return {
+        'member_count': len(stats['members']),
+        'iteration_count': len(stats['iterations']),
+        'requirement_count': total_requirements,
+        'case_stats': case_stats,
+        'iteration_stats': iteration_stats,
+        'requirement_stats': requirement_stats,
+        'iterations': stats['iterations'],
+        'members': stats['members']
+    }
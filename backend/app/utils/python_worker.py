@@ -0,0 +1,169 @@
+"""
+Python 脚本预热进程池
+预先启动若干 Python 解释器并完成常用模块的导入，进程在标准输入上等待一次执行请求（JSON）：
+脚本源码、命令行参数、DEVICE_ID/ADB_PATH 等环境变量以及资源限制。
+每个进程只执行一次脚本即退出，执行之间互不影响；取走一个进程后后台立即补充新的进程，
+多设备、大量短脚本时不再为每次执行支付解释器启动和导入的开销
+"""
+import os
+import sys
+import json
+import logging
+import subprocess
+import threading
+from collections import deque
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 工作进程启动代码：导入预加载模块，读取一行 JSON 请求后在全新的 __main__ 命名空间中执行脚本
+WORKER_BOOTSTRAP = r'''
+import sys, os, json, tempfile, traceback, types
+for _name in filter(None, os.environ.get('MTP_WORKER_PRELOAD', '').split(',')):
+    try:
+        __import__(_name)
+    except Exception:
+        pass
+_line = sys.stdin.buffer.readline()
+if not _line:
+    sys.exit(0)
+_request = json.loads(_line)
+_devnull = os.open(os.devnull, os.O_RDONLY)
+os.dup2(_devnull, 0)
+try:
+    import resource
+    if _request.get('memory_limit'):
+        resource.setrlimit(resource.RLIMIT_AS, (_request['memory_limit'], _request['memory_limit']))
+    if _request.get('cpu_limit'):
+        resource.setrlimit(resource.RLIMIT_CPU, (_request['cpu_limit'], _request['cpu_limit'] + 1))
+except (ImportError, ValueError, OSError):
+    pass
+os.environ.update(_request.get('env') or {})
+_filename = os.path.join(tempfile.gettempdir(), 'device_script.py')
+sys.argv = [_filename] + list(_request.get('args') or [])
+sys.path[0] = tempfile.gettempdir()
+_main = types.ModuleType('__main__')
+_main.__file__ = _filename
+sys.modules['__main__'] = _main
+try:
+    exec(compile(_request['source'], _filename, 'exec'), _main.__dict__)
+except SystemExit:
+    raise
+except BaseException:
+    traceback.print_exc()
+    sys.exit(1)
+'''
+
+
+class PythonWorkerPool:
+    """预热的一次性 Python 工作进程池"""
+
+    def __init__(self, size: int = 4, preload: Optional[List[str]] = None,
+                 memory_limit_mb: int = 0):
+        self.size = size
+        self.preload = preload or []
+        self.memory_limit_mb = memory_limit_mb
+        self.enabled = True
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self._refilling = False
+
+    def configure(self, size: int = None, preload: List[str] = None, memory_limit_mb: int = None,
+                  enabled: bool = None):
+        if size is not None:
+            self.size = size
+        if preload is not None:
+            self.preload = preload
+        if memory_limit_mb is not None:
+            self.memory_limit_mb = memory_limit_mb
+        if enabled is not None:
+            self.enabled = enabled
+
+    def _spawn(self) -> subprocess.Popen:
+        env = os.environ.copy()
+        env['MTP_WORKER_PRELOAD'] = ','.join(self.preload)
+        env['PYTHONUNBUFFERED'] = '1'
+        return subprocess.Popen(
+            [sys.executable, '-c', WORKER_BOOTSTRAP],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env
+        )
+
+    def warm_up(self):
+        """补足空闲进程"""
+        with self._lock:
+            if self._refilling:
+                return
+            self._refilling = True
+        try:
+            while True:
+                with self._lock:
+                    # 清理已经意外退出的进程
+                    alive = [proc for proc in self._idle if proc.poll() is None]
+                    self._idle = deque(alive)
+                    if len(self._idle) >= self.size:
+                        return
+                proc = self._spawn()
+                with self._lock:
+                    self._idle.append(proc)
+        except Exception as e:
+            logger.error(f"启动 Python 工作进程失败: {e}")
+        finally:
+            with self._lock:
+                self._refilling = False
+
+    def _refill_async(self):
+        threading.Thread(target=self.warm_up, name='python-worker-refill', daemon=True).start()
+
+    def prewarm(self):
+        """在后台预热空闲进程，未启用或进程数为 0 时不处理"""
+        if self.enabled and self.size:
+            self._refill_async()
+
+    def acquire(self) -> subprocess.Popen:
+        """取出一个预热好的工作进程，没有空闲进程时立即新建"""
+        proc = None
+        with self._lock:
+            while self._idle:
+                candidate = self._idle.popleft()
+                if candidate.poll() is None:
+                    proc = candidate
+                    break
+        if proc is None:
+            proc = self._spawn()
+        self._refill_async()
+        return proc
+
+    def build_request(self, source: str, args: Optional[List[str]] = None, env: Optional[Dict[str, str]] = None,
+                      timeout: Optional[float] = None) -> bytes:
+        """构造发送给工作进程的执行请求，CPU 时间限制与任务超时一致"""
+        request = {
+            'source': source,
+            'args': list(args or []),
+            'env': env or {},
+            'memory_limit': self.memory_limit_mb * 1024 * 1024 if self.memory_limit_mb else None,
+            'cpu_limit': int(timeout) if timeout else None
+        }
+        return json.dumps(request, ensure_ascii=False).encode('utf-8') + b'\n'
+
+    def shutdown(self):
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for proc in idle:
+            proc.kill()
+            proc.wait()
+
+
+# 全局 Python 工作进程池实例
+python_workers = PythonWorkerPool()
+
+
+def init_python_workers(app):
+    """根据应用配置初始化工作进程池，并在后台预热"""
+    preload = app.config.get('PYTHON_WORKER_PRELOAD') or ''
+    python_workers.configure(
+        size=app.config.get('PYTHON_WORKER_POOL_SIZE'),
+        preload=[name.strip() for name in preload.split(',') if name.strip()],
+        memory_limit_mb=app.config.get('PYTHON_WORKER_MEMORY_LIMIT_MB'),
+        enabled=app.config.get('PYTHON_WORKER_ENABLED', True)
+    )
+    python_workers.prewarm()
@@ -1,28 +1,191 @@
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.date import DateTrigger
+from apscheduler.triggers.interval import IntervalTrigger
 from apscheduler.jobstores.memory import MemoryJobStore
+from apscheduler.jobstores.sqlalchemy import SQLAlchemyJobStore
 from apscheduler.executors.pool import ThreadPoolExecutor
+from sqlalchemy import text
 import logging
+import threading
 
 logger = logging.getLogger(__name__)
 
-jobstores = {
-    'default': MemoryJobStore()
-}
-
 executors = {
     'default': ThreadPoolExecutor(20)
 }
 
-scheduler = BackgroundScheduler(jobstores=jobstores, executors=executors, timezone='Asia/Shanghai')
+# 错过执行时间的任务：多次错过只补执行一次，同一任务不并发执行
+job_defaults = {
+    'coalesce': True,
+    'max_instances': 1,
+    'misfire_grace_time': 3600
+}
+
+scheduler = BackgroundScheduler(executors=executors, job_defaults=job_defaults, timezone='Asia/Shanghai')
+
+# 主调度进程锁名称（MySQL GET_LOCK）
+LEADER_LOCK_NAME = 'mtp_scheduler_leader'
+
+
+class SchedulerLeaderElection:
+    """
+    多个应用进程共享数据库任务存储时，只有持有 MySQL 命名锁的进程执行到期任务，其他进程的调度器处于暂停状态，
+    只负责把新增、修改的任务写入数据库；锁随数据库连接存在，主进程退出后连接断开，其他进程在下次检查时接管。
+    非 MySQL 数据库（如 SQLite）视为单进程部署，当前进程始终是主进程
+    """
+
+    def __init__(self, check_interval: float = 15):
+        self.check_interval = check_interval
+        self.is_leader = False
+        self._engine = None
+        self._connection = None
+        self._callbacks = []
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def on_elected(self, callback):
+        """注册成为主进程时执行的回调（启动补偿），注册时已是主进程则立即执行"""
+        self._callbacks.append(callback)
+        if self.is_leader:
+            self._run_callback(callback)
+
+    def start(self, engine=None, check_interval: float = None):
+        """
+        开始选主
+
+        Args:
+            engine: 共享任务存储所在的数据库引擎，None 表示任务只保存在本进程内存中
+            check_interval: 检查锁和接管的间隔（秒）
+        """
+        if check_interval:
+            self.check_interval = check_interval
+        self._engine = engine
+        self._stop_event.clear()
+        self.check()
+        if engine is not None:
+            # 共享任务存储时主进程也需要定期唤醒，及时取到其他进程写入的任务
+            self._thread = threading.Thread(target=self._loop, name='scheduler-leader', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        with self._lock:
+            self.is_leader = False
+            self._close_connection(release=True)
+
+    def _loop(self):
+        while not self._stop_event.wait(self.check_interval):
+            try:
+                self.check()
+            except Exception as e:
+                logger.error(f"调度器选主检查失败: {e}")
+
+    def check(self):
+        """主进程确认仍持有锁并唤醒调度器，其他进程尝试接管"""
+        with self._lock:
+            if self.is_leader:
+                if self._still_held():
+                    scheduler.wakeup()
+                    return
+                logger.warning("调度器主进程锁已丢失，暂停执行定时任务")
+                self.is_leader = False
+                scheduler.pause()
+            if not self._try_acquire():
+                return
+            self.is_leader = True
+            scheduler.resume()
+            callbacks = list(self._callbacks)
+        logger.info("当前进程成为调度器主进程，开始执行定时任务")
+        for callback in callbacks:
+            self._run_callback(callback)
+
+    def _uses_lock(self) -> bool:
+        return self._engine is not None and self._engine.dialect.name == 'mysql'
+
+    def _try_acquire(self) -> bool:
+        if not self._uses_lock():
+            return True
+        try:
+            connection = self._engine.connect().execution_options(isolation_level='AUTOCOMMIT')
+        except Exception as e:
+            logger.error(f"连接数据库失败，无法竞选调度器主进程: {e}")
+            return False
+        try:
+            acquired = connection.execute(text('SELECT GET_LOCK(:name, 0)'), {'name': LEADER_LOCK_NAME}).scalar()
+        except Exception as e:
+            logger.error(f"获取调度器主进程锁失败: {e}")
+            acquired = 0
+        if acquired == 1:
+            self._connection = connection
+            return True
+        connection.close()
+        return False
+
+    def _still_held(self) -> bool:
+        if not self._uses_lock():
+            return True
+        try:
+            held = self._connection.execute(
+                text('SELECT IS_USED_LOCK(:name) = CONNECTION_ID()'), {'name': LEADER_LOCK_NAME}
+            ).scalar()
+        except Exception as e:
+            logger.error(f"检查调度器主进程锁失败: {e}")
+            held = 0
+        if held != 1:
+            self._close_connection()
+            return False
+        return True
+
+    def _close_connection(self, release: bool = False):
+        if self._connection is None:
+            return
+        try:
+            if release:
+                self._connection.execute(text('SELECT RELEASE_LOCK(:name)'), {'name': LEADER_LOCK_NAME})
+            self._connection.close()
+        except Exception:
+            pass
+        self._connection = None
+
+    @staticmethod
+    def _run_callback(callback):
+        try:
+            callback()
+        except Exception as e:
+            logger.error(f"调度器启动补偿执行失败: {e}")
+
 
+# 全局调度器选主实例
+leader_election = SchedulerLeaderElection()
 
-def init_scheduler():
-    """初始化定时任务调度器"""
+
+def init_scheduler(app=None):
+    """
+    初始化定时任务调度器
+    配置为数据库任务存储时任务保存在 apscheduler_jobs 表中，重启后不丢失；
+    调度器先以暂停状态启动，只有选为主进程后才执行到期任务
+    """
     try:
-        if not scheduler.running:
-            scheduler.start()
-            logger.info("定时任务调度器已启动")
+        if scheduler.running:
+            return
+        engine = None
+        if app is not None and app.config.get('SCHEDULER_JOBSTORE') == 'sqlalchemy':
+            from app.models.models import db
+            with app.app_context():
+                engine = db.engine
+            jobstore = SQLAlchemyJobStore(engine=engine, tablename='apscheduler_jobs')
+        else:
+            jobstore = MemoryJobStore()
+        misfire_grace_time = app.config.get('SCHEDULER_MISFIRE_GRACE_TIME') if app is not None else None
+        scheduler.configure(
+            jobstores={'default': jobstore},
+            executors=executors,
+            job_defaults=dict(job_defaults, misfire_grace_time=misfire_grace_time or job_defaults['misfire_grace_time'])
+        )
+        scheduler.start(paused=True)
+        leader_election.start(engine, app.config.get('SCHEDULER_LEADER_CHECK_INTERVAL') if app is not None else None)
+        logger.info("定时任务调度器已启动")
     except Exception as e:
         logger.error(f"定时任务调度器启动失败: {e}")
 
@@ -30,6 +193,7 @@ def init_scheduler():
 def shutdown_scheduler():
     """关闭定时任务调度器"""
     try:
+        leader_election.stop()
         if scheduler.running:
             scheduler.shutdown()
             logger.info("定时任务调度器已关闭")
@@ -55,6 +219,24 @@ def add_scheduled_task(task_id, func, run_date, args=None, kwargs=None):
         raise
 
 
+def add_interval_task(task_id, func, seconds, args=None, kwargs=None):
+    """添加按固定间隔执行的任务"""
+    try:
+        job = scheduler.add_job(
+            func=func,
+            trigger=IntervalTrigger(seconds=seconds, timezone='Asia/Shanghai'),
+            id=str(task_id),
+            args=args or [],
+            kwargs=kwargs or {},
+            replace_existing=True
+        )
+        logger.info(f"周期任务已添加: {task_id}, 间隔: {seconds}秒")
+        return job
+    except Exception as e:
+        logger.error(f"添加周期任务失败: {e}")
+        raise
+
+
 def remove_scheduled_task(task_id):
     """移除定时任务"""
     try:
@@ -0,0 +1,228 @@
+"""
+设备 Shell 会话池
+每台设备保持一个长连接的 sh 进程（adb exec:sh），多条命令复用同一连接，
+命令之间用带随机标记的结束行分隔，从输出流中拆分出每条命令的输出和退出码
+"""
+import re
+import socket
+import logging
+import threading
+import time
+import uuid
+from typing import Dict, Optional, Tuple
+
+from app.utils.adb_client import adb_client, AdbClient, AdbConnection, AdbError, AdbTimeoutError
+
+logger = logging.getLogger(__name__)
+
+
+class ShellSession:
+    """单台设备上的一个长连接 shell"""
+
+    def __init__(self, serial: str, conn: AdbConnection):
+        self.serial = serial
+        self.conn = conn
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+        self.closed = False
+        # 是否保留在会话池中；与池中已有会话并发建立的临时连接用完即关闭
+        self.keep = True
+        self._buffer = b''
+
+    def run(self, command: str, timeout: Optional[float] = None) -> Tuple[int, bytes]:
+        """
+        在会话中执行一条命令
+
+        Args:
+            command: shell 命令或脚本内容
+            timeout: 超时时间（秒），超时后会话被关闭并抛出 AdbTimeoutError
+
+        Returns:
+            (exit_code, output)，stderr 已合并到输出中
+        """
+        token = uuid.uuid4().hex
+        marker = f'__MTP_END_{token}__'
+        # 命令放在子 shell 中执行：exit/cd/变量修改不会影响会话本身，
+        # stdin 重定向到 /dev/null，避免命令读走后续发送的内容
+        script = f"(\n{command}\n) </dev/null 2>&1; printf '\\n{marker}:%d\\n' $?\n"
+        pattern = re.compile(rb'\n' + marker.encode() + rb':(\d+)\n')
+
+        deadline = time.monotonic() + timeout if timeout else None
+        try:
+            self.conn.sock.settimeout(timeout)
+            self.conn.sock.sendall(script.encode('utf-8'))
+            while True:
+                match = pattern.search(self._buffer)
+                if match:
+                    output = self._buffer[:match.start()]
+                    self._buffer = self._buffer[match.end():]
+                    self.last_used = time.monotonic()
+                    return int(match.group(1)), output
+                if deadline is not None:
+                    self.conn.sock.settimeout(max(deadline - time.monotonic(), 0.001))
+                chunk = self.conn.sock.recv(65536)
+                if not chunk:
+                    raise AdbError(f'设备 {self.serial} 的 shell 会话已断开')
+                self._buffer += chunk
+        except socket.timeout:
+            # 命令仍在设备上运行，会话状态未知，直接关闭
+            partial = self._buffer
+            self.close()
+            raise AdbTimeoutError(f'命令执行超时（{timeout}秒）', partial)
+        except OSError as e:
+            self.close()
+            raise AdbError(f'设备 {self.serial} 的 shell 会话已断开: {e}') from e
+        except AdbError:
+            self.close()
+            raise
+
+    def close(self):
+        self.closed = True
+        self.conn.close()
+
+
+class ShellSessionPool:
+    """
+    Shell 会话池
+    每台设备一个会话；会话正忙时退回一次性 shell 请求，不排队等待；
+    空闲超时的会话由后台线程回收，断开的会话在下次使用时自动重建
+    """
+
+    def __init__(self, client: AdbClient, idle_timeout: float = 300):
+        self.client = client
+        self.idle_timeout = idle_timeout
+        self.enabled = True
+        self.sessions: Dict[str, ShellSession] = {}
+        self.lock = threading.Lock()
+        self._sweeper = None
+
+    def configure(self, enabled: bool = None, idle_timeout: float = None):
+        """调整是否启用会话复用以及空闲超时时间"""
+        if enabled is not None:
+            self.enabled = enabled
+        if idle_timeout:
+            self.idle_timeout = idle_timeout
+
+    def _open(self, serial: str) -> ShellSession:
+        conn = self.client._transport(serial)
+        try:
+            conn.send_request('exec:sh')
+        except Exception:
+            conn.close()
+            raise
+        logger.info(f"已建立设备 {serial} 的 shell 会话")
+        return ShellSession(serial, conn)
+
+    def _acquire(self, serial: str) -> Optional[ShellSession]:
+        """获取并锁定设备会话，会话正忙时返回 None"""
+        with self.lock:
+            session = self.sessions.get(serial)
+            if session is not None and session.closed:
+                del self.sessions[serial]
+                session = None
+            if session is not None:
+                return session if session.lock.acquire(blocking=False) else None
+        # 建立连接放在锁外，避免阻塞其他设备
+        session = self._open(serial)
+        session.lock.acquire()
+        with self.lock:
+            existing = self.sessions.get(serial)
+            if existing is not None and not existing.closed:
+                # 其他线程已经建好了会话，本次连接仅用于当前命令
+                session.keep = False
+            else:
+                self.sessions[serial] = session
+        self._ensure_sweeper()
+        return session
+
+    def run(self, serial: str, command: str, timeout: Optional[float] = None) -> Tuple[int, bytes, bytes]:
+        """
+        在设备上执行 shell 命令
+
+        Returns:
+            (exit_code, stdout, stderr)，与 AdbClient.shell 一致
+        """
+        if not self.enabled:
+            return self.client.shell(serial, command, timeout)
+
+        for attempt in range(2):
+            session = self._acquire(serial)
+            if session is None:
+                # 会话正被其他命令占用
+                return self.client.shell(serial, command, timeout)
+            try:
+                exit_code, output = session.run(command, timeout)
+                return exit_code, output, b''
+            except AdbTimeoutError:
+                raise
+            except AdbError:
+                # 会话已断开（设备重连、adb server 重启等），重建后重试一次
+                if attempt == 1:
+                    raise
+                logger.info(f"设备 {serial} 的 shell 会话已断开，正在重连")
+            finally:
+                session.lock.release()
+                if not session.keep:
+                    session.close()
+
+    def close(self, serial: str):
+        """关闭指定设备的会话"""
+        with self.lock:
+            session = self.sessions.pop(serial, None)
+        if session is not None:
+            session.close()
+
+    def close_all(self):
+        with self.lock:
+            sessions = list(self.sessions.values())
+            self.sessions.clear()
+        for session in sessions:
+            session.close()
+
+    def evict_idle(self) -> int:
+        """回收空闲超时的会话，返回回收数量"""
+        now = time.monotonic()
+        evicted = []
+        with self.lock:
+            for serial, session in list(self.sessions.items()):
+                if session.closed:
+                    del self.sessions[serial]
+                    continue
+                if now - session.last_used > self.idle_timeout and session.lock.acquire(blocking=False):
+                    del self.sessions[serial]
+                    evicted.append(session)
+        for session in evicted:
+            session.close()
+            session.lock.release()
+        return len(evicted)
+
+    def _ensure_sweeper(self):
+        if self._sweeper is not None and self._sweeper.is_alive():
+            return
+        with self.lock:
+            if self._sweeper is not None and self._sweeper.is_alive():
+                return
+            self._sweeper = threading.Thread(target=self._sweep_loop, name='shell-session-sweeper', daemon=True)
+            self._sweeper.start()
+
+    def _sweep_loop(self):
+        while True:
+            time.sleep(max(self.idle_timeout / 2, 1))
+            try:
+                evicted = self.evict_idle()
+                if evicted:
+                    logger.info(f"已回收 {evicted} 个空闲 shell 会话")
+            except Exception as e:
+                logger.error(f"回收 shell 会话失败: {e}")
+
+
+# 全局 shell 会话池实例
+shell_sessions = ShellSessionPool(adb_client)
+
+
+def init_shell_sessions(app):
+    """根据应用配置初始化 shell 会话池"""
+    shell_sessions.configure(
+        enabled=app.config.get('SHELL_SESSION_ENABLED', True),
+        idle_timeout=app.config.get('SHELL_SESSION_IDLE_TIMEOUT')
+    )
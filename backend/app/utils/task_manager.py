@@ -1,11 +1,31 @@
 """
 异步任务管理器
-用于管理后台异步任务，支持任务状态查询和进度更新
+用于管理后台异步任务，支持任务状态查询和进度更新。
+任务在固定数量的工作线程中执行：等待中的任务按优先级排队，同一类型的任务可以限制同时执行的数量
+（如同时调用 AI 接口的任务数），排队任务数达到上限时拒绝新任务。
+任务状态同时写入状态存储（见 task_state），其他进程创建的任务通过状态存储查询。
+已结束的任务定期清理：超过保留时间的删除，结果中的明细在一段时间后精简，
+本进程保存的任务数超过上限时按最近访问时间淘汰已结束的任务。
+每次发布任务状态时版本号 version 加一并唤醒等待该任务的线程，供 SSE 接口推送进度。
+
+任务状态的读写使用按 task_id 分段的锁，不同任务的进度更新互不阻塞，也不占用排队使用的全局锁；
+同一任务的进度更新按 progress_interval 限频发布，间隔内的更新合并，由后台线程补发最后一次；
+状态变化（开始、完成、失败）立即发布。读取任务状态时返回加锁复制的快照
 """
+import heapq
+import itertools
+import logging
 import threading
+import time
 import uuid
-from datetime import datetime
-from typing import Dict, Any, Callable, Optional
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Any, Callable, List, Optional
+
+from app.utils.task_state import TaskStateStore, MemoryTaskStateStore, create_task_state_store
+from app.utils.scheduler import leader_election, add_interval_task
+
+logger = logging.getLogger(__name__)
 
 
 class TaskStatus:
@@ -16,14 +36,125 @@ class TaskStatus:
     FAILED = "failed"  # 失败
 
 
+# 已结束的任务状态
+FINISHED_STATUSES = (TaskStatus.COMPLETED, TaskStatus.FAILED)
+
+
+# 任务状态分段锁的段数
+LOCK_STRIPES = 32
+
+
+# 优先级排序：数值越小越先执行
+TASK_PRIORITY_RANK = {'high': 0, 'medium': 1, 'low': 2}
+
+
+class TaskQueueFullError(Exception):
+    """排队任务数已达上限"""
+
+
+def trim_result(result: Any) -> Any:
+    """精简任务结果：保留标量字段，列表和字典明细只保留条目数"""
+    if not isinstance(result, dict):
+        return result
+    trimmed = {}
+    for key, value in result.items():
+        if isinstance(value, (list, dict)):
+            trimmed[f'{key}_count'] = len(value)
+        else:
+            trimmed[key] = value
+    return trimmed
+
+
 class TaskManager:
     """任务管理器，用于管理后台异步任务"""
     
-    def __init__(self):
-        self.tasks: Dict[str, Dict[str, Any]] = {}  # 存储所有任务的状态
-        self.lock = threading.Lock()  # 线程锁，确保线程安全
+    def __init__(self, max_workers: int = 4, max_queue_size: int = 100,
+                 type_limits: Optional[Dict[str, int]] = None, store: Optional[TaskStateStore] = None):
+        self.tasks: Dict[str, Dict[str, Any]] = OrderedDict()  # 本进程创建的任务的状态，按最近访问排序
+        self.store: TaskStateStore = store or MemoryTaskStateStore()  # 任务状态存储，跨进程查询
+        self.lock = threading.Lock()  # 全局锁：任务字典、排队和执行计数
+        # 分段锁：保护各任务状态字典的内容，等待任务更新的线程在对应分段的条件变量上等待
+        self._stripes = [threading.Condition() for _ in range(LOCK_STRIPES)]
+        self.max_workers = max_workers
+        self.max_queue_size = max_queue_size
+        self.type_limits: Dict[str, int] = dict(type_limits or {})  # 任务类型 -> 最大并发数
+        # 每种任务类型一个等待队列：task_type -> [(优先级, 序号, task_id, task_func, args, kwargs)]
+        self._queues: Dict[str, List] = {}
+        self._queued: Dict[str, tuple] = {}  # task_id -> 排序键 (优先级, 序号)
+        self._running: Dict[str, int] = {}  # task_type -> 执行中的任务数
+        self._counter = itertools.count()
+        self._condition = threading.Condition(self.lock)
+        self._workers: List[threading.Thread] = []
+        # 进度更新限频：同一任务两次发布之间至少间隔 progress_interval 秒
+        self.progress_interval = 0.5
+        self._pending: Dict[str, Dict[str, Any]] = {}  # task_id -> 尚未发布的进度字段（由分段锁保护）
+        self._published_at: Dict[str, float] = {}  # task_id -> 上次发布时间（由分段锁保护）
+        self._dirty = set()  # 有尚未发布进度的任务
+        self._dirty_condition = threading.Condition()
+        self._flusher: Optional[threading.Thread] = None
+        # 已结束任务的清理策略
+        self.result_ttl_hours = 24  # 保留时间（小时）
+        self.result_trim_after = 600  # 结束多久后精简结果（秒）
+        self.max_entries = 500  # 本进程最多保存的任务数
+        self.sweep_interval = 600  # 清理间隔（秒）
+        self._last_sweep = time.monotonic()
+        self._metrics = {'evicted_ttl': 0, 'evicted_lru': 0, 'trimmed': 0, 'last_sweep_at': None}
+
+    def configure(self, max_workers: int = None, max_queue_size: int = None,
+                  type_limits: Optional[Dict[str, int]] = None, store: Optional[TaskStateStore] = None,
+                  result_ttl_hours: float = None, result_trim_after: float = None,
+                  max_entries: int = None, sweep_interval: float = None, progress_interval: float = None):
+        """
+        调整工作线程数、排队上限、各类型并发上限、状态存储和已结束任务的清理策略
+
+        Args:
+            max_workers: 工作线程数（只增不减，已启动的线程继续工作）
+            max_queue_size: 最多排队等待的任务数，0 表示不限制
+            type_limits: 任务类型 -> 最大并发数
+            store: 任务状态存储
+            result_ttl_hours: 已结束任务的保留时间（小时）
+            result_trim_after: 任务结束多久后精简结果（秒）
+            max_entries: 本进程最多保存的任务数，0 表示不限制
+            sweep_interval: 清理间隔（秒）
+            progress_interval: 同一任务进度更新的最小发布间隔（秒），0 表示每次更新都立即发布
+        """
+        if progress_interval is not None:
+            self.progress_interval = progress_interval
+        if result_ttl_hours:
+            self.result_ttl_hours = result_ttl_hours
+        if result_trim_after:
+            self.result_trim_after = result_trim_after
+        if max_entries is not None:
+            self.max_entries = max_entries
+        if sweep_interval:
+            self.sweep_interval = sweep_interval
+        if store is not None and store is not self.store:
+            self.store.close()
+            self.store = store
+        with self._condition:
+            if max_workers:
+                self.max_workers = max_workers
+            if max_queue_size is not None:
+                self.max_queue_size = max_queue_size
+            if type_limits is not None:
+                self.type_limits = dict(type_limits)
+            if self._workers:
+                self._start_workers()
+            self._condition.notify_all()
+
+    def _start_workers(self):
+        """补足工作线程，需持有锁"""
+        while len(self._workers) < self.max_workers:
+            worker = threading.Thread(
+                target=self._worker_loop,
+                name=f'task-worker-{len(self._workers) + 1}',
+                daemon=True
+            )
+            self._workers.append(worker)
+            worker.start()
     
-    def create_task(self, task_name: str, task_func: Callable, *args, **kwargs) -> str:
+    def create_task(self, task_name: str, task_func: Callable, *args, task_type: str = 'default',
+                    priority: str = 'medium', **kwargs) -> str:
         """
         创建一个新的异步任务
         
@@ -31,17 +162,29 @@ class TaskManager:
             task_name: 任务名称
             task_func: 任务执行函数
             *args: 任务函数的位置参数
+            task_type: 任务类型，用于限制同类任务的并发数
+            priority: 优先级 high / medium / low
             **kwargs: 任务函数的关键字参数
             
         Returns:
-            task_id: 任务ID
+            task_id: 任务ID；排队任务数已达上限时抛出 TaskQueueFullError
         """
         task_id = str(uuid.uuid4())
+        rank = TASK_PRIORITY_RANK.get(priority, TASK_PRIORITY_RANK['medium'])
+
+        # 调度器只在主进程执行定期清理，其他进程在创建任务时按清理间隔补做
+        if time.monotonic() - self._last_sweep > self.sweep_interval:
+            self.sweep()
         
-        with self.lock:
-            self.tasks[task_id] = {
+        with self._condition:
+            if self.max_queue_size and len(self._queued) >= self.max_queue_size:
+                raise TaskQueueFullError(f'排队任务已达上限（{self.max_queue_size}），请稍后重试')
+
+            state = self.tasks[task_id] = {
                 'task_id': task_id,
                 'task_name': task_name,
+                'task_type': task_type,
+                'priority': priority,
                 'status': TaskStatus.PENDING,
                 'progress': 0,
                 'total': 0,
@@ -52,21 +195,62 @@ class TaskManager:
                 'created_at': datetime.now().isoformat(),
                 'started_at': None,
                 'completed_at': None,
+                'version': 0,
             }
-        
-        # 创建并启动线程
-        thread = threading.Thread(
-            target=self._run_task,
-            args=(task_id, task_func, args, kwargs)
-        )
-        thread.daemon = True  # 设置为守护线程
-        thread.start()
+            # 先占住排队名额，写入状态存储后再放入队列，保证“等待中”先于“执行中”写入
+            key = (rank, next(self._counter))
+            self._queued[task_id] = key
+            snapshot = dict(state)
+            evicted = self._evict_lru()
+
+        self._forget(evicted)
+        self.store.save(snapshot, immediate=True)
+
+        with self._condition:
+            # 加入对应类型的等待队列，由空闲的工作线程取出执行
+            heapq.heappush(self._queues.setdefault(task_type, []), key + (task_id, task_func, args, kwargs))
+            self._start_workers()
+            self._condition.notify()
         
         return task_id
+
+    def _next_task(self) -> Optional[tuple]:
+        """取出可以执行的优先级最高的任务（所属类型未达并发上限），需持有锁"""
+        best_type = None
+        for task_type, queue in self._queues.items():
+            if not queue:
+                continue
+            limit = self.type_limits.get(task_type)
+            if limit and self._running.get(task_type, 0) >= limit:
+                continue
+            if best_type is None or queue[0][:2] < self._queues[best_type][0][:2]:
+                best_type = task_type
+        if best_type is None:
+            return None
+        entry = heapq.heappop(self._queues[best_type])
+        self._queued.pop(entry[2], None)
+        self._running[best_type] = self._running.get(best_type, 0) + 1
+        return (best_type,) + entry[2:]
+
+    def _worker_loop(self):
+        while True:
+            with self._condition:
+                entry = self._next_task()
+                while entry is None:
+                    self._condition.wait()
+                    entry = self._next_task()
+            task_type, task_id, task_func, args, kwargs = entry
+            try:
+                self._run_task(task_id, task_func, args, kwargs)
+            finally:
+                with self._condition:
+                    self._running[task_type] -= 1
+                    # 同类型任务可能因并发上限在等待
+                    self._condition.notify_all()
     
     def _run_task(self, task_id: str, task_func: Callable, args: tuple, kwargs: dict):
         """
-        在独立线程中运行任务
+        在工作线程中运行任务
         
         Args:
             task_id: 任务ID
@@ -90,11 +274,12 @@ class TaskManager:
             # 执行任务函数
             result = task_func(*args, **kwargs)
             
-            # 更新任务状态为完成
+            # 更新任务状态为完成，任务结果中带有 message 时作为完成消息
+            message = result.get('message') if isinstance(result, dict) else None
             self.update_task_status(
                 task_id,
                 status=TaskStatus.COMPLETED,
-                message='任务执行成功',
+                message=message or '任务执行成功',
                 result=result,
                 progress=100,
                 completed_at=datetime.now().isoformat()
@@ -110,17 +295,84 @@ class TaskManager:
                 completed_at=datetime.now().isoformat()
             )
     
+    def _stripe(self, task_id: str) -> threading.Condition:
+        """任务状态所在分段的锁"""
+        return self._stripes[hash(task_id) % LOCK_STRIPES]
+
+    def _publish(self, task_id: str, task: Dict[str, Any], changes: Dict[str, Any],
+                 stripe: threading.Condition) -> Dict[str, Any]:
+        """应用尚未发布的进度和本次更新，版本号加一并唤醒等待的线程，返回状态快照，需持有分段锁"""
+        pending = self._pending.pop(task_id, None)
+        if pending:
+            task.update(pending)
+        task.update(changes)
+        task['version'] = task.get('version', 0) + 1
+        if task['status'] in FINISHED_STATUSES:
+            self._published_at.pop(task_id, None)
+        else:
+            self._published_at[task_id] = time.monotonic()
+        stripe.notify_all()
+        return dict(task)
+
     def update_task_status(self, task_id: str, **kwargs):
         """
         更新任务状态
         
         Args:
             task_id: 任务ID
-            **kwargs: 要更新的字段
+            **kwargs: 要更新的字段；含 status 时立即发布，否则按进度更新限频发布
         """
-        with self.lock:
-            if task_id in self.tasks:
-                self.tasks[task_id].update(kwargs)
+        task = self.tasks.get(task_id)
+        if task is None:
+            return
+        stripe = self._stripe(task_id)
+        with stripe:
+            if 'status' not in kwargs:
+                last = self._published_at.get(task_id)
+                if last is not None and time.monotonic() - last < self.progress_interval:
+                    # 间隔内的进度更新先合并，由后台线程补发
+                    self._pending.setdefault(task_id, {}).update(kwargs)
+                    self._mark_dirty(task_id)
+                    return
+                # 进度更新由存储合并写入；在分段锁内保存，保证不会覆盖之后立即写入的状态变化
+                self.store.save(self._publish(task_id, task, kwargs, stripe))
+                return
+            snapshot = self._publish(task_id, task, kwargs, stripe)
+        # 状态变化立即写入
+        self.store.save(snapshot, immediate=True)
+
+    def _mark_dirty(self, task_id: str):
+        with self._dirty_condition:
+            self._dirty.add(task_id)
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name='task-progress-flush', daemon=True)
+                self._flusher.start()
+            self._dirty_condition.notify()
+
+    def _flush_loop(self):
+        """补发限频期间合并的最后一次进度更新"""
+        while True:
+            with self._dirty_condition:
+                while not self._dirty:
+                    self._dirty_condition.wait()
+            time.sleep(self.progress_interval)
+            with self._dirty_condition:
+                dirty, self._dirty = self._dirty, set()
+            for task_id in dirty:
+                try:
+                    self.flush_progress(task_id)
+                except Exception as e:
+                    logger.error(f"发布任务 {task_id} 的进度失败: {e}")
+
+    def flush_progress(self, task_id: str):
+        """立即发布任务尚未发布的进度"""
+        task = self.tasks.get(task_id)
+        stripe = self._stripe(task_id)
+        with stripe:
+            if task is None or task_id not in self._pending:
+                self._pending.pop(task_id, None)
+                return
+            self.store.save(self._publish(task_id, task, {}, stripe))
     
     def update_task_progress(self, task_id: str, current: int, total: int, message: str = None):
         """
@@ -151,35 +403,211 @@ class TaskManager:
             task_id: 任务ID
             
         Returns:
-            任务状态字典，如果任务不存在则返回None
+            任务状态字典（等待中的任务含排队位置 queue_position），如果任务不存在则返回None
         """
         with self.lock:
-            return self.tasks.get(task_id)
+            task = self.tasks.get(task_id)
+            if task is not None:
+                self.tasks.move_to_end(task_id)
+                with self._stripe(task_id):
+                    snapshot = dict(task)
+                snapshot['queue_position'] = self._queue_position(task_id)
+                return snapshot
+        # 其他进程创建的任务
+        task = self.store.get(task_id)
+        if task is not None:
+            task.setdefault('queue_position', None)
+        return task
+
+    def wait_for_update(self, task_id: str, last_version: int, timeout: float = 15,
+                        poll_interval: float = 1.0) -> Optional[Dict[str, Any]]:
+        """
+        等待任务更新
+
+        Args:
+            task_id: 任务ID
+            last_version: 调用方已获取的版本号，-1 表示尚未获取
+            timeout: 最长等待时间（秒）
+            poll_interval: 其他进程的任务没有更新通知，按该间隔查询状态存储（秒）
+
+        Returns:
+            版本号大于 last_version 或已结束的任务状态；超时或任务不存在时返回 None
+        """
+        deadline = time.monotonic() + timeout
+        task = self.tasks.get(task_id)
+        if task is not None:
+            stripe = self._stripe(task_id)
+            with stripe:
+                while task['version'] <= last_version and task['status'] not in FINISHED_STATUSES:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return None
+                    stripe.wait(remaining)
+                snapshot = dict(task)
+            with self.lock:
+                snapshot['queue_position'] = self._queue_position(task_id)
+            return snapshot
+
+        # 其他进程创建的任务
+        while True:
+            task = self.store.get(task_id)
+            if task is None:
+                return None
+            if task.get('version', 0) > last_version or task['status'] in FINISHED_STATUSES:
+                task.setdefault('queue_position', None)
+                return task
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            time.sleep(min(poll_interval, remaining))
+
+    def _queue_position(self, task_id: str) -> Optional[int]:
+        """等待中任务的排队位置（从 1 开始，排在前面的是优先级更高或更早创建的任务），需持有锁"""
+        key = self._queued.get(task_id)
+        if key is None:
+            return None
+        return sum(1 for other in self._queued.values() if other < key) + 1
+
+    def list_tasks(self) -> List[Dict[str, Any]]:
+        """所有任务状态的副本（本进程的任务和状态存储中其他进程的任务）"""
+        with self.lock:
+            tasks = {}
+            for task_id, task in self.tasks.items():
+                with self._stripe(task_id):
+                    tasks[task_id] = dict(task)
+                tasks[task_id]['queue_position'] = self._queue_position(task_id)
+        for task in self.store.list():
+            if task['task_id'] not in tasks:
+                task.setdefault('queue_position', None)
+                tasks[task['task_id']] = task
+        return list(tasks.values())
+
+    def get_stats(self) -> Dict[str, Any]:
+        """排队、执行和清理情况"""
+        with self.lock:
+            return {
+                'max_workers': self.max_workers,
+                'max_queue_size': self.max_queue_size,
+                'queued': len(self._queued),
+                'running': {task_type: count for task_type, count in self._running.items() if count},
+                'type_limits': dict(self.type_limits),
+                'tasks': len(self.tasks),
+                'max_entries': self.max_entries,
+                'progress_interval': self.progress_interval,
+                **self._metrics
+            }
+
+    @staticmethod
+    def _finished_before(task: Dict[str, Any], cutoff: datetime) -> bool:
+        if task['status'] not in FINISHED_STATUSES or not task.get('completed_at'):
+            return False
+        return datetime.fromisoformat(task['completed_at']) < cutoff
+
+    def _forget(self, task_ids: List[str]):
+        """从本进程淘汰的任务：进程内存储同时删除，数据库存储保留到过期清理"""
+        if task_ids and not self.store.persistent:
+            self.store.delete(task_ids)
+
+    def _evict_lru(self) -> List[str]:
+        """任务数超过上限时淘汰最久未访问的已结束任务，需持有锁"""
+        if not self.max_entries or len(self.tasks) <= self.max_entries:
+            return []
+        excess = len(self.tasks) - self.max_entries
+        evicted = []
+        for task_id, task in self.tasks.items():
+            if len(evicted) >= excess:
+                break
+            if task['status'] in FINISHED_STATUSES:
+                evicted.append(task_id)
+        for task_id in evicted:
+            del self.tasks[task_id]
+        self._metrics['evicted_lru'] += len(evicted)
+        return evicted
+
+    def _trim_results(self) -> int:
+        """精简结束时间超过 result_trim_after 的任务结果"""
+        cutoff = datetime.now() - timedelta(seconds=self.result_trim_after)
+        trimmed = []
+        with self.lock:
+            for task_id, task in self.tasks.items():
+                if not task.get('result_trimmed') and task.get('result') is not None and self._finished_before(task, cutoff):
+                    with self._stripe(task_id):
+                        # 替换而不修改原结果，已取出的快照不受影响
+                        task['result'] = trim_result(task['result'])
+                        task['result_trimmed'] = True
+                        self.store.save(dict(task))
+                    trimmed.append(task_id)
+            self._metrics['trimmed'] += len(trimmed)
+        return len(trimmed)
     
-    def clear_completed_tasks(self, older_than_hours: int = 24):
+    def clear_completed_tasks(self, older_than_hours: float = 24) -> int:
         """
         清理已完成的任务
         
         Args:
             older_than_hours: 清理多少小时前的任务
+
+        Returns:
+            从本进程清理的任务数（状态存储中其他进程的过期任务一并清理）
         """
-        from datetime import timedelta
+        cutoff = datetime.now() - timedelta(hours=older_than_hours)
         
         with self.lock:
-            now = datetime.now()
-            tasks_to_remove = []
-            
-            for task_id, task in self.tasks.items():
-                if task['status'] in [TaskStatus.COMPLETED, TaskStatus.FAILED]:
-                    completed_at = task.get('completed_at')
-                    if completed_at:
-                        completed_time = datetime.fromisoformat(completed_at)
-                        if now - completed_time > timedelta(hours=older_than_hours):
-                            tasks_to_remove.append(task_id)
-            
+            tasks_to_remove = [task_id for task_id, task in self.tasks.items() if self._finished_before(task, cutoff)]
             for task_id in tasks_to_remove:
                 del self.tasks[task_id]
+            self._metrics['evicted_ttl'] += len(tasks_to_remove)
+        self.store.purge_finished(cutoff)
+        return len(tasks_to_remove)
+
+    def sweep(self) -> Dict[str, int]:
+        """定期清理：删除过期任务、精简结果、执行任务数上限"""
+        self._last_sweep = time.monotonic()
+        expired = self.clear_completed_tasks(self.result_ttl_hours)
+        trimmed = self._trim_results()
+        with self.lock:
+            evicted = self._evict_lru()
+            self._metrics['last_sweep_at'] = datetime.now().isoformat()
+        self._forget(evicted)
+        return {'expired': expired, 'trimmed': trimmed, 'evicted': len(evicted)}
 
 
 # 全局任务管理器实例
 task_manager = TaskManager()
+
+
+def sweep_task_manager():
+    """调度器定期调用的清理入口"""
+    result = task_manager.sweep()
+    if any(result.values()):
+        logger.info(f"后台任务清理完成: {result}")
+
+
+def parse_type_limits(value: str) -> Dict[str, int]:
+    """解析任务类型并发上限配置，格式：ai_generate:2,default:4"""
+    limits = {}
+    for item in (value or '').split(','):
+        if ':' not in item:
+            continue
+        task_type, limit = item.split(':', 1)
+        if task_type.strip() and limit.strip().isdigit():
+            limits[task_type.strip()] = int(limit.strip())
+    return limits
+
+
+def init_task_manager(app):
+    """根据应用配置初始化任务管理器和任务状态存储，成为调度器主进程后注册定期清理"""
+    task_manager.configure(
+        max_workers=app.config.get('TASK_MANAGER_MAX_WORKERS'),
+        max_queue_size=app.config.get('TASK_QUEUE_MAX_SIZE'),
+        type_limits=parse_type_limits(app.config.get('TASK_TYPE_LIMITS')),
+        store=create_task_state_store(app),
+        result_ttl_hours=app.config.get('TASK_RESULT_TTL_HOURS'),
+        result_trim_after=app.config.get('TASK_RESULT_TRIM_AFTER'),
+        max_entries=app.config.get('TASK_MAX_ENTRIES'),
+        sweep_interval=app.config.get('TASK_SWEEP_INTERVAL'),
+        progress_interval=app.config.get('TASK_PROGRESS_INTERVAL')
+    )
+    leader_election.on_elected(
+        lambda: add_interval_task('task_manager_sweep', sweep_task_manager, task_manager.sweep_interval)
+    )
@@ -0,0 +1,286 @@
+"""
+后台任务状态存储
+TaskManager 的任务状态写入可替换的存储后端：
+- memory：保存在本进程内存中，适用于单进程部署和测试环境
+- sql：保存在 background_tasks 表中，任意应用进程都能查询到任务状态，重启后已结束任务的结果仍可查询
+
+SQL 存储合并进度更新：同一任务在一个写回周期内的多次更新只写最后一次；
+创建任务和状态变化（开始、完成、失败）立即写入，各进程看到的任务状态一致，进度最多滞后一个写回周期
+"""
+import os
+import json
+import socket
+import logging
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Dict, Any, Iterable, List, Optional
+
+from sqlalchemy import insert, update
+
+from app.models.models import db, BackgroundTask, LOCAL_TIMEZONE
+
+logger = logging.getLogger(__name__)
+
+# 已结束的任务状态
+TERMINAL_STATUSES = ('completed', 'failed')
+
+
+class TaskStateStore(ABC):
+    """任务状态存储接口"""
+
+    # 是否在进程之外持久保存（进程内淘汰任务后仍可从存储查询）
+    persistent = False
+
+    @abstractmethod
+    def save(self, state: Dict[str, Any], immediate: bool = False):
+        """
+        保存任务的完整状态
+
+        Args:
+            state: 任务状态字典（含 task_id），调用方传入副本
+            immediate: 是否立即写入；否则允许与同一任务的后续更新合并
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def list(self, limit: int = 200) -> List[Dict[str, Any]]:
+        """最近创建的任务状态，按创建时间倒序"""
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, task_ids: Iterable[str]):
+        raise NotImplementedError
+
+    @abstractmethod
+    def purge_finished(self, before: datetime) -> int:
+        """删除在 before（本地时间）之前结束的任务，返回删除数量"""
+        raise NotImplementedError
+
+    def flush(self):
+        """写入所有尚未写入的更新"""
+
+    def close(self):
+        self.flush()
+
+
+class MemoryTaskStateStore(TaskStateStore):
+    """进程内存储"""
+
+    def __init__(self):
+        self._states: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def save(self, state: Dict[str, Any], immediate: bool = False):
+        with self._lock:
+            self._states[state['task_id']] = state
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            state = self._states.get(task_id)
+            return dict(state) if state is not None else None
+
+    def list(self, limit: int = 200) -> List[Dict[str, Any]]:
+        with self._lock:
+            states = [dict(state) for state in self._states.values()]
+        states.sort(key=lambda state: state.get('created_at') or '', reverse=True)
+        return states[:limit]
+
+    def delete(self, task_ids: Iterable[str]):
+        with self._lock:
+            for task_id in task_ids:
+                self._states.pop(task_id, None)
+
+    def purge_finished(self, before: datetime) -> int:
+        cutoff = before.isoformat()
+        with self._lock:
+            expired = [
+                task_id for task_id, state in self._states.items()
+                if state.get('status') in TERMINAL_STATUSES and (state.get('completed_at') or cutoff) < cutoff
+            ]
+            for task_id in expired:
+                del self._states[task_id]
+        return len(expired)
+
+
+class SqlTaskStateStore(TaskStateStore):
+    """
+    数据库存储
+    本进程执行中的任务定期刷新 updated_at；其他进程读到长时间未刷新的未结束任务时，视为所在进程已停止、任务中断
+    """
+
+    persistent = True
+
+    def __init__(self, app, flush_interval: float = 1.0, stale_timeout: float = 300):
+        self._app = app
+        self.flush_interval = flush_interval
+        self.stale_timeout = stale_timeout
+        self.owner = f'{socket.gethostname()}:{os.getpid()}'
+        self._pending: Dict[str, Dict[str, Any]] = {}  # task_id -> 待写入的最新状态
+        self._live = set()  # 本进程尚未结束的任务
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()  # 保证同一任务的写入顺序
+        self._stop_event = threading.Event()
+        self._last_touch = datetime.now(LOCAL_TIMEZONE)
+        self._thread = threading.Thread(target=self._flush_loop, name='task-state-flush', daemon=True)
+        self._thread.start()
+
+    # ------------------------------------------------------------------
+    # 写入
+    # ------------------------------------------------------------------
+
+    def save(self, state: Dict[str, Any], immediate: bool = False):
+        task_id = state['task_id']
+        with self._lock:
+            if state.get('status') in TERMINAL_STATUSES:
+                self._live.discard(task_id)
+            else:
+                self._live.add(task_id)
+            if not immediate:
+                self._pending[task_id] = state
+                return
+        with self._write_lock:
+            with self._lock:
+                # 立即写入的是最新状态，丢弃尚未写入的旧进度
+                self._pending.pop(task_id, None)
+            self._write({task_id: state})
+
+    def flush(self):
+        with self._write_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+            if batch:
+                self._write(batch)
+
+    def _write(self, states: Dict[str, Dict[str, Any]]):
+        """批量写入：已存在的任务一次批量 UPDATE，新任务一次批量 INSERT"""
+        now = datetime.now(LOCAL_TIMEZONE)
+        rows = [{
+            'task_id': task_id,
+            'task_name': (state.get('task_name') or '')[:200],
+            'task_type': state.get('task_type') or 'default',
+            'status': state.get('status'),
+            'owner': self.owner,
+            'state': json.dumps(state, ensure_ascii=False, default=str),
+            'updated_at': now
+        } for task_id, state in states.items()]
+        with self._app.app_context():
+            try:
+                existing = {
+                    task_id for (task_id,) in db.session.query(BackgroundTask.task_id).filter(
+                        BackgroundTask.task_id.in_(list(states))
+                    )
+                }
+                updates = [row for row in rows if row['task_id'] in existing]
+                inserts = [dict(row, created_at=now) for row in rows if row['task_id'] not in existing]
+                if updates:
+                    db.session.execute(update(BackgroundTask), updates)
+                if inserts:
+                    db.session.execute(insert(BackgroundTask), inserts)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"写入后台任务状态失败: {e}")
+
+    def _flush_loop(self):
+        while not self._stop_event.wait(self.flush_interval):
+            try:
+                self.flush()
+                self._touch_live()
+            except Exception as e:
+                logger.error(f"写回后台任务状态失败: {e}")
+
+    def _touch_live(self):
+        """刷新本进程执行中任务的 updated_at，表明任务所在进程仍在运行"""
+        now = datetime.now(LOCAL_TIMEZONE)
+        if now - self._last_touch < timedelta(seconds=self.stale_timeout / 3):
+            return
+        self._last_touch = now
+        with self._lock:
+            live = list(self._live)
+        if not live:
+            return
+        with self._app.app_context():
+            try:
+                BackgroundTask.query.filter(BackgroundTask.task_id.in_(live)).update(
+                    {'updated_at': now}, synchronize_session=False
+                )
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+
+    def close(self):
+        self._stop_event.set()
+        self.flush()
+
+    # ------------------------------------------------------------------
+    # 读取
+    # ------------------------------------------------------------------
+
+    def _to_state(self, record: BackgroundTask) -> Dict[str, Any]:
+        state = json.loads(record.state)
+        if state.get('status') not in TERMINAL_STATUSES and record.owner != self.owner:
+            updated_at = record.updated_at
+            if updated_at is not None and updated_at.tzinfo is None:
+                updated_at = updated_at.replace(tzinfo=LOCAL_TIMEZONE)
+            if updated_at and datetime.now(LOCAL_TIMEZONE) - updated_at > timedelta(seconds=self.stale_timeout):
+                state.update(status='failed', message='任务执行中断：执行任务的服务进程已停止', error='任务执行中断')
+        return state
+
+    def get(self, task_id: str) -> Optional[Dict[str, Any]]:
+        with self._app.app_context():
+            record = BackgroundTask.query.get(task_id)
+            return self._to_state(record) if record else None
+
+    def list(self, limit: int = 200) -> List[Dict[str, Any]]:
+        with self._app.app_context():
+            records = BackgroundTask.query.order_by(BackgroundTask.created_at.desc()).limit(limit).all()
+            return [self._to_state(record) for record in records]
+
+    def delete(self, task_ids: Iterable[str]):
+        task_ids = list(task_ids)
+        if not task_ids:
+            return
+        with self._lock:
+            for task_id in task_ids:
+                self._pending.pop(task_id, None)
+                self._live.discard(task_id)
+        with self._app.app_context():
+            try:
+                BackgroundTask.query.filter(BackgroundTask.task_id.in_(task_ids)).delete(synchronize_session=False)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"删除后台任务状态失败: {e}")
+
+    def purge_finished(self, before: datetime) -> int:
+        # 已结束任务的 updated_at 为结束（或精简结果）时的写入时间
+        cutoff = before.astimezone(LOCAL_TIMEZONE)
+        with self._app.app_context():
+            try:
+                count = BackgroundTask.query.filter(
+                    BackgroundTask.status.in_(TERMINAL_STATUSES),
+                    BackgroundTask.updated_at < cutoff
+                ).delete(synchronize_session=False)
+                db.session.commit()
+                return count
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"清理过期后台任务状态失败: {e}")
+                return 0
+
+
+def create_task_state_store(app) -> TaskStateStore:
+    """根据配置创建任务状态存储"""
+    if app.config.get('TASK_STATE_BACKEND') == 'sql':
+        return SqlTaskStateStore(
+            app,
+            flush_interval=app.config.get('TASK_STATE_FLUSH_INTERVAL') or 1.0,
+            stale_timeout=app.config.get('TASK_STATE_STALE_TIMEOUT') or 300
+        )
+    return MemoryTaskStateStore()
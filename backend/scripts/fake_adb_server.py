@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+模拟 adb server
+实现 adb host 协议的常用子集，用于在没有真机的环境下调试和压测 app.utils.adb_client：
+host:version / host:devices(-l) / host:track-devices(-l) / host-serial:<serial>:get-state|features /
+host:transport:<serial> 之后的 shell:、shell,v2,raw:、exec:、sync:(SEND/STAT/QUIT)
+
+用法：
+    python scripts/fake_adb_server.py --port 5038 --devices emulator-5554,R58M123
+"""
+import argparse
+import socketserver
+import struct
+import subprocess
+import threading
+import time
+
+
+class FakeDevice:
+    """模拟设备：shell 命令交给本机 sh 执行，推送的文件保存在内存中"""
+
+    def __init__(self, serial, state='device', model='Fake_Phone', shell_v2=True):
+        self.serial = serial
+        self.state = state
+        self.model = model
+        self.shell_v2 = shell_v2
+        self.files = {}
+        self.props = {
+            'ro.product.model': model,
+            'ro.product.manufacturer': 'Fake',
+            'ro.build.version.release': '13',
+            'ro.build.version.sdk': '33',
+            'ro.product.cpu.abi': 'arm64-v8a',
+            'ro.serialno': serial
+        }
+
+    def shell_preamble(self):
+        """模拟 getprop / wm / dumpsys 等设备命令的 shell 函数定义"""
+        cases = ''.join(f'{key}) echo "{value}";; ' for key, value in self.props.items())
+        return (
+            f'getprop() {{ case "$1" in {cases}esac; }}\n'
+            'wm() { case "$1" in size) echo "Physical size: 1080x2400";; density) echo "Physical density: 440";; esac; }\n'
+            'dumpsys() { case "$1" in battery) printf "Current Battery Service state:\\n  level: 87\\n";; esac; }\n'
+        )
+
+    def run_shell(self, command):
+        """执行 shell 命令，返回 (exit_code, stdout, stderr)"""
+        if 'pm install ' in command:
+            return 0, b'Success\n', b''
+        result = subprocess.run(['sh', '-c', self.shell_preamble() + command], capture_output=True)
+        return result.returncode, result.stdout, result.stderr
+
+
+class FakeAdbServer(socketserver.ThreadingTCPServer):
+    """多线程模拟 adb server"""
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address=('127.0.0.1', 0), devices=None):
+        super().__init__(address, FakeAdbHandler)
+        self.devices = {d.serial: d for d in (devices or [])}
+        self.lock = threading.Lock()
+        self.request_count = 0
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def start_background(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return thread
+
+    def devices_text(self, long=False):
+        lines = []
+        for device in self.devices.values():
+            if long:
+                lines.append(f'{device.serial}\t{device.state} product:fake model:{device.model} device:fake transport_id:1')
+            else:
+                lines.append(f'{device.serial}\t{device.state}')
+        return ''.join(line + '\n' for line in lines)
+
+
+class FakeAdbHandler(socketserver.BaseRequestHandler):
+
+    def recv_exact(self, size):
+        data = b''
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError('client closed')
+            data += chunk
+        return data
+
+    def read_request(self):
+        length = int(self.recv_exact(4), 16)
+        return self.recv_exact(length).decode('utf-8')
+
+    def okay(self, payload=None):
+        if payload is None:
+            self.request.sendall(b'OKAY')
+        else:
+            data = payload.encode('utf-8')
+            self.request.sendall(b'OKAY' + b'%04x' % len(data) + data)
+
+    def fail(self, message):
+        data = message.encode('utf-8')
+        self.request.sendall(b'FAIL' + b'%04x' % len(data) + data)
+
+    def handle(self):
+        server = self.server
+        try:
+            request = self.read_request()
+        except ConnectionError:
+            return
+        with server.lock:
+            server.request_count += 1
+
+        if request == 'host:version':
+            return self.okay('0029')
+        if request in ('host:devices', 'host:devices-l'):
+            return self.okay(server.devices_text(request.endswith('-l')))
+        if request in ('host:track-devices', 'host:track-devices-l'):
+            return self.track_devices(request.endswith('-l'))
+        if request.startswith('host-serial:'):
+            serial, _, service = request[len('host-serial:'):].rpartition(':')
+            device = server.devices.get(serial)
+            if not device:
+                return self.fail(f"device '{serial}' not found")
+            if service == 'get-state':
+                return self.okay(device.state)
+            if service == 'features':
+                return self.okay('shell_v2,cmd,stat_v2' if device.shell_v2 else 'cmd')
+            return self.fail(f'unsupported service {service}')
+        if request.startswith('host:transport:'):
+            serial = request[len('host:transport:'):]
+            device = server.devices.get(serial)
+            if not device or device.state != 'device':
+                return self.fail(f"device '{serial}' not found")
+            self.okay()
+            return self.handle_device_service(device, self.read_request())
+        return self.fail(f'unknown host service {request}')
+
+    def track_devices(self, long):
+        self.okay()
+        last = None
+        while True:
+            text = self.server.devices_text(long)
+            if text != last:
+                data = text.encode('utf-8')
+                try:
+                    self.request.sendall(b'%04x' % len(data) + data)
+                except OSError:
+                    return
+                last = text
+            time.sleep(0.2)
+
+    def handle_device_service(self, device, service):
+        if service.startswith('shell,v2,raw:'):
+            self.okay()
+            code, out, err = device.run_shell(service[len('shell,v2,raw:'):])
+            if out:
+                self.request.sendall(struct.pack('<BI', 1, len(out)) + out)
+            if err:
+                self.request.sendall(struct.pack('<BI', 2, len(err)) + err)
+            self.request.sendall(struct.pack('<BI', 3, 1) + bytes([code & 0xff]))
+            return
+        if service.startswith('shell:'):
+            # v1 shell 运行在 pty 中，stdout/stderr 按产生顺序混合输出
+            self.okay()
+            code, out, _ = device.run_shell(f"exec 2>&1\n{service[len('shell:'):]}")
+            self.request.sendall(out.replace(b'\n', b'\r\n'))
+            return
+        if service.startswith('exec:'):
+            return self.exec_stream(device, service[len('exec:'):])
+        if service == 'sync:':
+            self.okay()
+            return self.sync(device)
+        self.fail(f'unknown device service {service}')
+
+    def exec_stream(self, device, command):
+        """exec: 服务，双向转发原始字节流"""
+        self.okay()
+        proc = subprocess.Popen(['sh', '-c', command], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        if command == 'sh':
+            # 交互式 sh 先载入模拟的设备命令
+            proc.stdin.write(device.shell_preamble().encode('utf-8'))
+            proc.stdin.flush()
+
+        def pump_output():
+            for chunk in iter(lambda: proc.stdout.read1(65536), b''):
+                try:
+                    self.request.sendall(chunk)
+                except OSError:
+                    break
+            try:
+                self.request.shutdown(2)
+            except OSError:
+                pass
+
+        thread = threading.Thread(target=pump_output, daemon=True)
+        thread.start()
+        try:
+            while True:
+                data = self.request.recv(65536)
+                if not data:
+                    break
+                proc.stdin.write(data)
+                proc.stdin.flush()
+        except (OSError, ValueError):
+            pass
+        finally:
+            try:
+                proc.stdin.close()
+            except OSError:
+                pass
+            proc.kill()
+            thread.join(timeout=1)
+
+    def sync(self, device):
+        while True:
+            try:
+                header = self.recv_exact(8)
+            except ConnectionError:
+                return
+            cmd, length = header[:4], struct.unpack('<I', header[4:])[0]
+            if cmd == b'QUIT':
+                return
+            if cmd == b'STAT':
+                path = self.recv_exact(length).decode('utf-8')
+                data = device.files.get(path)
+                if data is None:
+                    self.request.sendall(b'STAT' + struct.pack('<III', 0, 0, 0))
+                else:
+                    self.request.sendall(b'STAT' + struct.pack('<III', 0o100644, len(data), int(time.time())))
+                continue
+            if cmd == b'SEND':
+                spec = self.recv_exact(length).decode('utf-8')
+                path = spec.rsplit(',', 1)[0]
+                chunks = []
+                while True:
+                    sub = self.recv_exact(8)
+                    sub_cmd, sub_len = sub[:4], struct.unpack('<I', sub[4:])[0]
+                    if sub_cmd == b'DATA':
+                        chunks.append(self.recv_exact(sub_len))
+                    elif sub_cmd == b'DONE':
+                        break
+                device.files[path] = b''.join(chunks)
+                self.request.sendall(b'OKAY' + struct.pack('<I', 0))
+                continue
+            message = b'unsupported sync command'
+            self.request.sendall(b'FAIL' + struct.pack('<I', len(message)) + message)
+            return
+
+
+def main():
+    parser = argparse.ArgumentParser(description='模拟 adb server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5038)
+    parser.add_argument('--devices', default='emulator-5554', help='逗号分隔的设备序列号')
+    args = parser.parse_args()
+
+    devices = [FakeDevice(serial.strip()) for serial in args.devices.split(',') if serial.strip()]
+    server = FakeAdbServer((args.host, args.port), devices)
+    print(f'模拟 adb server 已启动: {args.host}:{server.port}，设备: {", ".join(server.devices)}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+模拟 OpenAI 兼容的 AI 接口
+实现 POST /v1/chat/completions，返回按请求内容生成的测试用例 JSON，用于在没有 AI 服务的环境下调试和压测
+app.utils.ai_client 与 AI 生成用例任务；可模拟响应延迟、429 限流和 5xx 错误；请求带 stream: true 时按 SSE 分段返回，可模拟输出在中途被截断
+
+用法：
+    python scripts/fake_ai_server.py --port 8090 --latency 0.5 --cases 20 --error-rate 0.1
+    python scripts/fake_ai_server.py --port 8090 --cases 30 --stream-delay 0.05 --truncate 0.6
+    然后在 backend/.env 中设置 AI_BASE_URL=http://127.0.0.1:8090/v1、AI_API_KEY=sk-fake
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def build_test_cases(count, topic='功能'):
+    """生成 count 条格式与提示词要求一致的测试用例"""
+    return [{
+        'case_name': f'{topic}测试用例{index}',
+        'case_description': f'验证{topic}的第{index}个场景',
+        'priority': random.choice(['P0', 'P1', 'P2']),
+        'preconditions': '用户已登录',
+        'steps': f'1. 打开{topic}页面\n2. 执行第{index}个操作',
+        'expected_result': f'第{index}个操作执行成功',
+        'test_data': ''
+    } for index in range(1, count + 1)]
+
+
+class FakeAIServer(ThreadingHTTPServer):
+    """多线程模拟 AI 接口"""
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address=('127.0.0.1', 0), latency=0.0, cases=10, error_rate=0.0, rate_limit_rate=0.0,
+                 stream_delay=0.0, truncate=1.0):
+        super().__init__(address, FakeAIHandler)
+        self.latency = latency
+        self.stream_delay = stream_delay
+        self.truncate = truncate
+        self.cases = cases
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'errors': 0, 'rate_limited': 0, 'connections': 0}
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+
+class FakeAIHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # 支持长连接，便于观察连接复用
+
+    def setup(self):
+        super().setup()
+        self.server.count('connections')
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, body, headers=None):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def write_chunk(self, data):
+        """按 HTTP 分块传输编码写入一块数据"""
+        self.wfile.write(f'{len(data):x}\r\n'.encode('ascii') + data + b'\r\n')
+        self.wfile.flush()
+
+    def send_stream(self, request, content):
+        """以 SSE 分段返回内容，每段约 20 个字符；truncate 小于 1 时只返回前面一部分，模拟输出被截断"""
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        chunk_id = f'chatcmpl-{uuid.uuid4().hex[:12]}'
+        content = content[:int(len(content) * self.server.truncate)]
+        for start in range(0, len(content), 20):
+            event = {
+                'id': chunk_id,
+                'object': 'chat.completion.chunk',
+                'model': request.get('model', 'fake-model'),
+                'choices': [{'index': 0, 'delta': {'content': content[start:start + 20]}, 'finish_reason': None}]
+            }
+            self.write_chunk(f'data: {json.dumps(event, ensure_ascii=False)}\n\n'.encode('utf-8'))
+            if self.server.stream_delay:
+                time.sleep(self.server.stream_delay)
+        finish_reason = 'stop' if self.server.truncate >= 1 else 'length'
+        event = {'id': chunk_id, 'object': 'chat.completion.chunk',
+                 'choices': [{'index': 0, 'delta': {}, 'finish_reason': finish_reason}]}
+        self.write_chunk(f'data: {json.dumps(event)}\n\ndata: [DONE]\n\n'.encode('utf-8'))
+        self.write_chunk(b'')
+
+    def do_GET(self):
+        if self.path.rstrip('/') == '/stats':
+            with self.server.lock:
+                self.send_json(200, dict(self.server.stats))
+            return
+        self.send_json(404, {'error': {'message': 'not found'}})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        request = json.loads(self.rfile.read(length) or b'{}')
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self.send_json(404, {'error': {'message': 'not found'}})
+            return
+        if not (self.headers.get('Authorization') or '').startswith('Bearer '):
+            self.send_json(401, {'error': {'message': 'invalid api key'}})
+            return
+        self.server.count('requests')
+
+        roll = random.random()
+        if roll < self.server.rate_limit_rate:
+            self.server.count('rate_limited')
+            self.send_json(429, {'error': {'message': 'rate limited'}}, {'Retry-After': '1'})
+            return
+        if roll < self.server.rate_limit_rate + self.server.error_rate:
+            self.server.count('errors')
+            self.send_json(503, {'error': {'message': 'service unavailable'}})
+            return
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        content = json.dumps({'test_cases': build_test_cases(self.server.cases)}, ensure_ascii=False)
+        if request.get('stream'):
+            self.send_stream(request, content)
+            return
+        self.send_json(200, {
+            'id': f'chatcmpl-{uuid.uuid4().hex[:12]}',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': request.get('model', 'fake-model'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': 'stop'
+            }],
+            'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0}
+        })
+
+
+def main():
+    parser = argparse.ArgumentParser(description='模拟 OpenAI 兼容的 AI 接口')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--latency', type=float, default=0.0, help='每次请求的响应延迟（秒）')
+    parser.add_argument('--cases', type=int, default=10, help='每次返回的测试用例数')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='返回 503 的比例')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='返回 429 的比例')
+    parser.add_argument('--stream-delay', type=float, default=0.0, help='流式返回时每段之间的间隔（秒）')
+    parser.add_argument('--truncate', type=float, default=1.0, help='流式返回内容的比例，小于 1 时模拟输出被截断')
+    args = parser.parse_args()
+
+    server = FakeAIServer((args.host, args.port), args.latency, args.cases, args.error_rate, args.rate_limit_rate,
+                          args.stream_delay, args.truncate)
+    print(f'模拟 AI 接口已启动: http://{args.host}:{server.port}/v1，统计信息: GET /stats')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -5,6 +5,7 @@
 """
 
 import pymysql
+import re
 import sys
 import os
 
@@ -198,6 +199,7 @@ def create_tables():
             cursor.execute("""CREATE TABLE IF NOT EXISTS test_cases (
                 id INT AUTO_INCREMENT PRIMARY KEY COMMENT '用例编号',
                 case_number VARCHAR(50) NULL COMMENT '测试用例编号',
+                case_seq INT NULL COMMENT '用例编号尾号（编号末尾的序号）',
                 case_name VARCHAR(200) NOT NULL COMMENT '用例名称',
                 case_description TEXT COMMENT '用例描述',
                 priority ENUM('P0', 'P1', 'P2', 'P3', 'P4') DEFAULT 'P1' COMMENT '优先级',
@@ -233,11 +235,32 @@ def create_tables():
                 INDEX idx_project_id (project_id),
                 INDEX idx_iteration_id (iteration_id),
                 INDEX idx_suite_id (suite_id),
+                INDEX idx_suite_case_seq (suite_id, case_seq),
                 INDEX idx_version_requirement_id (version_requirement_id),
                 INDEX idx_assignee_id (assignee_id),
                 INDEX idx_reviewer_id (reviewer_id)
             ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='用例表'""")
             
+            # 兼容旧表：若 test_cases 表无 case_seq 则添加，并按用例编号末段末尾的序号（至少 3 位数字）补齐
+            cursor.execute("""
+                SELECT COUNT(*) FROM information_schema.COLUMNS
+                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'test_cases' AND COLUMN_NAME = 'case_seq'
+            """)
+            if cursor.fetchone()[0] == 0:
+                cursor.execute("ALTER TABLE test_cases ADD COLUMN case_seq INT NULL COMMENT '用例编号尾号（编号末尾的序号）' AFTER case_number")
+                cursor.execute("ALTER TABLE test_cases ADD INDEX idx_suite_case_seq (suite_id, case_seq)")
+                # MySQL 5.7 没有 REGEXP_SUBSTR，末尾序号在脚本中解析（与应用未知前缀时的规则一致：
+                # 最后一个非数字字符之后补零的 3 位数字或不补零的 4 位及以上数字）
+                cursor.execute("SELECT id, case_number FROM test_cases WHERE case_number REGEXP '[0-9]{3}$'")
+                case_seqs = []
+                for case_id, case_number in cursor.fetchall():
+                    match = re.search(r'(?:^|\D)(\d{3}|[1-9]\d{3,})$', case_number)
+                    if match:
+                        case_seqs.append((int(match.group(1)), case_id))
+                cursor.executemany(
+                    "UPDATE test_cases SET case_seq = %s, updated_at = updated_at WHERE id = %s", case_seqs
+                )
+            
 
             
             # 创建test_tasks表
@@ -480,6 +503,84 @@ def create_tables():
                 INDEX idx_created_at (created_at),
                 INDEX idx_creator_id (creator_id)
             ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='报告表'""")
+
+            # 创建device_hardware_specs表（设备信息采集写入的硬件规格）
+            cursor.execute("""CREATE TABLE IF NOT EXISTS device_hardware_specs (
+                id INT AUTO_INCREMENT PRIMARY KEY COMMENT '记录ID',
+                device_id INT NOT NULL UNIQUE COMMENT '设备ID',
+                manufacturer VARCHAR(100) NULL COMMENT '设备制造商',
+                sdk_version VARCHAR(20) NULL COMMENT 'SDK版本',
+                cpu_abi VARCHAR(50) NULL COMMENT 'CPU架构',
+                screen_resolution VARCHAR(50) NULL COMMENT '屏幕分辨率',
+                screen_density VARCHAR(20) NULL COMMENT '屏幕密度',
+                serial_no VARCHAR(100) NULL COMMENT '设备序列号（ro.serialno）',
+                total_memory_kb BIGINT NULL COMMENT '总内存（KB）',
+                available_memory_kb BIGINT NULL COMMENT '可用内存（KB）',
+                storage_total VARCHAR(20) NULL COMMENT '/data 分区总容量',
+                storage_available VARCHAR(20) NULL COMMENT '/data 分区可用容量',
+                battery_level INT NULL COMMENT '电池电量',
+                collected_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '采集时间',
+                FOREIGN KEY (device_id) REFERENCES devices(id) ON DELETE CASCADE
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='设备硬件规格表'""")
+
+            # 创建device_leases表（设备租约，防止多个任务同时占用同一设备）
+            cursor.execute("""CREATE TABLE IF NOT EXISTS device_leases (
+                id INT AUTO_INCREMENT PRIMARY KEY COMMENT '租约ID',
+                device_serial VARCHAR(100) NOT NULL UNIQUE COMMENT '设备序列号（对应devices.device_id）',
+                holder VARCHAR(100) NOT NULL UNIQUE COMMENT '租约持有者标识',
+                task_id INT NULL COMMENT '关联的测试任务ID',
+                priority ENUM('high', 'medium', 'low') DEFAULT 'medium' COMMENT '任务优先级',
+                previous_status VARCHAR(20) NULL COMMENT '租用前的设备状态，释放时恢复',
+                acquired_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '租用时间',
+                heartbeat_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '最近心跳时间',
+                expires_at DATETIME NOT NULL COMMENT '过期时间',
+                FOREIGN KEY (task_id) REFERENCES test_tasks(id) ON DELETE SET NULL,
+                INDEX idx_task_id (task_id),
+                INDEX idx_expires_at (expires_at)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='设备租约表'""")
+            
+            # 创建background_tasks表（后台异步任务状态，多个应用进程共享）
+            cursor.execute("""CREATE TABLE IF NOT EXISTS background_tasks (
+                task_id VARCHAR(36) NOT NULL PRIMARY KEY COMMENT '任务ID',
+                task_name VARCHAR(200) NULL COMMENT '任务名称',
+                task_type VARCHAR(50) DEFAULT 'default' COMMENT '任务类型',
+                status VARCHAR(20) DEFAULT 'pending' COMMENT '任务状态',
+                owner VARCHAR(100) NULL COMMENT '执行任务的进程标识',
+                state TEXT NOT NULL COMMENT '完整的任务状态，JSON格式存储',
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '最近更新时间（执行中的任务定期刷新）',
+                INDEX idx_task_type (task_type),
+                INDEX idx_status (status),
+                INDEX idx_updated_at (updated_at)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='后台任务状态表'""")
+            
+            # 创建apscheduler_jobs表（定时任务调度器的持久化任务存储，结构与 APScheduler SQLAlchemyJobStore 一致）
+            cursor.execute("""CREATE TABLE IF NOT EXISTS apscheduler_jobs (
+                id VARCHAR(191) NOT NULL PRIMARY KEY COMMENT '调度任务ID',
+                next_run_time DOUBLE NULL COMMENT '下次执行时间（UNIX时间戳）',
+                job_state BLOB NOT NULL COMMENT '序列化的任务状态',
+                INDEX ix_apscheduler_jobs_next_run_time (next_run_time)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='定时任务调度表'""")
+            
+            # 创建ai_response_cache表（AI 生成结果缓存，按提示词、模型和温度的哈希缓存）
+            cursor.execute("""CREATE TABLE IF NOT EXISTS ai_response_cache (
+                cache_key VARCHAR(64) NOT NULL PRIMARY KEY COMMENT '缓存键（SHA-256）',
+                model VARCHAR(100) NULL COMMENT 'AI模型',
+                response MEDIUMTEXT NOT NULL COMMENT '生成的测试用例，JSON格式存储',
+                hit_count INT DEFAULT 0 COMMENT '命中次数',
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '创建时间',
+                last_used_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP COMMENT '最近使用时间',
+                INDEX idx_created_at (created_at),
+                INDEX idx_last_used_at (last_used_at)
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='AI生成结果缓存表'""")
+            
+            # 创建case_number_sequences表（用例编号序号，每个用例集一行，按区间分配用例编号尾号）
+            cursor.execute("""CREATE TABLE IF NOT EXISTS case_number_sequences (
+                suite_id INT NOT NULL PRIMARY KEY COMMENT '用例集ID',
+                last_value INT NOT NULL DEFAULT 0 COMMENT '已分配的最大尾号',
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP COMMENT '更新时间',
+                FOREIGN KEY (suite_id) REFERENCES test_suites(id) ON DELETE CASCADE
+            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='用例编号序号表'""")
             
             connection.commit()
             print("所有数据表创建成功！")
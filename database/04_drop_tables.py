@@ -39,6 +39,12 @@ def drop_tables():
         with connection.cursor() as cursor:
             # 按照外键依赖关系倒序删除表
             tables = [
+                'case_number_sequences',
+                'ai_response_cache',
+                'background_tasks',
+                'apscheduler_jobs',
+                'device_leases',
+                'device_hardware_specs',
                 'reports',
                 'user_settings',
                 'system_settings',
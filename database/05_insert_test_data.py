@@ -425,7 +425,6 @@ def insert_test_data():
             CASE_COUNT_BY_CATEGORY = {'登录与权限': 35, '核心流程': 50, '兼容性测试': 40, '性能测试': 35}
             priorities = ['P0', 'P1', 'P2']
             cases_data = []
-            case_seq = 0
             for suite_id, project_id, req_id, category in suite_rows:
                 iters = project_iterations.get(project_id, [])
                 iteration_id = iters[0] if iters else None
@@ -434,9 +433,10 @@ def insert_test_data():
                 templates = CASE_TEMPLATES_BY_CATEGORY.get(category, CASE_TEMPLATES_BY_CATEGORY['核心流程'])
                 n_cases = CASE_COUNT_BY_CATEGORY.get(category, 4)
                 for m in range(n_cases):
-                    case_seq += 1
+                    # 尾号按用例集从 1 开始，与应用分配用例编号的规则一致（至少 3 位，编号中不截断）
+                    case_seq = m + 1
                     tpl = templates[m % len(templates)]
-                    case_number = f"TC-P{project_id}-{case_seq:04d}"
+                    case_number = f"TC-P{project_id}-S{suite_id}-{case_seq:03d}"
                     base_name = f"{category}-{tpl['name']}"
                     case_name = base_name if m < len(templates) else f"{base_name}({m // len(templates) + 1})"
                     description = tpl['desc']
@@ -447,6 +447,7 @@ def insert_test_data():
                     priority = priorities[m % len(priorities)]
                     cases_data.append((
                         case_number,
+                        case_seq,
                         case_name,
                         description,
                         priority,
@@ -465,12 +466,12 @@ def insert_test_data():
                     ))
             cursor.executemany("""
                 INSERT INTO test_cases (
-                    case_number, case_name, case_description, priority, creator_id,
+                    case_number, case_seq, case_name, case_description, priority, creator_id,
                     project_id, version_requirement_id, iteration_id, suite_id,
                     preconditions, steps, expected_result, actual_result, test_data,
                     assignee_id, reviewer_id
                 )
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
             """, cases_data)
             print("测试用例数据插入成功！")
 
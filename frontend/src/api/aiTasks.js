@@ -35,3 +35,15 @@ export const getAllTasks = () => {
     method: 'get'
   })
 }
+
+/**
+ * 订阅任务进度（SSE）
+ * 服务端推送 progress 事件（任务状态），任务结束时推送 end 事件；断线后浏览器自动重连并从最后收到的进度继续
+ * @param {string} taskId - 任务ID
+ * @returns {EventSource}
+ */
+export const subscribeTaskEvents = (taskId) => {
+  return new EventSource(`/api/ai-tasks/task-events/${taskId}`, {
+    withCredentials: true
+  })
+}